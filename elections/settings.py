@@ -78,13 +78,53 @@ WSGI_APPLICATION = 'elections.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Applied to every new SQLite connection. WAL lets readers keep reading while a
+# write is in progress; NORMAL sync is safe with WAL and avoids an fsync per commit.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,  # in KiB when negative: 20 MB page cache per connection
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+SQLITE_INIT_COMMAND = ''.join(f'PRAGMA {name}={value};' for name, value in SQLITE_PRAGMAS.items())
+
+# ELECTIONS_DB points the app at another database file (e.g. a generated load-test dataset)
+DATABASE_PATH = os.environ.get('ELECTIONS_DB', BASE_DIR / 'db.sqlite3')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'NAME': DATABASE_PATH,
+        # Keep connections (and their page cache) across requests
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': SQLITE_INIT_COMMAND,
+            # Writers take the lock when the transaction starts and wait up to
+            # `timeout` seconds for it, instead of failing when upgrading a read lock
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    },
+    # Same file for the read-heavy views (see politicians.routers)
+    'readonly': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': DATABASE_PATH,
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': SQLITE_INIT_COMMAND + 'PRAGMA query_only=ON;',
+            'timeout': 20,
+        },
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
 }
 
+DATABASE_ROUTERS = ['politicians.routers.ReadOnlyRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
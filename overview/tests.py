@@ -1,3 +1,54 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+import base64
+import json
+import numpy as np
+from politicians.models import Politician, PoliticianRecord, Province, Region
+from .trends import create_dynasty_charts, load_trend_frames
 
 # Create your tests here.
+
+def chart_values(chart):
+    """y values of the first trace of a Plotly JSON chart (arrays may be base64-encoded)"""
+    y = json.loads(chart)["data"][0]["y"]
+    if isinstance(y, dict):
+        return np.frombuffer(base64.b64decode(y["bdata"]), dtype=y["dtype"]).tolist()
+    return list(y)
+
+def create_records():
+    region = Region.objects.create(name="REGION I")
+    ilocos = Province.objects.create(name="ILOCOS NORTE", region=region)
+    pangasinan = Province.objects.create(name="PANGASINAN", region=region)
+    for first, province, year, position, community in [
+        ("JUAN", ilocos, 2019, "MAYOR", 1), ("PEDRO", ilocos, 2019, "COUNCILOR", 1), ("MARIA", ilocos, 2019, "COUNCILOR", 2),
+        ("ANA", pangasinan, 2019, "GOVERNOR", 1),
+        ("JOSE", ilocos, 2022, "MAYOR", 1), ("LUIS", pangasinan, 2022, "MAYOR", 1), ("ROSA", pangasinan, 2022, "COUNCILOR", 1),
+    ]:
+        politician = Politician.objects.create(first_name=first, last_name="MARCOS")
+        PoliticianRecord.objects.create(politician=politician, province=province, region=region, year=year, position=position, community=community)
+
+class TrendTests(TestCase):
+    def test_trends_from_two_grouped_queries(self):
+        create_records()
+        with self.assertNumQueries(2):
+            positions, communities = load_trend_frames()
+        self.assertEqual(
+            list(positions.itertuples(index=False, name=None)),
+            [(2019, "COUNCILOR", 2), (2019, "GOVERNOR", 1), (2019, "MAYOR", 1), (2022, "COUNCILOR", 1), (2022, "MAYOR", 2)],
+        )
+        dynasty_chart, share_chart = create_dynasty_charts(communities)
+        # 2019: one community of two in Ilocos Norte; 2022: one of two in Pangasinan
+        self.assertEqual(chart_values(dynasty_chart), [1, 1])
+        self.assertEqual([round(share, 2) for share in chart_values(share_chart)], [0.5, 0.67])
+
+class DashboardTests(TransactionTestCase):
+    # The dashboard reads through the read-only connection, which only sees committed rows
+    databases = {"default", "readonly"}
+
+    def test_dashboard_shows_the_trends(self):
+        cache.clear()
+        create_records()
+        response = self.client.get(reverse("overview:dashboard"))
+        self.assertEqual(response.context["total_records"], 7)
+        self.assertEqual(set(response.context["trends"]), {"position_chart", "dynasty_chart", "share_chart"})
@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+import json
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.utils import PlotlyJSONEncoder
+from politicians.changes import data_version
+from politicians.models import PoliticianRecord
+
+TREND_CACHE_TIMEOUT = getattr(settings, "TREND_CACHE_TIMEOUT", 60 * 60 * 24)
+
+def load_trend_frames():
+    """Records per (year, position) and community sizes per (year, province), in two grouped queries"""
+    positions = pd.DataFrame(
+        list(PoliticianRecord.objects.values("year", "position").annotate(records=Count("id")).order_by("year", "position")),
+        columns=["year", "position", "records"],
+    )
+    communities = pd.DataFrame(
+        list(PoliticianRecord.objects.values("year", "province", "community").annotate(size=Count("id")).order_by()),
+        columns=["year", "province", "community", "size"],
+    )
+    return positions, communities
+
+def create_position_chart(positions):
+    fig = go.Figure()
+    order = [position for position, _ in PoliticianRecord.position_choices]
+    for position, rows in sorted(positions.groupby("position"), key=lambda item: order.index(item[0]) if item[0] in order else len(order)):
+        fig.add_trace(go.Bar(x=rows["year"], y=rows["records"], name=position.title()))
+    fig.update_layout(barmode="stack", title="Political Records by Position", xaxis_title="Year", yaxis_title="Records", height=400)
+    return json.dumps(fig, cls=PlotlyJSONEncoder)
+
+def create_dynasty_charts(communities):
+    dynasties = communities[communities["size"] > 1]
+    per_year = pd.DataFrame({
+        "records": communities.groupby("year")["size"].sum(),
+        "dynasties": dynasties.groupby("year")["size"].size(),
+        "officials_in_dynasties": dynasties.groupby("year")["size"].sum(),
+    }).fillna(0)
+    per_year["dynasty_share"] = per_year["officials_in_dynasties"] / per_year["records"]
+
+    dynasty_fig = go.Figure(go.Scatter(
+        x=per_year.index, y=per_year["dynasties"], mode="lines+markers", marker_color="#fa904d",
+    ))
+    dynasty_fig.update_layout(title="Communities with More Than One Member", xaxis_title="Year", yaxis_title="Communities", height=350)
+
+    share_fig = go.Figure(go.Scatter(
+        x=per_year.index, y=per_year["dynasty_share"], mode="lines+markers", marker_color="#d54a46",
+        hovertemplate="%{x}: %{y:.1%}<extra></extra>",
+    ))
+    share_fig.update_layout(
+        title="Share of Officials in Dynasties", xaxis_title="Year", yaxis_title="Share", yaxis_tickformat=".0%", height=350
+    )
+    return json.dumps(dynasty_fig, cls=PlotlyJSONEncoder), json.dumps(share_fig, cls=PlotlyJSONEncoder)
+
+def compute_trend_charts():
+    positions, communities = load_trend_frames()
+    if positions.empty:
+        return None
+    dynasty_chart, share_chart = create_dynasty_charts(communities)
+    return {
+        "position_chart": create_position_chart(positions),
+        "dynasty_chart": dynasty_chart,
+        "share_chart": share_chart,
+    }
+
+def get_trend_charts():
+    """Plotly JSON of the dashboard trends, rebuilt only when the data version changes"""
+    key = f"overview:trends:{data_version()}"
+    charts = cache.get(key)
+    if charts is None:
+        charts = compute_trend_charts() or {}
+        cache.set(key, charts, TREND_CACHE_TIMEOUT)
+    return charts
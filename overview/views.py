@@ -1,6 +1,11 @@
 from django.shortcuts import render
+from politicians.conditional import conditional_on_data
 from politicians.models import Politician, PoliticianRecord, Province, Region
+from politicians.routers import read_only_view
+from .trends import get_trend_charts
 
+@read_only_view
+@conditional_on_data
 def dashboard(request):
     """Main dashboard view with overview statistics and navigation"""
     
@@ -20,6 +25,8 @@ def dashboard(request):
         'total_provinces': total_provinces,
         'total_regions': total_regions,
         'year_range': year_range,
+        # Per-year trends, cached until the data changes
+        'trends': get_trend_charts(),
     }
     
     return render(request, 'overview/dashboard.html', context)
@@ -1,5 +1,149 @@
-from django.contrib import admin
-from .models import Politician, PoliticianRecord, Province, Region
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, Q
+from django.utils.functional import cached_property
+from django.utils.text import smart_split, unescape_string_literal
+from .duplicates import merge_politicians
+from .models import DataChange, DataVersion, Politician, PoliticianNetworkMetric, PoliticianRecord, Province, Region
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that uses the planner's row estimate on unfiltered PostgreSQL changelists
+    instead of COUNT(*) over the whole table. Everything else (and SQLite, where counting
+    the records is cheap) is counted exactly.
+    """
+    @cached_property
+    def count(self):
+        connection = connections[self.object_list.db]
+        if self.object_list.query.where or connection.vendor != "postgresql":
+            return super().count
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [self.object_list.model._meta.db_table])
+            row = cursor.fetchone()
+        return row[0] if row and row[0] and row[0] > 0 else super().count
+
+# Greater than every character, so name >= term AND name < term + NAME_END selects the names starting with term
+NAME_END = "\U0010ffff"
+
+class NamePrefixSearchMixin:
+    """
+    Searches the upper-case name columns by prefix as a range, which SQLite answers from
+    the name indexes. The admin's "^name" lookups are a case-insensitive LIKE, which
+    cannot use those (BINARY collated) indexes and scans the table instead.
+    Terms are split like the admin's own search (quoted terms are kept whole), and a
+    search of several words also matches them as one prefix, for names like "DELA CRUZ".
+    """
+    name_prefix_fields = []
+    exact_search_fields = []
+
+    def term_condition(self, term):
+        prefix = " ".join(term.upper().split())
+        condition = Q()
+        for field in self.name_prefix_fields:
+            condition |= Q(**{f"{field}__gte": prefix, f"{field}__lt": prefix + NAME_END})
+        for field in self.exact_search_fields:
+            condition |= Q(**{field: term})
+        return condition
+
+    def get_search_results(self, request, queryset, search_term):
+        terms = [
+            unescape_string_literal(term) if term.startswith(('"', "'")) and term[0] == term[-1] else term
+            for term in smart_split(search_term)
+        ]
+        if not terms:
+            return queryset, False
+        condition = Q()
+        for term in terms:
+            condition &= self.term_condition(term)
+        if len(terms) > 1:
+            condition |= self.term_condition(" ".join(terms))
+        return queryset.filter(condition), False
 
 # Register your models here.
-admin.site.register([Politician, PoliticianRecord, Province, Region])
+@admin.register(Region)
+class RegionAdmin(admin.ModelAdmin):
+    list_display = ["name"]
+    search_fields = ["name"]
+
+@admin.register(Province)
+class ProvinceAdmin(admin.ModelAdmin):
+    list_display = ["name", "region"]
+    list_select_related = ["region"]
+    list_filter = ["region"]
+    search_fields = ["name"]
+    autocomplete_fields = ["region"]
+
+@admin.register(Politician)
+class PoliticianAdmin(NamePrefixSearchMixin, admin.ModelAdmin):
+    list_display = ["last_name", "first_name", "middle_name", "slug"]
+    search_fields = ["last_name", "first_name", "=slug"]
+    name_prefix_fields = ["last_name", "first_name"]
+    exact_search_fields = ["slug"]
+    readonly_fields = ["slug"]
+    ordering = ["last_name", "first_name"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ["merge_selected"]
+
+    @admin.action(description = "Merge selected politicians into the one with the most records")
+    def merge_selected(self, request, queryset):
+        politicians = list(queryset.annotate(record_count = Count("politicianrecord")).order_by("-record_count", "id"))
+        if len(politicians) < 2:
+            self.message_user(request, "Select at least two politicians to merge.", messages.WARNING)
+            return
+        keep, duplicates = politicians[0], politicians[1:]
+        moved = merge_politicians(keep, duplicates)
+        self.message_user(request, f"Merged {len(duplicates)} politician(s) into {keep}, moving {moved} record(s).")
+
+@admin.register(PoliticianRecord)
+class PoliticianRecordAdmin(NamePrefixSearchMixin, admin.ModelAdmin):
+    list_display = ["politician", "position", "province", "region", "year", "community", "party"]
+    list_select_related = ["politician", "province", "region"]
+    list_filter = ["year", "position", "province"]
+    search_fields = ["politician__last_name", "politician__first_name", "=politician__slug"]
+    name_prefix_fields = ["politician__last_name", "politician__first_name"]
+    exact_search_fields = ["politician__slug"]
+    autocomplete_fields = ["politician", "province", "region"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # __str__ of a record touches the politician, province and region
+        return super().get_queryset(request).select_related("politician", "province", "region")
+
+@admin.register(PoliticianNetworkMetric)
+class PoliticianNetworkMetricAdmin(NamePrefixSearchMixin, admin.ModelAdmin):
+    list_display = ["politician", "province", "year", "degree", "weighted_degree", "component_size"]
+    list_select_related = ["politician", "province"]
+    list_filter = ["year", "province"]
+    search_fields = ["politician__last_name", "politician__first_name"]
+    name_prefix_fields = ["politician__last_name", "politician__first_name"]
+    raw_id_fields = ["politician"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+@admin.register(DataChange)
+class DataChangeAdmin(admin.ModelAdmin):
+    list_display = ["version", "action", "model", "object_id", "province", "year", "changed_at"]
+    list_select_related = ["province"]
+    list_filter = ["action", "model", "year"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    # The change log is append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj = None):
+        return False
+
+    def has_delete_permission(self, request, obj = None):
+        return False
+
+@admin.register(DataVersion)
+class DataVersionAdmin(admin.ModelAdmin):
+    list_display = ["key", "province", "year", "version"]
+    list_select_related = ["province"]
+    search_fields = ["=key"]
+    readonly_fields = ["key", "province", "year", "version"]
@@ -0,0 +1,160 @@
+from django.db import transaction
+import csv
+import io
+import re
+from .changes import record_change
+from .models import NameIndexEntry, PoliticianRecord
+from .kin import INDEX_COLUMNS, index_entries
+from .reference import get_reference, invalidate_reference
+
+# Columns a batch can change; any other column (e.g. the names of a records export) is ignored
+EDITABLE_FIELDS = ["position", "party", "year", "region", "province", "community"]
+POSITIONS = {position for position, _ in PoliticianRecord.position_choices}
+YEARS = {year for year, _ in PoliticianRecord.year_choices}
+NUMBER_FIELDS = ["year", "community", "region", "province"]
+BATCH_SIZE = 500
+
+class BatchEditError(Exception):
+    """Raised by apply_batch() with the errors of every invalid row; nothing is saved"""
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"{len(errors)} invalid row(s)")
+
+def read_csv(file):
+    """Rows of an uploaded CSV (e.g. an edited records export) as dicts"""
+    text = io.TextIOWrapper(file, encoding = "utf-8-sig", newline = "")
+    return list(csv.DictReader(text))
+
+def reference_choices(reference):
+    """Regions and provinces by name and by id, as written in a spreadsheet"""
+    return {
+        field: {key: obj for obj in lookup.values() for key in (obj.name, str(obj.id))}
+        for field, lookup in (("region", reference.regions), ("province", reference.provinces))
+    }
+
+def whole_number(value):
+    """A JSON integer or a cell of digits as an int; None for anything else (1.5, true, "1e3", ...)"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and re.fullmatch(r"-?\d+", value.strip()):
+        return int(value)
+    return None
+
+def clean_value(field, value, choices):
+    """(cleaned value, error message) of one cell; names or ids are accepted for regions and provinces"""
+    # JSON rows can hold any type: only years, communities and region or province ids may be numbers
+    if value is not None and not isinstance(value, str):
+        if field not in NUMBER_FIELDS:
+            return None, f"{field.capitalize()} must be text."
+        if whole_number(value) is None:
+            return None, f"{field.capitalize()} must be {'a whole number' if field in ('year', 'community') else 'a name or an id'}."
+    value = value.strip() if isinstance(value, str) else value
+    if field == "party":
+        return (value or None), None
+    if field == "position":
+        value = (value or "").upper()
+        return (value, None) if value in POSITIONS else (None, f"Unknown position: {value or '(empty)'}")
+    if field in ("year", "community"):
+        number = whole_number(value)
+        if number is None:
+            return None, f"{field.capitalize()} must be a whole number."
+        if field == "year" and number not in YEARS:
+            return None, f"{number} is not an election year."
+        return number, None
+    if value in (None, ""):
+        return None, ("A province is required." if field == "province" else None)
+    obj = choices[field].get(str(value).upper())
+    return (obj, None) if obj else (None, f"Unknown {field}: {value}")
+
+def validate_rows(rows):
+    """
+    Check every row against the cached reference data and the current records (one query).
+    Returns (records by id, {record id: {field: new value}}, errors); only fields that change are kept.
+    """
+    reference = get_reference()
+    choices = reference_choices(reference)
+    errors = []
+    ids = {}
+    for number, row in enumerate(rows, start = 1):
+        record_id = whole_number(row.get("id"))
+        if record_id is None:
+            errors.append({"row": number, "id": row.get("id"), "errors": {"id": "A record id is required."}})
+        else:
+            ids[number] = record_id
+    records = PoliticianRecord.objects.in_bulk(set(ids.values()))
+
+    changes = {}
+    seen = set()
+    for number, row in enumerate(rows, start = 1):
+        if number not in ids:
+            continue
+        record_id = ids[number]
+        record = records.get(record_id)
+        if record is None:
+            errors.append({"row": number, "id": record_id, "errors": {"id": "No record has this id."}})
+            continue
+        if record_id in seen:
+            errors.append({"row": number, "id": record_id, "errors": {"id": "The record appears in more than one row."}})
+            continue
+        seen.add(record_id)
+        row_errors = {}
+        values = {}
+        for field in EDITABLE_FIELDS:
+            if field in row:
+                values[field], error = clean_value(field, row[field], choices)
+                if error:
+                    row_errors[field] = error
+        if not row_errors:
+            region = values["region"] if "region" in values else reference.regions.get(record.region_id)
+            province = values.get("province") or reference.provinces[record.province_id]
+            if not reference.is_valid_pair(region, province):
+                row_errors["province"] = f"{province.name} and {region.name} are an invalid pair."
+        if row_errors:
+            errors.append({"row": number, "id": record_id, "errors": row_errors})
+            continue
+        changes[record_id] = {
+            field: value for field, value in values.items()
+            if getattr(record, f"{field}_id" if field in ("region", "province") else field) != getattr(value, "id", value)
+        }
+    return records, changes, sorted(errors, key = lambda error: error["row"])
+
+@transaction.atomic
+def apply_batch(rows, dry_run = False):
+    """
+    Validate every row, then save all changes with bulk_update() in one transaction.
+    bulk_update() sends no signals, so the change log, the name index
+    and the reference years are updated here once for the whole batch: one version bump
+    per affected (province, year) rather than one per row. Raises BatchEditError if any row is invalid.
+    """
+    records, changes, errors = validate_rows(rows)
+    if errors:
+        raise BatchEditError(errors)
+    changed = {record_id: values for record_id, values in changes.items() if values}
+    summary = {"rows": len(rows), "updated": len(changed), "unchanged": len(changes) - len(changed), "partitions": 0}
+    if dry_run or not changed:
+        return summary
+
+    partitions = set()
+    fields = set()
+    moved_politician_ids = set()
+    for record_id, values in changed.items():
+        record = records[record_id]
+        partitions.add((record.province_id, record.year))
+        for field, value in values.items():
+            setattr(record, field, value)
+            fields.add(field)
+        partitions.add((record.province_id, record.year))
+        if {"province", "year"} & values.keys():
+            moved_politician_ids.add(record.politician_id)
+    PoliticianRecord.objects.bulk_update([records[record_id] for record_id in changed], sorted(fields), batch_size = BATCH_SIZE)
+
+    record_change("PoliticianRecord", None, "UPDATE", partitions)
+    if moved_politician_ids:
+        # Name index entries carry the province and year of the records
+        NameIndexEntry.objects.filter(politician_id__in = moved_politician_ids).delete()
+        index_rows = PoliticianRecord.objects.filter(politician_id__in = moved_politician_ids).values_list(*INDEX_COLUMNS)
+        NameIndexEntry.objects.bulk_create(index_entries(index_rows), batch_size = BATCH_SIZE)
+    if "year" in fields:
+        invalidate_reference()
+    summary["partitions"] = len(partitions)
+    return summary
@@ -0,0 +1,91 @@
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from .models import DataChange, DataVersion, PoliticianRecord
+
+GLOBAL_KEY = "global"
+# Bumped when regions, provinces or the set of election years change (see reference.py)
+REFERENCE_KEY = "reference"
+
+def partition_key(province_id, year):
+    return f"{province_id}:{year}"
+
+def year_key(year):
+    return f"year:{year}"
+
+def bump_version(key, province_id = None, year = None):
+    updated = DataVersion.objects.filter(key = key).update(version = F("version") + 1)
+    if not updated:
+        DataVersion.objects.create(key = key, province_id = province_id, year = year, version = 1)
+    return DataVersion.objects.values_list("version", flat = True).get(key = key)
+
+@transaction.atomic
+def record_change(model, object_id, action, partitions = ()):
+    """
+    Append a change to the log and bump the version of every affected
+    (province id, year) partition and of their years, plus the global version once.
+    Returns the new global version.
+    """
+    partitions = sorted({(province_id, year) for province_id, year in partitions if province_id is not None})
+    for province_id, year in partitions:
+        bump_version(partition_key(province_id, year), province_id, year)
+    for year in sorted({year for _, year in partitions}):
+        bump_version(year_key(year), year = year)
+    version = bump_version(GLOBAL_KEY)
+    DataChange.objects.bulk_create([
+        DataChange(version = version, model = model, object_id = object_id, action = action, province_id = province_id, year = year)
+        for province_id, year in partitions
+    ] or [DataChange(version = version, model = model, object_id = object_id, action = action)])
+    return version
+
+def record_partitions(politician_id):
+    """Every (province id, year) partition in which a politician has a record"""
+    return set(
+        PoliticianRecord.objects
+        .filter(politician_id = politician_id)
+        .values_list("province_id", "year")
+        .distinct()
+    )
+
+def key_version(key):
+    return DataVersion.objects.filter(key = key).values_list("version", flat = True).first() or 0
+
+def data_version(province_id = None, year = None):
+    """Version of one partition, or the global version when no partition is given"""
+    return key_version(GLOBAL_KEY if province_id is None else partition_key(province_id, year))
+
+def year_version(year):
+    """
+    Changes whenever any partition of the year changes, or the regions and provinces do
+    (the changes logged without a partition). Both counters only grow, and unlike
+    partition versions they are not deleted with a province, so a version never repeats.
+    """
+    versions = dict(DataVersion.objects.filter(key__in = [year_key(year), REFERENCE_KEY]).values_list("key", "version"))
+    return f"{versions.get(year_key(year), 0)}-{versions.get(REFERENCE_KEY, 0)}"
+
+def politician_version(politician_id):
+    """
+    Versions of the partitions a politician has records in, plus the reference version,
+    in one query. Every write to the politician, their records or the names of their
+    provinces and regions bumps one of them, so the result changes with their timeline.
+    """
+    in_partition = PoliticianRecord.objects.filter(
+        politician_id = politician_id, province_id = OuterRef("province_id"), year = OuterRef("year"),
+    )
+    versions = DataVersion.objects.filter(Q(Exists(in_partition)) | Q(key = REFERENCE_KEY)).order_by("key")
+    return "-".join(f"{key}.{version}" for key, version in versions.values_list("key", "version"))
+
+def partition_versions():
+    """Version of every (province id, year) partition that has records"""
+    versions = {
+        (province_id, year): version
+        for province_id, year, version in DataVersion.objects.exclude(province = None).values_list("province_id", "year", "version")
+    }
+    partitions = PoliticianRecord.objects.values_list("province_id", "year").distinct()
+    return {partition: versions.get(partition, 0) for partition in partitions}
+
+def changes_since(version):
+    """Partitions touched after a global version; None in the set means a global change"""
+    return {
+        (province_id, year) if province_id is not None else None
+        for province_id, year in DataChange.objects.filter(version__gt = version).values_list("province_id", "year")
+    }
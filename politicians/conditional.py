@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.views.decorators.http import condition
+from functools import lru_cache
+import hashlib
+import os
+from .changes import data_version
+from .metrics import metrics_version
+from .models import DataChange, Politician, SignificanceRun
+from .profiles import profile_mtime
+
+# Cache validators for the read-only pages. They only read the change log and
+# version counters, so a revalidation that ends in 304 never runs the view body.
+
+SOURCE_APPS = ["overview", "politicians", "province"]
+SOURCE_EXTENSIONS = (".py", ".html", ".js", ".css")
+
+@lru_cache(maxsize = None)
+def source_digest():
+    """Digest of the apps' code and templates, read once per process"""
+    digest = hashlib.sha1()
+    for app in SOURCE_APPS:
+        for root, directories, files in os.walk(os.path.join(settings.BASE_DIR, app)):
+            directories.sort()
+            for name in sorted(files):
+                if name.endswith(SOURCE_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    digest.update(os.path.relpath(path, settings.BASE_DIR).encode())
+                    with open(path, "rb") as f:
+                        digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+def code_version():
+    """Changes with every deploy that changes the pages: CODE_VERSION (e.g. a commit hash) or a digest of the source"""
+    return getattr(settings, "CODE_VERSION", None) or source_digest()
+
+def last_change(request, *args, **kwargs):
+    return DataChange.objects.order_by("-id").values_list("changed_at", flat = True).first()
+
+def data_etag(request, *args, **kwargs):
+    return f"{code_version()}-data-{data_version()}"
+
+def significance_version():
+    """Time of the latest stored permutation test (see province/significance.py)"""
+    latest = SignificanceRun.objects.order_by("-computed_at").values_list("computed_at", flat = True).first()
+    return latest.timestamp() if latest else 0
+
+def analysis_etag(request, *args, **kwargs):
+    # Analysis pages also list precomputed network metrics and significance tests
+    return f"{data_etag(request)}-metrics-{metrics_version()}-significance-{significance_version()}"
+
+# No validators for a missing politician, so the view answers 404 instead of 304
+
+def politician_etag(request, slug):
+    if not Politician.objects.filter(slug = slug).exists():
+        return None
+    return f"{analysis_etag(request)}-profile-{profile_mtime(slug)}"
+
+def politician_last_modified(request, slug):
+    if not Politician.objects.filter(slug = slug).exists():
+        return None
+    return last_change(request)
+
+conditional_on_data = condition(etag_func = data_etag, last_modified_func = last_change)
+conditional_on_analysis = condition(etag_func = analysis_etag, last_modified_func = last_change)
+conditional_on_politician = condition(etag_func = politician_etag, last_modified_func = politician_last_modified)
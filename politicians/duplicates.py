@@ -0,0 +1,151 @@
+from difflib import SequenceMatcher
+from django.db import transaction
+import re
+from .changes import record_change
+from .kin import reindex_politician
+from .models import NameIndexEntry, Politician, PoliticianRecord
+
+# Blocks larger than this are split further by the sound of the whole first name, so no block is compared quadratically
+MAX_BLOCK_SIZE = 50
+DEFAULT_MIN_SCORE = 0.85
+
+SOUNDEX_CODES = {
+    **dict.fromkeys("BFPV", "1"), **dict.fromkeys("CGJKQSXZ", "2"), **dict.fromkeys("DT", "3"),
+    "L": "4", **dict.fromkeys("MN", "5"), "R": "6",
+}
+
+def normalize_name(name):
+    """Uppercase letters and single spaces only, so "MA." and "MA" or "DELA  CRUZ" and "DELA-CRUZ" agree"""
+    return " ".join(re.sub(r"[^A-Z ]", " ", (name or "").upper().replace("Ñ", "N")).split())
+
+def soundex(name):
+    letters = normalize_name(name).replace(" ", "")
+    if not letters:
+        return ""
+    code = letters[0]
+    previous = SOUNDEX_CODES.get(letters[0], "")
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter, "")
+        if digit and digit != previous:
+            code += digit
+        if letter not in "HW":
+            previous = digit
+    return (code + "000")[:4]
+
+def similarity(a, b):
+    return SequenceMatcher(None, a, b).ratio() if a and b else 0.0
+
+def middle_name_score(a, b):
+    # A missing middle name neither confirms nor contradicts a match
+    if not a or not b:
+        return 0.75
+    if a == b:
+        return 1.0
+    if a[0] == b[0] and (len(a) == 1 or len(b) == 1):
+        return 0.9
+    # Two different middle names (mothers' maiden names) are two different people,
+    # unless they are spelling variants of each other
+    score = similarity(a, b)
+    return score if score >= 0.8 else 0.0
+
+class Candidate:
+    __slots__ = ("id", "slug", "first", "middle", "last", "record_count", "terms")
+
+    def __init__(self, id, slug, first, middle, last, record_count, terms):
+        self.id = id
+        self.slug = slug
+        self.first = normalize_name(first)
+        self.middle = normalize_name(middle)
+        self.last = normalize_name(last)
+        self.record_count = record_count
+        self.terms = terms
+
+    def blocking_keys(self):
+        first_token = self.first.split(" ")[0] if self.first else ""
+        return [
+            (soundex(self.last), soundex(first_token)),
+            (self.last, first_token[:2]),
+        ]
+
+FIRST_WEIGHT, LAST_WEIGHT, MIDDLE_WEIGHT = 0.45, 0.35, 0.2
+
+def score_pair(a, b, min_score = 0):
+    """Likelihood (0 to 1) that two politicians are the same person (0 as soon as it cannot reach min_score)"""
+    matcher = SequenceMatcher(None, a.first, b.first)
+    # real_quick_ratio() is a cheap upper bound of ratio(): skip hopeless pairs early
+    if FIRST_WEIGHT * matcher.real_quick_ratio() + LAST_WEIGHT + MIDDLE_WEIGHT < min_score:
+        return 0
+    first = matcher.ratio() if a.first and b.first else 0.0
+    if FIRST_WEIGHT * first + LAST_WEIGHT + MIDDLE_WEIGHT < min_score:
+        return 0
+    score = FIRST_WEIGHT * first + LAST_WEIGHT * similarity(a.last, b.last) + MIDDLE_WEIGHT * middle_name_score(a.middle, b.middle)
+    # Two records in the same election point to two different people
+    if a.terms & b.terms:
+        score -= 0.1
+    return round(score, 3)
+
+def load_candidates():
+    terms = {}
+    for politician_id, province_id, year in PoliticianRecord.objects.values_list("politician_id", "province_id", "year"):
+        terms.setdefault(politician_id, set()).add((province_id, year))
+    return [
+        Candidate(id, slug, first, middle, last, len(terms.get(id, ())), {year for _, year in terms.get(id, ())})
+        for id, slug, first, middle, last in Politician.objects.values_list("id", "slug", "first_name", "middle_name", "last_name")
+    ]
+
+def candidate_blocks(candidates):
+    blocks = {}
+    for candidate in candidates:
+        for key in candidate.blocking_keys():
+            blocks.setdefault(key, []).append(candidate)
+    for members in blocks.values():
+        if len(members) <= MAX_BLOCK_SIZE:
+            yield members
+            continue
+        # Very common surnames: compare only first names that sound alike, which keeps
+        # spelling variants such as "MA TERESA" and "MA THERESA" together
+        split = {}
+        for candidate in members:
+            split.setdefault(soundex(candidate.first), []).append(candidate)
+        yield from split.values()
+
+def find_duplicates(min_score = DEFAULT_MIN_SCORE):
+    """
+    Scored pairs of probable duplicate politicians, best first. Only politicians sharing
+    a blocking key (phonetic surname + phonetic first name, or surname + first two letters)
+    are compared.
+    """
+    seen = set()
+    pairs = []
+    for members in candidate_blocks(load_candidates()):
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                key = (a.id, b.id) if a.id < b.id else (b.id, a.id)
+                if key in seen:
+                    continue
+                seen.add(key)
+                score = score_pair(a, b, min_score)
+                if score >= min_score:
+                    # The politician with more records is kept
+                    keep, duplicate = (a, b) if (a.record_count, -a.id) >= (b.record_count, -b.id) else (b, a)
+                    pairs.append({"keep": keep.slug, "duplicate": duplicate.slug, "score": score})
+    pairs.sort(key = lambda pair: (-pair["score"], pair["keep"], pair["duplicate"]))
+    return pairs
+
+@transaction.atomic
+def merge_politicians(keep, duplicates):
+    """
+    Move every record of the duplicates to the kept politician with one UPDATE, then
+    delete the duplicates. QuerySet.update() sends no signals, so the change log and the
+    name index are updated here. Returns the number of moved records.
+    """
+    duplicate_ids = [politician.id for politician in duplicates if politician.id != keep.id]
+    records = PoliticianRecord.objects.filter(politician_id__in = duplicate_ids)
+    partitions = set(records.values_list("province_id", "year"))
+    moved = records.update(politician = keep)
+
+    record_change("Politician", keep.id, "UPDATE", partitions)
+    NameIndexEntry.objects.filter(politician_id__in = duplicate_ids).delete()
+    Politician.objects.filter(id__in = duplicate_ids).delete()
+    reindex_politician(keep.id)
+    return moved
@@ -0,0 +1,135 @@
+import csv
+from .models import Politician, PoliticianRecord
+
+EXPORT_CHUNK_SIZE = 2000
+
+POLITICIAN_FIELDS = ["id", "slug", "first_name", "middle_name", "last_name"]
+RECORD_FIELDS = [
+    "id", "politician__slug", "politician__first_name", "politician__middle_name", "politician__last_name",
+    "position", "party", "year", "province__name", "region__name", "community",
+]
+RECORD_HEADERS = [
+    "id", "slug", "first_name", "middle_name", "last_name",
+    "position", "party", "year", "province", "region", "community",
+]
+INTEGER_COLUMNS = {"id", "year", "community"}
+EXPORT_FILTERS = ["province", "year", "position", "community"]
+
+def clean_filters(params, names = EXPORT_FILTERS):
+    """
+    Export filters from query parameters, None when empty. Raises ValueError when the year
+    or community is not a whole number, so a view can answer 400 before streaming anything.
+    """
+    filters = {}
+    for name in names:
+        value = params.get(name) or None
+        if value is not None and name in ("year", "community"):
+            try:
+                value = int(value)
+            except ValueError:
+                raise ValueError(f"{name.capitalize()} must be a whole number.")
+        filters[name] = value
+    return filters
+
+def filter_records(province = None, year = None, position = None, community = None):
+    """Records matching the export filters; every filter is optional"""
+    records = PoliticianRecord.objects.all()
+    if province:
+        records = records.filter(province__name = province)
+    if year:
+        records = records.filter(year = int(year))
+    if position:
+        records = records.filter(position = position)
+    if community not in (None, ""):
+        records = records.filter(community = int(community))
+    return records
+
+def filter_politicians(**filters):
+    """Politicians having at least one record that matches the export filters"""
+    politicians = Politician.objects.all()
+    if any(value not in (None, "") for value in filters.values()):
+        politicians = politicians.filter(id__in = filter_records(**filters).values("politician"))
+    return politicians
+
+def iter_rows(kind, **filters):
+    """
+    Yield (headers, rows) for an export without materializing model instances.
+    Rows are streamed from the database in chunks so memory stays flat.
+    """
+    if kind == "politicians":
+        queryset = filter_politicians(**filters).order_by("id").values_list(*POLITICIAN_FIELDS)
+        headers = POLITICIAN_FIELDS
+    elif kind == "records":
+        queryset = filter_records(**filters).order_by("id").values_list(*RECORD_FIELDS)
+        headers = RECORD_HEADERS
+    else:
+        raise ValueError(f"Unknown export kind: {kind}")
+    return headers, queryset.iterator(chunk_size = EXPORT_CHUNK_SIZE)
+
+class Echo:
+    """File-like object that hands back whatever is written to it (for csv.writer)"""
+    def write(self, value):
+        return value
+
+def stream_csv(headers, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow(row)
+
+class ChunkSink:
+    """
+    Write-only file object for pyarrow that buffers bytes until they are drained.
+    Keeps its own position so the Parquet footer offsets stay correct.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def stream_parquet(headers, rows, chunk_size = EXPORT_CHUNK_SIZE):
+    """Yield a Parquet file one row group at a time"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, pa.int64() if name in INTEGER_COLUMNS else pa.string()) for name in headers])
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    batch = []
+
+    def write_batch():
+        columns = list(zip(*batch)) if batch else [[] for _ in headers]
+        writer.write_table(pa.table(
+            {name: pa.array(column, type = field.type) for name, column, field in zip(headers, columns, schema)},
+            schema = schema,
+        ))
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            write_batch()
+            batch = []
+            yield sink.drain()
+    if batch:
+        write_batch()
+    writer.close()
+    yield sink.drain()
@@ -1,5 +1,33 @@
+from django import forms
 from django.forms import ModelForm
 from .models import Politician, PoliticianRecord
+from .reference import get_reference
+
+class ReferenceChoiceField(forms.ChoiceField):
+    """
+    Choice field for regions and provinces served from the reference data cache,
+    so rendering and validating the form needs no database round-trip.
+    """
+    def __init__(self, attribute, **kwargs):
+        self.attribute = attribute
+        super().__init__(choices = self.get_choices, **kwargs)
+
+    def lookup(self):
+        return getattr(get_reference(), self.attribute)
+
+    def get_choices(self):
+        return [("", "---------")] + [(pk, str(obj)) for pk, obj in self.lookup().items()]
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.lookup()[int(getattr(value, "pk", value))]
+        except (KeyError, TypeError, ValueError):
+            raise forms.ValidationError(self.error_messages["invalid_choice"], code = "invalid_choice", params = {"value": value})
+
+    def validate(self, value):
+        forms.Field.validate(self, value)
 
 class PoliticianForm(ModelForm):
     class Meta:
@@ -7,6 +35,14 @@ class PoliticianForm(ModelForm):
         fields = ['first_name', 'middle_name', 'last_name']
 
 class PoliticianRecordForm(ModelForm):
+    region = ReferenceChoiceField("regions", required = False)
+    province = ReferenceChoiceField("provinces")
+
     class Meta:
         model = PoliticianRecord
-        fields = ['position', 'party', 'year', 'region', 'province', 'community']
\ No newline at end of file
+        fields = ['position', 'party', 'year', 'region', 'province', 'community']
+
+    def _get_validation_exclusions(self):
+        # Region and province were already checked against the reference data,
+        # so skip the per-foreign-key existence queries of model validation.
+        return super()._get_validation_exclusions() | {"region", "province"}
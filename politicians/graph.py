@@ -1,14 +1,27 @@
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import matplotlib.patches as patches
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import networkx as nx
 from pyvis.network import Network
 from django.db.models import Min
 
 from .models import PoliticianRecord
+from .reference import get_reference
+from .relations import (
+    block_relations, combine, compute_relations, encode_names, expand_relations, get_relations,
+    get_weight_profile, name_block_pairs, store_relations,
+)
+from .snapshot import get_snapshot
 import io
 import base64
+import json
+
+# Above this many nodes the interactive graph collapses communities into super-nodes
+LOD_NODE_LIMIT = 300
+# At most this many community super-nodes are sent to the browser
+LOD_COMMUNITY_LIMIT = 150
 
 def get_colors(degree_threshold, largest_community, G_filtered, above_threshold):
     if degree_threshold <= 1:
@@ -41,7 +54,11 @@ def get_colors(degree_threshold, largest_community, G_filtered, above_threshold)
         ]
     return node_color_map, legend_items
 
-def generate_adjacency_matrix(province, year): 
+def load_unique_records(province, year, community = None):
+    """
+    First record of each politician in the province-year, as a queryset and as a
+    DataFrame with the columns needed to build the adjacency matrix (one query).
+    """
     first_ids = (
         PoliticianRecord.objects
         .filter(province__name = province, year = year)
@@ -50,45 +67,116 @@ def generate_adjacency_matrix(province, year):
         .values_list("first_id", flat = True)
     )
     unique_records = PoliticianRecord.objects.filter(id__in = first_ids)
+    if community is not None:
+        unique_records = unique_records.filter(community = community)
+
+    rows = unique_records.order_by("id").with_position_weight().values_list(
+        "politician__slug", "politician_id", "politician__last_name", "politician__middle_name",
+        "position", "community", "weight"
+    )
+    # dtype = object keeps NULL middle names as None (not NaN) for the comparisons below
+    frame = pd.DataFrame(
+        list(rows), columns = ["Slug", "Politician ID", "Last Name", "Middle Name", "Position", "Community", "Position Weight"],
+        dtype = object
+    )
+    frame["Position Weight"] = frame["Position Weight"].astype(int)
+    return unique_records, frame
+
+def generate_adjacency_matrix(province, year, community = None, snapshot = None, profile = None):
+    """
+    Kinship adjacency matrix of a province-year. The pairwise relation types are computed
+    once per partition (see relations.py); the weight profile only recombines them.
+    """
+    # Read from the columnar snapshot when one is given, otherwise from the ORM
+    if snapshot is not None:
+        unique_records = frame = snapshot.unique_records(province, year, community)
+    else:
+        unique_records, frame = load_unique_records(province, year, community)
+    if community is None:
+        relation_matrix = get_relations(province, year, frame)
+    else:
+        # A single community is small; its relations are not worth caching
+        relation_matrix = expand_relations(compute_relations(frame["Last Name"], frame["Middle Name"]), len(frame))
+    am_df, name_data = build_adjacency(frame, relation_matrix, profile)
+    return am_df, unique_records, name_data
+
+def build_adjacency(frame, relation_matrix, profile = None):
+    """Adjacency matrix (labelled by slug) and per-politician name data of a unique records frame"""
+    if profile is not None and not profile.is_default:
+        frame = frame.assign(**{"Position Weight" : profile.position_weights(frame["Position"])})
 
     name_data = {
-        record.politician.slug: {
-            "Last Name": record.politician.last_name,
-            "Middle Name": record.politician.middle_name,
-            "Position Weight": record.position_weight(),
-            "Community": record.community,
-            "Position": record.position
+        row["Slug"]: {
+            "Politician ID": row["Politician ID"],
+            "Last Name": row["Last Name"],
+            "Middle Name": row["Middle Name"],
+            "Position Weight": row["Position Weight"],
+            "Community": row["Community"],
+            "Position": row["Position"]
         }
-        for record in unique_records
+        for row in frame.to_dict("records")
     }
 
-    names = [record.politician.slug for record in unique_records]
-    num_names = len(unique_records)
-    am = np.zeros((num_names, num_names), dtype = int)
-    ln = [record.politician.last_name for record in unique_records]
-    mn = [record.politician.middle_name for record in unique_records]
-    weights = [record.position_weight() for record in unique_records]
-
-    for i in range(num_names):
-        for j in range(i + 1, num_names):
-            # Consanguinity conditions
-            if ln[i] == ln[j] and mn[i] == mn[j]:  # Consanguinity 1
-                weight = weights[i] * weights[j]
-            elif ln[i] == ln[j] and mn[i] != mn[j]:  # Consanguinity 2
-                weight = (weights[i] * weights[j]) * 3 / 4
-            elif mn[i] != "" and (ln[i] == mn[j] or mn[i] == ln[j]):  # Consanguinity 3+
-                weight = (weights[i] * weights[j]) * 2 / 4
-            elif mn[i] == mn[j] and mn[i] != "":
-                weight = (weights[i] * weights[j]) * 1 / 4
-            else:
-                weight = 0
-
-            am[i, j] = weight
-            am[j, i] = weight  # Ensure symmetry
+    names = list(frame["Slug"])
+    am = combine(relation_matrix, frame["Position"], profile or get_weight_profile())
 
     # Create a graph with all politicians using the original adjacency matrix
     am_df = pd.DataFrame(am, index = names, columns = names)
-    return am_df, unique_records, name_data
+    return am_df, name_data
+
+def load_province_records(province, years = None, snapshot = None):
+    """
+    First record of each politician in every year of a province, in one query
+    (or from the snapshot): a load_unique_records() frame with an extra Year column.
+    """
+    years = list(years) if years is not None else None
+    if snapshot is not None:
+        frames = [
+            snapshot.unique_records(province, year).assign(Year = year)
+            for year in (years if years is not None else get_reference().years)
+        ]
+        frame = pd.concat(frames, ignore_index = True) if frames else pd.DataFrame(columns = ["Slug", "Year"])
+    else:
+        records = PoliticianRecord.objects.filter(province__name = province)
+        if years is not None:
+            records = records.filter(year__in = years)
+        first_ids = records.values("politician", "year").annotate(first_id = Min("id")).values_list("first_id", flat = True)
+        rows = PoliticianRecord.objects.filter(id__in = first_ids).order_by("id").with_position_weight().values_list(
+            "politician__slug", "politician_id", "politician__last_name", "politician__middle_name",
+            "position", "community", "weight", "year"
+        )
+        frame = pd.DataFrame(
+            list(rows),
+            columns = ["Slug", "Politician ID", "Last Name", "Middle Name", "Position", "Community", "Position Weight", "Year"],
+            dtype = object
+        )
+        frame["Position Weight"] = frame["Position Weight"].astype(int)
+    return frame
+
+def generate_adjacency_matrices(province, years = None, snapshot = None, profile = None):
+    """
+    Adjacency matrices of every year of a province at once. The names of the union of the
+    province's politicians are encoded and blocked a single time; each year's relation
+    matrix is then filled from the related pairs of its politicians, so no matrix
+    larger than a single year is ever built.
+    Returns {year: (am_df, unique_records frame, name_data)}, like generate_adjacency_matrix().
+    """
+    frame = load_province_records(province, years, snapshot)
+    union = frame.drop_duplicates("Politician ID")
+    union_index = {politician_id: i for i, politician_id in enumerate(union["Politician ID"])}
+    names = encode_names(union["Last Name"], union["Middle Name"])
+    pairs = name_block_pairs(*names)
+
+    matrices = {}
+    for year in (years if years is not None else sorted(frame["Year"].unique())):
+        year_frame = frame[frame["Year"] == year].drop(columns = "Year").reset_index(drop = True)
+        index = np.array([union_index[politician_id] for politician_id in year_frame["Politician ID"]], dtype = int)
+        relation_matrix = block_relations(names, pairs, index)
+        # Single-year views of this province reuse the matrix
+        store_relations(province, year, year_frame["Politician ID"], relation_matrix)
+        am_df, name_data = build_adjacency(year_frame, relation_matrix, profile)
+        matrices[int(year)] = (am_df, year_frame, name_data)
+    return matrices
 
 def generate_graph(am_df, unique_records, name_data, degree_threshold):
     # Include only those politicians whose degree is higher than the degree threshold...
@@ -97,11 +185,10 @@ def generate_graph(am_df, unique_records, name_data, degree_threshold):
 
     # ...and the politicians who are connected to those higher than the degree threshold
     above_threshold_community = set()
-    communities = []
-    unique_communities = unique_records.values_list("community", flat = True).distinct()
-    for comm in unique_communities:
-        slugs = unique_records.filter(community = comm).values_list("politician__slug", flat = True)
-        communities.append(list(slugs))
+    members = {}
+    for slug, data in name_data.items():
+        members.setdefault(data["Community"], []).append(slug)
+    communities = list(members.values())
     for comm in communities:
         if any(n in comm for n in above_threshold):
             above_threshold_community.update(comm)
@@ -119,29 +206,44 @@ def generate_graph(am_df, unique_records, name_data, degree_threshold):
 
     return G_filtered, above_threshold, above_threshold_community, communities
 
-def display_static_graph(province, year, degree_threshold, G_filtered, above_threshold, communities):
+def render_static_png(G, pos, node_colors, edge_widths, title, legend_items, figsize = (20, 15), dpi = 100):
+    """
+    Render a graph to a base64 PNG with the object-oriented Figure/Agg API.
+    Nothing is registered with pyplot, so the figure is freed as soon as it goes
+    out of scope and renders can run concurrently in a thread pool.
+    """
+    fig = Figure(figsize = figsize, dpi = dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    nx.draw_networkx(G, pos, ax = ax, with_labels = False, node_color = node_colors, width = edge_widths)
+    ax.set_axis_off()
+    ax.set_title(title)
+    ax.legend(handles = legend_items, title = "Politician Category", loc = "best")
+
+    with io.BytesIO() as buf:
+        fig.savefig(buf, format = "png", bbox_inches = "tight")
+        return base64.b64encode(buf.getvalue()).decode("utf-8")
+
+def display_static_graph(province, year, degree_threshold, G_filtered, above_threshold, communities, figsize = (20, 15)):
     # Prepare colors for plotting
     sorted_communities = sorted(communities, key = len, reverse = True)
     if len(sorted_communities) >= 1 and len(above_threshold) >= 1:
         largest_community = sorted_communities[0]
         node_color_map, legend_items = get_colors(degree_threshold, largest_community, G_filtered, above_threshold)
         
-        # Create the static graph 
-        fig, ax = plt.subplots(figsize = (20, 15))
+        # Create and save the static graph
         pos = nx.spring_layout(G_filtered, k = 0.5, iterations = 100)
-        nx.draw(G_filtered, pos,
-                node_color = [node_color_map[node] for node in G_filtered.nodes()],
-                width = [G_filtered[u][v]["weight"] for u, v in G_filtered.edges()])
-        ax.set_title(f"Political Network of {province} ({year})")
-        ax.legend(handles = legend_items, title = "Politician Category", loc = "best")
-
-        # Save the static graph
-        buf = io.BytesIO()
-        fig.savefig(buf, format="png", bbox_inches="tight")
-        buf.seek(0)
-        static_graph = base64.b64encode(buf.read()).decode("utf-8")
-        buf.close()
+        static_graph = render_static_png(
+            G_filtered, pos,
+            node_colors = [node_color_map[node] for node in G_filtered.nodes()],
+            edge_widths = [G_filtered[u][v]["weight"] for u, v in G_filtered.edges()],
+            title = f"Political Network of {province} ({year})",
+            legend_items = legend_items,
+            figsize = figsize,
+        )
         return static_graph, pos
+    # Nothing to draw (e.g. a province without records for the year)
+    return None, {}
 
 def get_interactive_html(degree_threshold, above_threshold, communities, G_filtered, pos):
     # Prepare colors for plotting
@@ -159,4 +261,101 @@ def get_interactive_html(degree_threshold, above_threshold, communities, G_filte
         for u, v in G_filtered.edges():
             net.add_edge(u, v, width = G_filtered[u][v].get("weight"), color = "black")
         interactive_html = net.generate_html()
-        return interactive_html
\ No newline at end of file
+        return interactive_html
+
+def generate_community_graph(am_df, name_data, limit = LOD_COMMUNITY_LIMIT):
+    """
+    Collapse each community into a super-node sized by its member count.
+    Edges between super-nodes carry the summed kin weights between their members.
+    Only the `limit` largest multi-member communities are kept, so the graph stays bounded.
+    """
+    labels = pd.Series({slug : data["Community"] for slug, data in name_data.items()}).reindex(am_df.index)
+    membership = pd.get_dummies(labels)
+    sizes = membership.sum(axis = 0)
+    kept = sizes[sizes > 1].sort_values(ascending = False).index[:limit]
+    membership = membership[kept].to_numpy(dtype = float)
+
+    # (communities x members) @ (members x members) @ (members x communities)
+    summed = membership.T @ am_df.to_numpy(dtype = float) @ membership
+
+    G_community = nx.Graph()
+    for i, comm in enumerate(kept):
+        G_community.add_node(
+            int(comm),
+            **{"Size" : int(sizes[comm]), "Internal Weight" : summed[i, i] / 2}
+        )
+    rows, cols = np.nonzero(np.triu(summed, k = 1))
+    for i, j in zip(rows, cols):
+        G_community.add_edge(int(kept[i]), int(kept[j]), weight = summed[i, j])
+    return G_community, len(sizes)
+
+def get_community_html(G_community, members_url):
+    """
+    Interactive graph of community super-nodes. Clicking a super-node fetches its
+    members from `members_url` and expands them around it.
+    """
+    if G_community.number_of_nodes() == 0:
+        return None
+    largest = max(G_community.nodes, key = lambda comm : G_community.nodes[comm]["Size"])
+    max_weight = max((w for _, _, w in G_community.edges(data = "weight")), default = 1)
+    pos = nx.spring_layout(G_community, k = 0.5, iterations = 100, seed = 0)
+
+    net = Network(width = "100%", notebook = False)
+    net.toggle_physics(False)
+    for comm in G_community.nodes():
+        size = G_community.nodes[comm]["Size"]
+        net.add_node(f"community-{comm}", label = f"Community {comm}", value = size,
+                     x = 1000*pos[comm][0], y = -1000*pos[comm][1],
+                     title = f"Community {comm}: {size} members (click to expand)",
+                     color = "#ee734a" if comm == largest else "#777777", shape = "dot")
+    for u, v, weight in G_community.edges(data = "weight"):
+        net.add_edge(f"community-{u}", f"community-{v}", width = 1 + 9 * weight / max_weight, color = "black")
+    html = net.generate_html()
+
+    expand_script = """
+<script type="text/javascript">
+    network.on("click", function (params) {
+        if (params.nodes.length !== 1) return;
+        var id = String(params.nodes[0]);
+        var hub = nodes.get(id);
+        if (!id.startsWith("community-") || hub.expanded) return;
+        fetch(%s + "&community=" + encodeURIComponent(id.slice(10)))
+            .then(function (response) { return response.json(); })
+            .then(function (data) {
+                var center = network.getPositions([id])[id];
+                nodes.update({id: id, expanded: true, value: 1, title: hub.label});
+                nodes.add(data.nodes.map(function (node) {
+                    return Object.assign(node, {x: center.x + node.x, y: center.y + node.y});
+                }));
+                edges.add(data.edges);
+                edges.add(data.nodes.map(function (node) {
+                    return {from: id, to: node.id, color: "#cccccc", dashes: true, width: 1};
+                }));
+            });
+    });
+</script>
+""" % json.dumps(members_url)
+    return html.replace("</body>", expand_script + "</body>")
+
+def get_community_members(province, year, community, profile = None):
+    """Nodes and kin edges of a single community, laid out around the origin"""
+    am_df, _, name_data = generate_adjacency_matrix(province, year, community = community, snapshot = get_snapshot(), profile = profile)
+    if am_df.empty:
+        return {"nodes" : [], "edges" : []}
+    G = nx.from_pandas_adjacency(am_df)
+    pos = nx.spring_layout(G, k = 0.5, iterations = 100, seed = 0)
+    radius = 60 + 15 * np.sqrt(len(G))
+    return {
+        "nodes" : [
+            {
+                "id" : slug, "label" : " ", "title" : f"{slug} ({name_data[slug]['Position']})",
+                "x" : radius * float(pos[slug][0]), "y" : -radius * float(pos[slug][1]),
+                "color" : "#fba050", "value" : name_data[slug]["Position Weight"],
+            }
+            for slug in G.nodes()
+        ],
+        "edges" : [
+            {"from" : u, "to" : v, "width" : G[u][v]["weight"], "color" : "black"}
+            for u, v in G.edges()
+        ],
+    }
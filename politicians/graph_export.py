@@ -0,0 +1,142 @@
+from xml.sax.saxutils import escape, quoteattr
+import csv
+import numpy as np
+import zlib
+from .export import Echo
+from .graph import generate_adjacency_matrices
+from .reference import get_reference
+from .snapshot import get_snapshot
+
+GRAPH_FORMATS = {
+    # format: (content type, file extension)
+    "graphml": ("application/graphml+xml", "graphml"),
+    "gexf": ("application/gexf+xml", "gexf"),
+    "edgelist": ("text/csv", "csv"),
+}
+
+NODE_ATTRIBUTES = [
+    # (name, GraphML type, GEXF type)
+    ("slug", "string", "string"),
+    ("province", "string", "string"),
+    ("year", "int", "integer"),
+    ("position", "string", "string"),
+    ("position_weight", "double", "double"),
+    ("community", "int", "integer"),
+]
+
+def iter_partitions(province = None, year = None, profile = None):
+    """
+    Yield (province, province id, year, am_df, name_data) one province at a time, so a
+    national export never holds more than one province's matrices in memory.
+    """
+    reference = get_reference()
+    provinces = [province] if province else reference.province_names
+    years = [int(year)] if year else reference.years
+    snapshot = get_snapshot()
+    for name in provinces:
+        for partition_year, (am_df, _, name_data) in generate_adjacency_matrices(name, years, snapshot, profile).items():
+            if len(am_df):
+                yield name, reference.province_id(name), partition_year, am_df, name_data
+
+def node_id(province_id, year, data):
+    # A politician is one node per province-year graph
+    return f"{data['Politician ID']}-{province_id}-{year}"
+
+def iter_nodes(province, province_id, year, name_data):
+    for slug, data in name_data.items():
+        yield node_id(province_id, year, data), {
+            "slug": slug,
+            "province": province,
+            "year": year,
+            "position": data["Position"],
+            "position_weight": float(data["Position Weight"]),
+            "community": int(data["Community"]),
+        }
+
+def iter_edges(province_id, year, am_df, name_data):
+    am = am_df.to_numpy()
+    ids = [node_id(province_id, year, name_data[slug]) for slug in am_df.index]
+    for i, j in zip(*np.nonzero(np.triu(am, k = 1))):
+        yield ids[i], ids[j], float(am[i, j])
+
+def stream_graphml(partitions):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+    for name, graphml_type, _ in NODE_ATTRIBUTES:
+        yield f'  <key id="{name}" for="node" attr.name="{name}" attr.type="{graphml_type}"/>\n'
+    yield '  <key id="weight" for="edge" attr.name="weight" attr.type="double"/>\n'
+    yield '  <graph id="kinship" edgedefault="undirected">\n'
+    # GraphML allows nodes and edges in any order, so each partition is written in one pass
+    for province, province_id, year, am_df, name_data in partitions:
+        lines = []
+        for id, attributes in iter_nodes(province, province_id, year, name_data):
+            data = "".join(f'<data key="{key}">{escape(str(value))}</data>' for key, value in attributes.items())
+            lines.append(f'    <node id={quoteattr(id)}>{data}</node>\n')
+        for source, target, weight in iter_edges(province_id, year, am_df, name_data):
+            lines.append(f'    <edge source={quoteattr(source)} target={quoteattr(target)}><data key="weight">{weight:g}</data></edge>\n')
+        yield "".join(lines)
+    yield '  </graph>\n</graphml>\n'
+
+def stream_gexf(partitions):
+    """
+    GEXF lists every node before every edge, so the partitions are walked once: the nodes
+    are streamed as they come and each partition's edges are kept as rendered text until
+    the nodes are done. That text is much smaller than the adjacency matrices, which are
+    dropped after each partition as in the other formats.
+    """
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<gexf xmlns="http://gexf.net/1.3" version="1.3">\n'
+    yield '  <graph defaultedgetype="undirected">\n'
+    yield '    <attributes class="node">\n'
+    for index, (name, _, gexf_type) in enumerate(NODE_ATTRIBUTES):
+        yield f'      <attribute id="{index}" title="{name}" type="{gexf_type}"/>\n'
+    yield '    </attributes>\n    <nodes>\n'
+    edges = []
+    for province, province_id, year, am_df, name_data in partitions:
+        lines = []
+        for id, attributes in iter_nodes(province, province_id, year, name_data):
+            values = "".join(
+                f'<attvalue for="{index}" value={quoteattr(str(value))}/>'
+                for index, value in enumerate(attributes.values())
+            )
+            lines.append(f'      <node id={quoteattr(id)} label={quoteattr(attributes["slug"])}><attvalues>{values}</attvalues></node>\n')
+        yield "".join(lines)
+        edges.append("".join(
+            f'      <edge source={quoteattr(source)} target={quoteattr(target)} weight="{weight:g}"/>\n'
+            for source, target, weight in iter_edges(province_id, year, am_df, name_data)
+        ))
+    yield '    </nodes>\n    <edges>\n'
+    yield from edges
+    yield '    </edges>\n  </graph>\n</gexf>\n'
+
+def stream_edgelist(partitions):
+    writer = csv.writer(Echo())
+    yield writer.writerow(["source", "target", "weight", "source_slug", "target_slug", "province", "year"])
+    for province, province_id, year, am_df, name_data in partitions:
+        slugs = {node_id(province_id, year, data): slug for slug, data in name_data.items()}
+        yield "".join(
+            writer.writerow([source, target, f"{weight:g}", slugs[source], slugs[target], province, year])
+            for source, target, weight in iter_edges(province_id, year, am_df, name_data)
+        )
+
+def stream_graph(graph_format, compress = False, **filters):
+    """Chunks of a graph export in the given format, gzip-compressed on the fly if asked"""
+    partitions = iter_partitions(**filters)
+    if graph_format == "graphml":
+        chunks = stream_graphml(partitions)
+    elif graph_format == "gexf":
+        chunks = stream_gexf(partitions)
+    elif graph_format == "edgelist":
+        chunks = stream_edgelist(partitions)
+    else:
+        raise ValueError(f"Unknown graph format: {graph_format}")
+    if not compress:
+        yield from (chunk.encode("utf-8") for chunk in chunks)
+        return
+    # wbits = 31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(wbits = 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
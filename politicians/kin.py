@@ -0,0 +1,84 @@
+from django.db import transaction
+from .models import NameIndexEntry, Politician, PoliticianRecord
+from .relations import DEFAULT_FACTORS, NO_RELATION, RELATION_NAMES, pair_relation
+
+RELATION_LABELS = {
+    "same_last_middle": "Same last and middle name",
+    "same_last": "Same last name",
+    "cross": "Last and middle names crossed",
+    "same_middle": "Same middle name",
+}
+
+def index_entries(rows):
+    """
+    Name index entries for (politician id, last name, middle name, province id, year) rows.
+    Empty middle names are not indexed: they relate nobody.
+    """
+    entries = {}
+    for politician_id, last_name, middle_name, province_id, year in rows:
+        for name, role in ((last_name, "LAST"), (middle_name, "MIDDLE")):
+            if name:
+                entries[(name, role, politician_id, province_id, year)] = NameIndexEntry(
+                    name = name, role = role, politician_id = politician_id, province_id = province_id, year = year
+                )
+    return list(entries.values())
+
+INDEX_COLUMNS = ["politician_id", "politician__last_name", "politician__middle_name", "province_id", "year"]
+
+@transaction.atomic
+def reindex_politician(politician_id):
+    """Replace the index entries of one politician (after a write to them or their records)"""
+    NameIndexEntry.objects.filter(politician_id = politician_id).delete()
+    rows = PoliticianRecord.objects.filter(politician_id = politician_id).values_list(*INDEX_COLUMNS)
+    NameIndexEntry.objects.bulk_create(index_entries(rows))
+
+@transaction.atomic
+def rebuild_name_index(batch_size = 5000):
+    NameIndexEntry.objects.all().delete()
+    rows = PoliticianRecord.objects.order_by("id").values_list(*INDEX_COLUMNS).iterator(chunk_size = batch_size)
+    entries = index_entries(rows)
+    NameIndexEntry.objects.bulk_create(entries, batch_size = batch_size)
+    return len(entries)
+
+def likely_kin(politician, limit = 20):
+    """
+    Politicians across the country who share a last or middle name with this one,
+    ranked by the consanguinity rules of the kinship graphs: the relation factor first,
+    then whether they held office in the same province, then how many years overlap.
+    """
+    names = [name for name in (politician.last_name, politician.middle_name) if name]
+    entries = (
+        NameIndexEntry.objects
+        .filter(name__in = names)
+        .exclude(politician_id = politician.id)
+        .values_list("politician_id", "province__name", "year")
+    )
+    places = {}
+    for politician_id, province, year in entries:
+        places.setdefault(politician_id, set()).add((province, year))
+    if not places:
+        return []
+
+    own_places = set(
+        PoliticianRecord.objects.filter(politician = politician).values_list("province__name", "year")
+    )
+    own_provinces = {province for province, _ in own_places}
+    middle_name = politician.middle_name or ""
+
+    kin = []
+    for relative in Politician.objects.filter(id__in = places).only("first_name", "middle_name", "last_name", "slug"):
+        relation = pair_relation(politician.last_name, middle_name, relative.last_name, relative.middle_name or "")
+        if relation == NO_RELATION:
+            continue
+        relation_name = RELATION_NAMES[relation]
+        provinces = sorted({province for province, _ in places[relative.id]})
+        kin.append({
+            "politician": relative,
+            "relation": RELATION_LABELS[relation_name],
+            "factor": DEFAULT_FACTORS[relation_name],
+            "provinces": provinces,
+            "same_province": bool(own_provinces.intersection(provinces)),
+            "shared_terms": len(own_places & places[relative.id]),
+        })
+    kin.sort(key = lambda item: (-item["factor"], not item["same_province"], -item["shared_terms"], str(item["politician"])))
+    return kin[:limit]
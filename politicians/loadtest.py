@@ -0,0 +1,225 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import transaction
+from django.urls import Resolver404, resolve, reverse
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urlsplit
+from urllib.request import urlopen
+import csv
+import numpy as np
+import os
+import random
+import threading
+import time
+from .changes import record_change
+from .kin import rebuild_name_index
+from .models import Politician, PoliticianRecord, Province, Region, custom_slugify
+
+DATASET_DIR = os.path.join(settings.BASE_DIR, "datasets")
+PARTIES = ["LAKAS", "LP", "NP", "NPC", "NUP", "PDP-LABAN", "PFP", None]
+# Relative frequency of each position among generated records
+POSITION_FREQUENCIES = {
+    "COUNCILOR": 50, "PROVINCIAL BOARD MEMBER": 12, "VICE MAYOR": 10, "MAYOR": 10,
+    "MEMBER, HOUSE OF REPRESENTATIVES": 4, "VICE GOVERNOR": 2, "GOVERNOR": 2,
+}
+FAMILIES_PER_PROVINCE = 8
+REQUEST_TIMEOUT = 60
+
+@transaction.atomic
+def generate_dataset(politicians = 5000, seed = 0):
+    """
+    Fill an empty database with synthetic politicians and records: real region, province
+    and given names from datasets/, and a few dominant families per province so the
+    kinship graphs have communities. Returns (politician count, record count).
+    """
+    rng = random.Random(seed)
+    with open(os.path.join(DATASET_DIR, "region_province.csv"), encoding = "utf-8") as f:
+        pairs = list(csv.DictReader(f))
+    with open(os.path.join(DATASET_DIR, "politicians.csv"), encoding = "utf-8") as f:
+        names = list(csv.DictReader(f))
+    rng.shuffle(names)
+
+    regions = {name: Region.objects.create(name = name) for name in dict.fromkeys(row["Region"] for row in pairs)}
+    provinces = [Province.objects.create(name = row["Province"], region = regions[row["Region"]]) for row in pairs]
+    surnames = sorted({row["Last Name"] for row in names if row["Last Name"]})
+    families = {province.id: rng.sample(surnames, FAMILIES_PER_PROVINCE) for province in provinces}
+
+    people, homes, slugs = [], [], set()
+    for row in names:
+        if len(people) == politicians:
+            break
+        province = rng.choice(provinces)
+        last = rng.choice(families[province.id]) if rng.random() < 0.4 else row["Last Name"]
+        middle = rng.choice(families[province.id]) if rng.random() < 0.2 else row["Middle Name"] or None
+        slug = custom_slugify(row["First Name"], middle, last)
+        if not row["First Name"] or not last or slug in slugs:
+            continue
+        slugs.add(slug)
+        people.append(Politician(first_name = row["First Name"], middle_name = middle, last_name = last, slug = slug))
+        homes.append(province)
+    Politician.objects.bulk_create(people, batch_size = 2000)
+
+    years = [year for year, _ in PoliticianRecord.year_choices]
+    positions, frequencies = zip(*POSITION_FREQUENCIES.items())
+    records = []
+    for politician, province in zip(Politician.objects.order_by("id"), homes):
+        family = families[province.id]
+        community = family.index(politician.last_name) + 1 if politician.last_name in family else rng.randint(FAMILIES_PER_PROVINCE + 1, 40)
+        for year in sorted(rng.sample(years, rng.randint(1, 4))):
+            records.append(PoliticianRecord(
+                politician = politician, province = province, region = province.region, year = year,
+                position = rng.choices(positions, frequencies)[0], party = rng.choice(PARTIES), community = community,
+            ))
+    PoliticianRecord.objects.bulk_create(records, batch_size = 5000)
+
+    # bulk_create sends no signals
+    record_change("PoliticianRecord", None, "CREATE", {(record.province_id, record.year) for record in records})
+    rebuild_name_index()
+    return len(people), len(records)
+
+class Sample:
+    """Values the scenarios pick from, read once from the database under test"""
+    def __init__(self):
+        self.slugs = list(Politician.objects.values_list("slug", flat = True))
+        self.last_names = sorted(set(Politician.objects.values_list("last_name", flat = True)))
+        self.partitions = sorted(set(PoliticianRecord.objects.values_list("province__name", "year")))
+        if not self.slugs or not self.partitions:
+            raise ValueError("The database has no politician records to browse.")
+
+def url(name, *args, **params):
+    path = reverse(name, args = args)
+    return f"{path}?{urlencode(params)}" if params else path
+
+# Each scenario is one visit: the pages a user opens one after the other
+
+def search(rng, sample):
+    name = rng.choice(sample.last_names)
+    return [url("politicians:index"), url("politicians:index", search = name[:rng.randint(3, 5)]), url("politicians:politician_view", rng.choice(sample.slugs))]
+
+def politician_detail(rng, sample):
+    return [url("politicians:politician_view", slug) for slug in rng.sample(sample.slugs, min(3, len(sample.slugs)))]
+
+def province_switching(rng, sample):
+    province, year = rng.choice(sample.partitions)
+    pages = [url("overview:dashboard"), url("province_analysis", province = province, year = year)]
+    for _ in range(3):
+        # Switch the province, or the year of the same province
+        if rng.random() < 0.5:
+            province, year = rng.choice(sample.partitions)
+        else:
+            year = rng.choice([partition_year for name, partition_year in sample.partitions if name == province])
+        pages.append(url("province_analysis", province = province, year = year))
+    return pages
+
+def graph_viewing(rng, sample):
+    province, year = rng.choice(sample.partitions)
+    return [url("politicians:graph", province = province, year = year), url("politicians:graph_weights", province = province, year = year)]
+
+# name: (relative frequency, page sequence)
+SCENARIOS = {
+    "search": (3, search),
+    "politician_detail": (3, politician_detail),
+    "province_switching": (2, province_switching),
+    "graph_viewing": (1, graph_viewing),
+}
+
+def endpoint_name(path):
+    try:
+        return resolve(urlsplit(path).path).url_name
+    except Resolver404:
+        return path
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def start_server():
+    """Serve the WSGI application on a free local port from a background thread"""
+    server = ThreadedWSGIServer(("127.0.0.1", 0), QuietRequestHandler, allow_reuse_address = False)
+    server.set_app(get_wsgi_application())
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def fetch(base_url, path):
+    """(status, seconds) of one request; status 0 when no response arrived"""
+    start = time.perf_counter()
+    try:
+        with urlopen(base_url + path, timeout = REQUEST_TIMEOUT) as response:
+            response.read()
+            status = response.status
+    except HTTPError as error:
+        status = error.code
+    except (URLError, OSError):
+        status = 0
+    return status, time.perf_counter() - start
+
+def run_load(base_url, sample, users = 8, duration = 30, scenarios = None, seed = 0, think_time = 0):
+    """
+    Replay randomly chosen scenarios from `users` concurrent virtual users for `duration`
+    seconds. Returns ([(endpoint, status, seconds), ...], elapsed seconds).
+    """
+    chosen = {name: SCENARIOS[name] for name in (scenarios or SCENARIOS)}
+    names = list(chosen)
+    weights = [chosen[name][0] for name in names]
+    deadline = time.perf_counter() + duration
+
+    def user(index):
+        rng = random.Random(seed * 1000 + index)
+        results = []
+        while time.perf_counter() < deadline:
+            for path in chosen[rng.choices(names, weights)[0]][1](rng, sample):
+                status, seconds = fetch(base_url, path)
+                results.append((endpoint_name(path), status, seconds))
+                if think_time:
+                    time.sleep(rng.uniform(0, 2 * think_time))
+        return results
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = users) as executor:
+        results = [result for user_results in executor.map(user, range(users)) for result in user_results]
+    return results, time.perf_counter() - start
+
+def summarize(results, elapsed):
+    """Throughput, latency percentiles (ms) and error rate per endpoint, plus "ALL" for every request"""
+    groups = {}
+    for endpoint, status, seconds in results:
+        groups.setdefault(endpoint, []).append((status, seconds))
+    groups["ALL"] = [(status, seconds) for _, status, seconds in results]
+    summary = {}
+    for endpoint, rows in sorted(groups.items()):
+        if not rows:
+            continue
+        latencies = np.array([seconds for _, seconds in rows]) * 1000
+        errors = sum(1 for status, _ in rows if not 200 <= status < 400)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        summary[endpoint] = {
+            "requests": len(rows),
+            "throughput": round(len(rows) / elapsed, 2),
+            "p50": round(float(p50), 1),
+            "p95": round(float(p95), 1),
+            "p99": round(float(p99), 1),
+            "mean": round(float(latencies.mean()), 1),
+            "error_rate": round(errors / len(rows), 4),
+        }
+    return summary
+
+def compare(summary, baseline, tolerance = 0.2):
+    """
+    Regressions against a baseline summary: a p95 latency more than `tolerance` slower,
+    a throughput more than `tolerance` lower, or a higher error rate.
+    """
+    regressions = []
+    for endpoint, current in summary.items():
+        previous = baseline.get(endpoint)
+        # The overall figures only compare when the same endpoints were exercised
+        if previous is None or (endpoint == "ALL" and set(summary) != set(baseline)):
+            continue
+        if current["p95"] > previous["p95"] * (1 + tolerance):
+            regressions.append(f"{endpoint}: p95 {previous['p95']} ms -> {current['p95']} ms")
+        if current["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append(f"{endpoint}: throughput {previous['throughput']} -> {current['throughput']} req/s")
+        if current["error_rate"] > previous["error_rate"]:
+            regressions.append(f"{endpoint}: error rate {previous['error_rate']:.2%} -> {current['error_rate']:.2%}")
+    return regressions
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from politicians.kin import rebuild_name_index
+
+class Command(BaseCommand):
+    help = "Rebuild the last/middle name index used to list likely relatives of a politician."
+
+    def handle(self, *args, **options):
+        count = rebuild_name_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} name entries."))
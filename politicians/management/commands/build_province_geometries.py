@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from politicians.reference import get_reference
+from province.geometry import GEODATA_DIR, ZOOM_LEVELS, build_geometries
+
+class Command(BaseCommand):
+    help = (
+        "Simplify province boundaries from a GeoJSON file once per map zoom level and store them, "
+        "gzipped, for the dynasty map. Features are matched to provinces by name."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help = "GeoJSON FeatureCollection of province polygons.")
+        parser.add_argument("--name-property", help = "Feature property holding the province name (guessed by default).")
+        parser.add_argument("--output", "-o", default = GEODATA_DIR, help = "Output directory.")
+
+    def handle(self, *args, **options):
+        missing, unmatched = build_geometries(
+            options["source"],
+            get_reference().province_names,
+            name_property = options["name_property"],
+            directory = options["output"],
+        )
+        for name in unmatched:
+            self.stdout.write(self.style.WARNING(f"No province named {name}; feature skipped."))
+        for name in missing:
+            self.stdout.write(self.style.WARNING(f"No boundary for {name}."))
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(ZOOM_LEVELS)} zoom level(s) to {options['output']}."))
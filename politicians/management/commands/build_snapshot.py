@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from politicians.snapshot import SNAPSHOT_DIR, build_snapshot, load_current_snapshot, snapshot_is_current, watch_snapshot
+
+class Command(BaseCommand):
+    help = "Export politicians and records into a memory-mappable columnar snapshot."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--directory", default = SNAPSHOT_DIR, help = "Snapshot directory.")
+        parser.add_argument("--if-stale", action = "store_true", help = "Only rebuild when the data version changed.")
+        parser.add_argument("--watch", action = "store_true", help = "Keep running and rebuild whenever the data changes.")
+        parser.add_argument("--interval", type = float, default = 30, help = "Seconds between change log checks with --watch.")
+
+    def handle(self, *args, **options):
+        if options["watch"]:
+            watch_snapshot(options["directory"], options["interval"], log = self.stdout.write)
+            return
+        if options["if_stale"] and snapshot_is_current(load_current_snapshot(options["directory"])):
+            self.stdout.write("Snapshot is already current.")
+            return
+        version = build_snapshot(options["directory"])
+        self.stdout.write(self.style.SUCCESS(f"Snapshot {version} is current in {options['directory']}"))
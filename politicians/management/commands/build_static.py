@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from politicians.static_site import STATIC_SITE_DIR, build_static_site
+
+class Command(BaseCommand):
+    help = "Render the dashboard, analysis, graph and politician pages to a static HTML site."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", "-o", default = STATIC_SITE_DIR, help = "Output directory.")
+        parser.add_argument("--workers", type = int, help = "Number of worker processes (defaults to the CPU count).")
+        parser.add_argument("--force", action = "store_true", help = "Render every page, not only changed ones.")
+
+    def handle(self, *args, **options):
+        rendered, removed, failed = build_static_site(
+            directory = options["output"],
+            workers = options["workers"],
+            force = options["force"],
+            log = self.stdout.write,
+        )
+        message = f"Rendered {rendered} page(s) and removed {removed} to {options['output']}."
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{message} {failed} page(s) failed."))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
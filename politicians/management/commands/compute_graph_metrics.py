@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from politicians.metrics import refresh_metrics
+from politicians.models import PoliticianRecord, Province
+
+class Command(BaseCommand):
+    help = "Compute network metrics (degree, centrality, component size) for every province-year kinship graph."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type = int, help = "Number of worker processes (defaults to the CPU count).")
+        parser.add_argument("--force", action = "store_true", help = "Recompute every province-year, not only changed ones.")
+        parser.add_argument("--province", help = "Only refresh this province.")
+        parser.add_argument("--year", type = int, help = "Only refresh this year.")
+
+    def handle(self, *args, **options):
+        partitions = None
+        if options["province"] or options["year"]:
+            provinces = Province.objects.all()
+            if options["province"]:
+                provinces = provinces.filter(name = options["province"])
+            years = [options["year"]] if options["year"] else [year for year, _ in PoliticianRecord.year_choices]
+            partitions = {(province_id, year) for province_id in provinces.values_list("id", flat = True) for year in years}
+        count = refresh_metrics(
+            workers = options["workers"],
+            force = options["force"],
+            partitions = partitions,
+            log = self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Refreshed network metrics for {count} province-year(s)."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from province.significance import SIGNIFICANCE_PERMUTATIONS, compute_all_significance
+
+class Command(BaseCommand):
+    help = "Run the dynasty concentration permutation test for every province-year and store the p-values."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type = int, help = "Number of worker processes (defaults to the CPU count).")
+        parser.add_argument("--permutations", type = int, default = SIGNIFICANCE_PERMUTATIONS, help = "Shuffles per province-year.")
+
+    def handle(self, *args, **options):
+        count = compute_all_significance(
+            workers = options["workers"],
+            permutations = options["permutations"],
+            log = self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Tested {count} province-year(s)."))
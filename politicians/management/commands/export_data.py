@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from politicians.export import iter_rows, stream_csv, stream_parquet
+
+class Command(BaseCommand):
+    help = "Export politicians or politician records as CSV or Parquet, streaming from the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices = ["politicians", "records"])
+        parser.add_argument("--format", choices = ["csv", "parquet"], default = "csv")
+        parser.add_argument("--output", "-o", help = "Output file (defaults to stdout for CSV).")
+        parser.add_argument("--province")
+        parser.add_argument("--year", type = int)
+        parser.add_argument("--position")
+        parser.add_argument("--community", type = int)
+
+    def handle(self, *args, **options):
+        headers, rows = iter_rows(
+            options["kind"],
+            province = options["province"],
+            year = options["year"],
+            position = options["position"],
+            community = options["community"],
+        )
+        if options["format"] == "parquet":
+            if not options["output"]:
+                self.stderr.write("Parquet exports need --output.")
+                return
+            with open(options["output"], "wb") as f:
+                for chunk in stream_parquet(headers, rows):
+                    f.write(chunk)
+        elif options["output"]:
+            with open(options["output"], "w", newline = "", encoding = "utf-8") as f:
+                for line in stream_csv(headers, rows):
+                    f.write(line)
+        else:
+            for line in stream_csv(headers, rows):
+                self.stdout.write(line, ending = "")
+        if options["output"]:
+            self.stdout.write(self.style.SUCCESS(f"Exported {options['kind']} to {options['output']}"))
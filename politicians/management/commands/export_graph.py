@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+import sys
+from politicians.graph_export import GRAPH_FORMATS, stream_graph
+from politicians.reference import get_reference
+from politicians.relations import get_weight_profile
+
+class Command(BaseCommand):
+    help = "Export the kinship graphs as GraphML, GEXF or an edge list, one province at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices = list(GRAPH_FORMATS), default = "graphml")
+        parser.add_argument("--output", "-o", help = "Output file (defaults to stdout).")
+        parser.add_argument("--province")
+        parser.add_argument("--year", type = int)
+        parser.add_argument("--profile", help = "Weight profile (see WEIGHT_PROFILES).")
+        parser.add_argument("--compress", action = "store_true", help = "Gzip the output.")
+
+    def handle(self, *args, **options):
+        if options["province"] and get_reference().province_id(options["province"]) is None:
+            raise CommandError(f"Unknown province: {options['province']}")
+        chunks = stream_graph(
+            options["format"],
+            compress = options["compress"],
+            province = options["province"],
+            year = options["year"],
+            profile = get_weight_profile(options["profile"]),
+        )
+        if options["output"]:
+            with open(options["output"], "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            self.stdout.write(self.style.SUCCESS(f"Exported the {options['format']} graph to {options['output']}"))
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.flush()
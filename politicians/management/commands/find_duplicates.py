@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from politicians.duplicates import DEFAULT_MIN_SCORE, find_duplicates, merge_politicians
+from politicians.models import Politician
+
+class Command(BaseCommand):
+    help = "List probable duplicate politicians (spelling variants, missing middle names) and optionally merge them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--min-score", type = float, default = DEFAULT_MIN_SCORE, help = "Only report pairs scoring at least this much (0 to 1).")
+        parser.add_argument("--limit", type = int, help = "Report at most this many pairs.")
+        parser.add_argument("--merge", action = "store_true", help = "Merge every reported pair into the politician with more records.")
+        parser.add_argument("--keep", help = "Slug of a politician to merge --duplicate into, instead of scanning.")
+        parser.add_argument("--duplicate", action = "append", default = [], help = "Slug of a duplicate of --keep (repeatable).")
+
+    def handle(self, *args, **options):
+        if options["keep"]:
+            try:
+                keep = Politician.objects.get(slug = options["keep"])
+                duplicates = [Politician.objects.get(slug = slug) for slug in options["duplicate"]]
+            except Politician.DoesNotExist as error:
+                raise CommandError(error)
+            moved = merge_politicians(keep, duplicates)
+            self.stdout.write(self.style.SUCCESS(f"Moved {moved} record(s) to {keep.slug}."))
+            return
+
+        pairs = find_duplicates(options["min_score"])[:options["limit"]]
+        for pair in pairs:
+            self.stdout.write(f"{pair['score']:.3f}  {pair['keep']}  <-  {pair['duplicate']}")
+        self.stdout.write(self.style.SUCCESS(f"Found {len(pairs)} probable duplicate(s)."))
+
+        if options["merge"]:
+            merged = set()
+            for pair in pairs:
+                # A politician merged away earlier in the run cannot be merged again
+                if pair["keep"] in merged or pair["duplicate"] in merged:
+                    continue
+                keep = Politician.objects.get(slug = pair["keep"])
+                duplicate = Politician.objects.get(slug = pair["duplicate"])
+                merge_politicians(keep, [duplicate])
+                merged.add(pair["duplicate"])
+            self.stdout.write(self.style.SUCCESS(f"Merged {len(merged)} politician(s)."))
@@ -0,0 +1,74 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+import json
+from politicians.loadtest import SCENARIOS, Sample, compare, generate_dataset, run_load, start_server, summarize
+from politicians.models import Politician
+
+class Command(BaseCommand):
+    help = (
+        "Replay browsing scenarios (search, politician detail, province switching, graph viewing) "
+        "from concurrent virtual users and report throughput, latency percentiles and error rate per endpoint. "
+        "Run it against a generated dataset: ELECTIONS_DB=/tmp/load.sqlite3 python manage.py load_test --generate 5000"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--generate", type = int, metavar = "POLITICIANS", help = "Migrate and fill an empty database with this many synthetic politicians first.")
+        parser.add_argument("--url", help = "Test a running server (e.g. gunicorn) instead of an in-process threaded WSGI server.")
+        parser.add_argument("--users", type = int, default = 8, help = "Concurrent virtual users.")
+        parser.add_argument("--duration", type = float, default = 30, help = "Seconds to run.")
+        parser.add_argument("--think-time", type = float, default = 0, help = "Average pause between a user's requests, in seconds.")
+        parser.add_argument("--scenario", action = "append", choices = list(SCENARIOS), help = "Only replay these scenarios (repeatable).")
+        parser.add_argument("--seed", type = int, default = 0)
+        parser.add_argument("--output", "-o", help = "Write the summary as JSON (to use as a later --baseline).")
+        parser.add_argument("--baseline", help = "Summary JSON of an earlier run to compare against.")
+        parser.add_argument("--tolerance", type = float, default = 0.2, help = "Allowed p95/throughput regression against the baseline (0.2 = 20%%).")
+
+    def handle(self, *args, **options):
+        if options["generate"]:
+            call_command("migrate", verbosity = 0)
+            if Politician.objects.exists():
+                raise CommandError("The database already has politicians; point ELECTIONS_DB at a new file to generate a dataset.")
+            politicians, records = generate_dataset(options["generate"], seed = options["seed"])
+            self.stdout.write(f"Generated {politicians} politicians and {records} records.")
+        try:
+            sample = Sample()
+        except ValueError as error:
+            raise CommandError(f"{error} Use --generate to create a dataset.")
+
+        server = None
+        base_url = options["url"]
+        if not base_url:
+            server, base_url = start_server()
+        self.stdout.write(f"{options['users']} users for {options['duration']:g}s against {base_url} ...")
+        try:
+            results, elapsed = run_load(
+                base_url.rstrip("/"), sample,
+                users = options["users"],
+                duration = options["duration"],
+                scenarios = options["scenario"],
+                seed = options["seed"],
+                think_time = options["think_time"],
+            )
+        finally:
+            if server:
+                server.shutdown()
+                server.server_close()
+
+        summary = summarize(results, elapsed)
+        self.stdout.write(f"{'endpoint':<24}{'requests':>10}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}")
+        for endpoint, row in summary.items():
+            self.stdout.write(
+                f"{endpoint:<24}{row['requests']:>10}{row['throughput']:>9.2f}{row['p50']:>10.1f}"
+                f"{row['p95']:>10.1f}{row['p99']:>10.1f}{row['error_rate']:>9.2%}"
+            )
+        if options["output"]:
+            with open(options["output"], "w", encoding = "utf-8") as f:
+                json.dump(summary, f, indent = 2)
+        if options["baseline"]:
+            with open(options["baseline"], encoding = "utf-8") as f:
+                regressions = compare(summary, json.load(f), options["tolerance"])
+            if regressions:
+                for regression in regressions:
+                    self.stdout.write(self.style.ERROR(regression))
+                raise CommandError(f"{len(regressions)} regression(s) against {options['baseline']}.")
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['baseline']}."))
@@ -0,0 +1,130 @@
+import networkx as nx
+from django.db import transaction
+
+from .changes import partition_versions
+from .graph import generate_adjacency_matrices, generate_adjacency_matrix
+from .models import NetworkMetricRun, PoliticianNetworkMetric, Province
+from .workers import process_pool
+
+# Exact betweenness is O(n * m); sample pivots on very large provinces
+BETWEENNESS_SAMPLE_SIZE = 500
+
+def compute_metrics(province, year):
+    """Per-politician network metrics for one province-year kinship graph"""
+    am_df, _, name_data = generate_adjacency_matrix(province, year)
+    return metrics_from_matrix(am_df, name_data)
+
+def compute_province_metrics(province, years):
+    """Metrics of several years of a province, from one batched relation matrix"""
+    return {
+        year: metrics_from_matrix(am_df, name_data)
+        for year, (am_df, _, name_data) in generate_adjacency_matrices(province, years).items()
+    }
+
+def metrics_from_matrix(am_df, name_data):
+    if am_df.empty:
+        return []
+
+    G = nx.from_pandas_adjacency(am_df)
+    n = G.number_of_nodes()
+    degree = (am_df > 0).sum(axis = 1)
+    weighted_degree = am_df.sum(axis = 1)
+    degree_centrality = nx.degree_centrality(G)
+    betweenness = nx.betweenness_centrality(
+        G, k = BETWEENNESS_SAMPLE_SIZE if n > BETWEENNESS_SAMPLE_SIZE else None, seed = 0
+    )
+    component_size = {}
+    for component in nx.connected_components(G):
+        for node in component:
+            component_size[node] = len(component)
+
+    return [
+        {
+            "politician_id": int(name_data[slug]["Politician ID"]),
+            "degree": int(degree[slug]),
+            "weighted_degree": float(weighted_degree[slug]),
+            "degree_centrality": degree_centrality[slug],
+            "betweenness_centrality": betweenness[slug],
+            "component_size": component_size[slug],
+        }
+        for slug in am_df.index
+    ]
+
+def partition_fingerprints():
+    """
+    Fingerprint of the inputs of every (province id, year) graph: its data version
+    from the change log. A partition whose fingerprint changed needs its metrics refreshed.
+    """
+    return {key: str(version) for key, version in partition_versions().items()}
+
+def stale_partitions(fingerprints, force = False):
+    if force:
+        return sorted(fingerprints)
+    stored = {
+        (province_id, year): fingerprint
+        for province_id, year, fingerprint in NetworkMetricRun.objects.values_list("province_id", "year", "fingerprint")
+    }
+    return sorted(key for key, fingerprint in fingerprints.items() if stored.get(key) != fingerprint)
+
+def _compute_province(province_id, years):
+    # Runs in a worker process: each worker opens its own database connection.
+    province = Province.objects.get(id = province_id)
+    return province_id, compute_province_metrics(province.name, years)
+
+@transaction.atomic
+def store_metrics(province_id, year, rows, fingerprint):
+    PoliticianNetworkMetric.objects.filter(province_id = province_id, year = year).delete()
+    PoliticianNetworkMetric.objects.bulk_create(
+        [PoliticianNetworkMetric(province_id = province_id, year = year, **row) for row in rows],
+        batch_size = 1000,
+    )
+    NetworkMetricRun.objects.update_or_create(
+        province_id = province_id, year = year, defaults = {"fingerprint": fingerprint}
+    )
+
+def refresh_metrics(workers = None, force = False, partitions = None, log = None):
+    """
+    Recompute metrics for every partition whose records changed since the last run.
+    Graphs are computed in parallel worker processes; the main process does all writes.
+    """
+    fingerprints = partition_fingerprints()
+    todo = stale_partitions(fingerprints, force)
+    if partitions is not None:
+        todo = [key for key in todo if key in partitions]
+
+    # Partitions that no longer have any record lose their metrics
+    for run in NetworkMetricRun.objects.all():
+        if (run.province_id, run.year) not in fingerprints:
+            PoliticianNetworkMetric.objects.filter(province_id = run.province_id, year = run.year).delete()
+            run.delete()
+
+    if not todo:
+        return 0
+
+    # Every stale year of a province is computed by the same worker, from one relation matrix
+    province_years = {}
+    for province_id, year in todo:
+        province_years.setdefault(province_id, []).append(year)
+
+    with process_pool(workers) as executor:
+        futures = [executor.submit(_compute_province, province_id, years) for province_id, years in province_years.items()]
+        for future in futures:
+            province_id, metrics = future.result()
+            for year, rows in metrics.items():
+                store_metrics(province_id, year, rows, fingerprints[(province_id, year)])
+                if log:
+                    log(f"Computed {len(rows)} metrics for province {province_id} ({year})")
+    return len(todo)
+
+def most_connected(province, year, limit = 10):
+    return (
+        PoliticianNetworkMetric.objects
+        .filter(province__name = province, year = year, degree__gt = 0)
+        .select_related("politician")
+        .order_by("-weighted_degree", "-degree")[:limit]
+    )
+
+def metrics_version():
+    """Time of the latest metrics refresh, for cache validators of pages that show metrics"""
+    latest = NetworkMetricRun.objects.order_by("-computed_at").values_list("computed_at", flat = True).first()
+    return latest.timestamp() if latest else 0
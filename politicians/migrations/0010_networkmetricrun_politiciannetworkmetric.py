@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('politicians', '0009_alter_politicianrecord_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NetworkMetricRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField(choices=[(2004, 2004), (2007, 2007), (2010, 2010), (2013, 2013), (2016, 2016), (2019, 2019), (2022, 2022)])),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('province', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='politicians.province')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('province', 'year'), name='unique_network_metric_run')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PoliticianNetworkMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField(choices=[(2004, 2004), (2007, 2007), (2010, 2010), (2013, 2013), (2016, 2016), (2019, 2019), (2022, 2022)])),
+                ('degree', models.IntegerField()),
+                ('weighted_degree', models.FloatField()),
+                ('degree_centrality', models.FloatField()),
+                ('betweenness_centrality', models.FloatField()),
+                ('component_size', models.IntegerField()),
+                ('politician', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='politicians.politician')),
+                ('province', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='politicians.province')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['province', 'year', '-weighted_degree'], name='network_metric_ranking')],
+                'constraints': [models.UniqueConstraint(fields=('politician', 'province', 'year'), name='unique_network_metric')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('politicians', '0010_networkmetricrun_politiciannetworkmetric'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='politician',
+            index=models.Index(fields=['last_name', 'middle_name'], name='politician_last_middle'),
+        ),
+        migrations.AddIndex(
+            model_name='politician',
+            index=models.Index(fields=['first_name', 'last_name'], name='politician_first_last'),
+        ),
+        migrations.AddIndex(
+            model_name='politicianrecord',
+            index=models.Index(fields=['province', 'year'], name='record_province_year'),
+        ),
+        migrations.AddIndex(
+            model_name='politicianrecord',
+            index=models.Index(fields=['year', 'position'], name='record_year_position'),
+        ),
+    ]
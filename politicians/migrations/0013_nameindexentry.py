@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_name_index(apps, schema_editor):
+    NameIndexEntry = apps.get_model("politicians", "NameIndexEntry")
+    PoliticianRecord = apps.get_model("politicians", "PoliticianRecord")
+    entries = set()
+    rows = PoliticianRecord.objects.values_list(
+        "politician_id", "politician__last_name", "politician__middle_name", "province_id", "year"
+    )
+    for politician_id, last_name, middle_name, province_id, year in rows.iterator(chunk_size=5000):
+        for name, role in ((last_name, "LAST"), (middle_name, "MIDDLE")):
+            if name:
+                entries.add((name, role, politician_id, province_id, year))
+    NameIndexEntry.objects.bulk_create(
+        [
+            NameIndexEntry(name=name, role=role, politician_id=politician_id, province_id=province_id, year=year)
+            for name, role, politician_id, province_id, year in entries
+        ],
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('politicians', '0012_datachange_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NameIndexEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('role', models.CharField(choices=[('LAST', 'LAST'), ('MIDDLE', 'MIDDLE')], max_length=10)),
+                ('year', models.IntegerField(choices=[(2004, 2004), (2007, 2007), (2010, 2010), (2013, 2013), (2016, 2016), (2019, 2019), (2022, 2022)])),
+                ('politician', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='politicians.politician')),
+                ('province', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='politicians.province')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['politician'], name='name_index_politician')],
+                'constraints': [models.UniqueConstraint(fields=('name', 'role', 'politician', 'province', 'year'), name='unique_name_index_entry')],
+            },
+        ),
+        migrations.RunPython(build_name_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('politicians', '0013_nameindexentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SignificanceRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField(choices=[(2004, 2004), (2007, 2007), (2010, 2010), (2013, 2013), (2016, 2016), (2019, 2019), (2022, 2022)])),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('results', models.JSONField(default=list)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('province', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='politicians.province')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('province', 'year'), name='unique_significance_run')],
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Avg, Case, Count, Sum, Value, When
 from django.utils.text import slugify
 
 # Create your models here.
@@ -32,6 +33,12 @@ class Politician(models.Model):
     middle_name = models.CharField(max_length = 100, blank = True, null = True)
     slug = models.SlugField(unique = True, max_length = 300)
 
+    class Meta:
+        indexes = [
+            models.Index(fields = ["last_name", "middle_name"], name = "politician_last_middle"),
+            models.Index(fields = ["first_name", "last_name"], name = "politician_first_last"),
+        ]
+
     # Uppercase for consistency
     def save(self, *args, **kwargs):
         if self.first_name:
@@ -51,6 +58,20 @@ class Politician(models.Model):
         name_parts.append(self.last_name)
         return " ".join(name_parts)
 
+class PoliticianRecordQuerySet(models.QuerySet):
+    def with_position_weight(self):
+        """Annotate each record with its position weight, computed by the database"""
+        return self.annotate(weight = PoliticianRecord.position_weight_expression())
+
+    def community_stats(self):
+        """One row per community: size, summed and average position weight (a single GROUP BY)"""
+        return (
+            self.with_position_weight()
+            .values("community")
+            .annotate(size = Count("id"), weighted_size = Sum("weight"), avg_weight = Avg("weight"))
+            .order_by("community")
+        )
+
 class PoliticianRecord(models.Model):
     politician = models.ForeignKey(Politician, on_delete = models.CASCADE)
     region = models.ForeignKey(Region, on_delete = models.PROTECT, null = True, blank = True)
@@ -73,6 +94,12 @@ class PoliticianRecord(models.Model):
     year = models.IntegerField(choices = year_choices)
 
     community = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields = ["province", "year"], name = "record_province_year"),
+            models.Index(fields = ["year", "position"], name = "record_year_position"),
+        ]
     
     position_weight_dict = {
         'COUNCILOR' : 2,
@@ -84,8 +111,127 @@ class PoliticianRecord(models.Model):
         'GOVERNOR' : 5
     }
     
+    objects = PoliticianRecordQuerySet.as_manager()
+
     def position_weight(self):
         return self.position_weight_dict.get(self.position, 0)
 
+    @classmethod
+    def position_weight_expression(cls):
+        # SQL version of position_weight(), generated from the same dict
+        return Case(
+            *[When(position = position, then = Value(weight)) for position, weight in cls.position_weight_dict.items()],
+            default = Value(0),
+            output_field = models.IntegerField(),
+        )
+
     def __str__(self):
         return f"Politician {self.politician}: {self.position} of {self.province}, {self.region} in {self.year}..."
+
+class PoliticianNetworkMetric(models.Model):
+    politician = models.ForeignKey(Politician, on_delete = models.CASCADE)
+    province = models.ForeignKey(Province, on_delete = models.CASCADE)
+    year = models.IntegerField(choices = PoliticianRecord.year_choices)
+
+    # Computed from the kinship graph of the province-year (see metrics.py)
+    degree = models.IntegerField()
+    weighted_degree = models.FloatField()
+    degree_centrality = models.FloatField()
+    betweenness_centrality = models.FloatField()
+    component_size = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields = ["politician", "province", "year"], name = "unique_network_metric"),
+        ]
+        indexes = [
+            models.Index(fields = ["province", "year", "-weighted_degree"], name = "network_metric_ranking"),
+        ]
+
+    def __str__(self):
+        return f"Network metrics of {self.politician} in {self.province} ({self.year})"
+
+class NetworkMetricRun(models.Model):
+    province = models.ForeignKey(Province, on_delete = models.CASCADE)
+    year = models.IntegerField(choices = PoliticianRecord.year_choices)
+    fingerprint = models.CharField(max_length = 64)
+    computed_at = models.DateTimeField(auto_now = True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields = ["province", "year"], name = "unique_network_metric_run"),
+        ]
+
+    def __str__(self):
+        return f"Network metrics run for {self.province} ({self.year})"
+
+class SignificanceRun(models.Model):
+    """Permutation test results of a province-year (see province/significance.py)"""
+    province = models.ForeignKey(Province, on_delete = models.CASCADE)
+    year = models.IntegerField(choices = PoliticianRecord.year_choices)
+    # Data version of the province-year and number of permutations the results were computed with
+    fingerprint = models.CharField(max_length = 64)
+    results = models.JSONField(default = list)
+    computed_at = models.DateTimeField(auto_now = True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields = ["province", "year"], name = "unique_significance_run"),
+        ]
+
+    def __str__(self):
+        return f"Significance run for {self.province} ({self.year})"
+
+class DataVersion(models.Model):
+    # "global", or "<province id>:<year>" for a single province-year partition
+    key = models.CharField(max_length = 50, unique = True)
+    province = models.ForeignKey(Province, on_delete = models.CASCADE, null = True, blank = True)
+    year = models.IntegerField(null = True, blank = True)
+    version = models.BigIntegerField(default = 0)
+
+    def __str__(self):
+        return f"{self.key}: version {self.version}"
+
+class DataChange(models.Model):
+    action_choices = [
+        ("CREATE", "CREATE"),
+        ("UPDATE", "UPDATE"),
+        ("DELETE", "DELETE"),
+    ]
+    # Global data version right after this change
+    version = models.BigIntegerField(db_index = True)
+    model = models.CharField(max_length = 50)
+    object_id = models.BigIntegerField(null = True, blank = True)
+    action = models.CharField(max_length = 10, choices = action_choices)
+    province = models.ForeignKey(Province, on_delete = models.SET_NULL, null = True, blank = True)
+    year = models.IntegerField(null = True, blank = True)
+    changed_at = models.DateTimeField(auto_now_add = True)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"{self.action} {self.model} {self.object_id} (version {self.version})"
+
+class NameIndexEntry(models.Model):
+    """Inverted index: a last or middle name -> the politicians bearing it, with their provinces and years"""
+    role_choices = [
+        ("LAST", "LAST"),
+        ("MIDDLE", "MIDDLE"),
+    ]
+    name = models.CharField(max_length = 100)
+    role = models.CharField(max_length = 10, choices = role_choices)
+    politician = models.ForeignKey(Politician, on_delete = models.CASCADE)
+    province = models.ForeignKey(Province, on_delete = models.CASCADE)
+    year = models.IntegerField(choices = PoliticianRecord.year_choices)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields = ["name", "role", "politician", "province", "year"], name = "unique_name_index_entry"),
+        ]
+        indexes = [
+            models.Index(fields = ["politician"], name = "name_index_politician"),
+        ]
+
+    def __str__(self):
+        return f"{self.role} {self.name}: politician {self.politician_id} in {self.province_id} ({self.year})"
@@ -0,0 +1,46 @@
+from django.conf import settings
+import json
+import os
+
+FEATURED_POLITICIAN_SLUGS = [
+    "francisco-moreno-domagoso",
+    "ma_josefina-go-belmonte",
+    "datu_andal-uy-ampatuan",
+    "stephany-uy-tan",
+    "ma_theresa-bonoan_david",
+]
+
+# slug -> (file modification time, parsed JSON)
+_profile_cache = {}
+
+def profile_json_path(slug):
+    return os.path.join(settings.BASE_DIR, f"politicians/json_data/{slug}.json")
+
+def profile_mtime(slug):
+    """Modification time of a featured profile, 0 for politicians without one"""
+    if slug not in FEATURED_POLITICIAN_SLUGS:
+        return 0
+    try:
+        return os.stat(profile_json_path(slug)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+def load_featured_profile(slug):
+    """
+    Extra information for featured politicians based on JSON files.
+    Each file is parsed once per process and re-read only when its mtime changes.
+    """
+    if slug not in FEATURED_POLITICIAN_SLUGS:
+        return {}
+    json_path = profile_json_path(slug)
+    try:
+        mtime = os.stat(json_path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    cached = _profile_cache.get(slug)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(json_path, "r", encoding = "utf-8") as f:
+        extra_info = json.load(f)
+    _profile_cache[slug] = (mtime, extra_info)
+    return extra_info
@@ -0,0 +1,65 @@
+from django.conf import settings
+import time
+from .changes import REFERENCE_KEY, bump_version, key_version
+from .models import PoliticianRecord, Province, Region
+
+DEFAULT_YEARS = [year for year, _ in PoliticianRecord.year_choices]
+# Seconds between two checks of the reference version written by other processes
+REFERENCE_CHECK_INTERVAL = getattr(settings, "REFERENCE_CHECK_INTERVAL", 5)
+
+class ReferenceData:
+    """Regions, provinces and election years, loaded in three queries"""
+    def __init__(self, version):
+        self.version = version
+        self.regions = {region.id: region for region in Region.objects.order_by("name")}
+        self.provinces = {province.id: province for province in Province.objects.order_by("name")}
+        self.region_provinces = {region_id: set() for region_id in self.regions}
+        for province in self.provinces.values():
+            province.region = self.regions[province.region_id]
+            self.region_provinces[province.region_id].add(province.id)
+        self.years = list(
+            PoliticianRecord.objects.order_by("year").values_list("year", flat = True).distinct()
+        ) or DEFAULT_YEARS
+
+    @property
+    def province_names(self):
+        return [province.name for province in self.provinces.values()]
+
+    @property
+    def region_names(self):
+        return [region.name for region in self.regions.values()]
+
+    def province_id(self, name):
+        for province in self.provinces.values():
+            if province.name == name:
+                return province.id
+        return None
+
+    def is_valid_pair(self, region, province):
+        if region is None:
+            return True
+        return province.id in self.region_provinces.get(region.id, ())
+
+_reference = None
+_checked_at = 0.0
+
+def get_reference():
+    """
+    Reference data for this process, without a query on most calls. A change in this
+    process (invalidate_reference(), from the signals) reloads it at once; a change in
+    another process is seen through the version in the database, which is checked at
+    most once every REFERENCE_CHECK_INTERVAL seconds.
+    """
+    global _reference, _checked_at
+    now = time.monotonic()
+    if _reference is None or now - _checked_at >= REFERENCE_CHECK_INTERVAL:
+        version = key_version(REFERENCE_KEY)
+        if _reference is None or _reference.version != version:
+            _reference = ReferenceData(version)
+        _checked_at = now
+    return _reference
+
+def invalidate_reference():
+    global _reference
+    _reference = None
+    bump_version(REFERENCE_KEY)
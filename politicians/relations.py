@@ -0,0 +1,228 @@
+from django.conf import settings
+from django.core.cache import cache
+import numpy as np
+import pandas as pd
+from .changes import data_version
+from .models import PoliticianRecord
+from .reference import get_reference
+
+RELATION_CACHE_TIMEOUT = getattr(settings, "RELATION_CACHE_TIMEOUT", 60 * 60 * 24)
+
+# Relation of a pair of politicians, in the order the consanguinity rules are checked
+NO_RELATION = 0
+SAME_LAST_MIDDLE = 1
+SAME_LAST = 2
+CROSS = 3
+SAME_MIDDLE = 4
+
+RELATION_NAMES = {
+    SAME_LAST_MIDDLE: "same_last_middle",
+    SAME_LAST: "same_last",
+    CROSS: "cross",
+    SAME_MIDDLE: "same_middle",
+}
+
+# Consanguinity 1, 2, 3+ and shared middle name
+DEFAULT_FACTORS = {
+    "same_last_middle": 1,
+    "same_last": 3 / 4,
+    "cross": 2 / 4,
+    "same_middle": 1 / 4,
+}
+
+# Named alternatives to the default weights; only the overridden values need to be given
+WEIGHT_PROFILES = getattr(settings, "WEIGHT_PROFILES", {
+    "default": {"label": "Default"},
+    "equal_positions": {
+        "label": "Equal positions",
+        "positions": {position: 1 for position in PoliticianRecord.position_weight_dict},
+    },
+    "surname_only": {
+        "label": "Surname only",
+        "factors": {"cross": 0, "same_middle": 0},
+    },
+    "maternal_line": {
+        "label": "Maternal line",
+        "factors": {"same_last": 2 / 4, "cross": 3 / 4, "same_middle": 2 / 4},
+    },
+})
+
+class WeightProfile:
+    """Position weights and consanguinity factors used to turn relations into edge weights"""
+    def __init__(self, name = "custom", label = "Custom", positions = None, factors = None):
+        self.name = name
+        self.label = label
+        self.positions = {**PoliticianRecord.position_weight_dict, **(positions or {})}
+        self.factors = {**DEFAULT_FACTORS, **(factors or {})}
+
+    @property
+    def is_default(self):
+        return self.positions == PoliticianRecord.position_weight_dict and self.factors == DEFAULT_FACTORS
+
+    def factor_vector(self):
+        """Factor of every relation code, indexable by the codes"""
+        vector = np.zeros(len(RELATION_NAMES) + 1)
+        for code, name in RELATION_NAMES.items():
+            vector[code] = self.factors[name]
+        return vector
+
+    def position_weights(self, positions):
+        return np.array([self.positions.get(position, 0) for position in positions], dtype = float)
+
+    def as_dict(self):
+        return {"name": self.name, "label": self.label, "positions": self.positions, "factors": self.factors}
+
+def get_weight_profile(name = None, overrides = None):
+    """
+    A named profile (the default one when the name is unknown), with optional overrides
+    given as {"factor_<relation>": value, "weight_<POSITION>": value}.
+    """
+    if name not in WEIGHT_PROFILES:
+        name = "default"
+    config = WEIGHT_PROFILES[name]
+    positions = dict(config.get("positions", {}))
+    factors = dict(config.get("factors", {}))
+    label = config.get("label", name)
+    for key, value in (overrides or {}).items():
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            continue
+        if key.startswith("factor_") and key[7:] in DEFAULT_FACTORS:
+            factors[key[7:]] = value
+        elif key.startswith("weight_") and key[7:] in PoliticianRecord.position_weight_dict:
+            positions[key[7:]] = value
+        else:
+            continue
+        name, label = "custom", "Custom"
+    return WeightProfile(name, label, positions, factors)
+
+def encode_names(last_names, middle_names):
+    """
+    Last and middle names encoded against one vocabulary (NULLs get a code of their own),
+    plus whether each middle name counts for the rules (is not empty).
+    """
+    n = len(last_names)
+    codes, uniques = pd.factorize(
+        pd.Series(list(last_names) + list(middle_names), dtype = object), use_na_sentinel = False
+    )
+    last, middle = codes[:n], codes[n:]
+    empty = np.flatnonzero(uniques == "")
+    has_middle = middle != (empty[0] if len(empty) else -1)
+    return last, middle, has_middle
+
+def relation_codes(last, middle, has_middle, i, j):
+    """Relation code of the pairs (i[k], j[k]) of encoded names, by the consanguinity rules"""
+    same_last = last[i] == last[j]
+    same_middle = middle[i] == middle[j]
+    cross = has_middle[i] & ((last[i] == middle[j]) | (middle[i] == last[j]))
+    return np.select(
+        [same_last & same_middle, same_last, cross, same_middle & has_middle[i]],
+        [SAME_LAST_MIDDLE, SAME_LAST, CROSS, SAME_MIDDLE],
+        NO_RELATION,
+    ).astype(np.uint8)
+
+def compute_relations(last_names, middle_names):
+    """
+    Relation code of every pair i < j, as a condensed uint8 vector in np.triu_indices order.
+    Vectorized version of the consanguinity rules (same semantics, including NULL middle names).
+    """
+    last, middle, has_middle = encode_names(last_names, middle_names)
+    i, j = np.triu_indices(len(last), k = 1)
+    return relation_codes(last, middle, has_middle, i, j)
+
+def name_block_pairs(last, middle, has_middle):
+    """
+    Every pair i < j of encoded names sharing a name, found by blocking on the names:
+    each name is a block holding the politicians with it as last or (counting) middle name.
+    Pairs outside these blocks have no relation, so only the blocks are compared.
+    """
+    n = len(last)
+    # An empty middle name only matters when it equals someone's last name
+    counted = has_middle | np.isin(middle, last)
+    people = np.concatenate([np.arange(n), np.flatnonzero(counted)])
+    names = np.concatenate([last, middle[counted]])
+    order = np.argsort(names, kind = "stable")
+    people, names = people[order], names[order]
+    starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]])
+    pairs = []
+    for block in np.split(people, starts[1:]):
+        block = np.unique(block)
+        if len(block) > 1:
+            a, b = np.triu_indices(len(block), k = 1)
+            pairs.append(block[a] * n + block[b])
+    # A pair sharing more than one name is found in each of their blocks
+    pairs = np.unique(np.concatenate(pairs)) if pairs else np.empty(0, dtype = np.int64)
+    return pairs // n, pairs % n
+
+def block_relations(names, pairs, index):
+    """
+    Full relation matrix of the politicians at positions index of the encoded names
+    (encode_names()), from their name_block_pairs(). Equal to expanding compute_relations()
+    of those politicians alone: pairs are oriented by their order in index.
+    """
+    last, middle, has_middle = (column[index] for column in names)
+    local = np.full(len(names[0]), -1)
+    local[index] = np.arange(len(index))
+    a, b = local[pairs[0]], local[pairs[1]]
+    kept = (a >= 0) & (b >= 0)
+    i, j = np.minimum(a[kept], b[kept]), np.maximum(a[kept], b[kept])
+    matrix = np.zeros((len(index), len(index)), dtype = np.uint8)
+    matrix[i, j] = matrix[j, i] = relation_codes(last, middle, has_middle, i, j)
+    return matrix
+
+def pair_relation(last_a, middle_a, last_b, middle_b):
+    """Relation code of a single pair, by the same rules as compute_relations() (a playing i, b playing j)"""
+    if last_a == last_b and middle_a == middle_b:
+        return SAME_LAST_MIDDLE
+    if last_a == last_b:
+        return SAME_LAST
+    if middle_a != "" and (last_a == middle_b or middle_a == last_b):
+        return CROSS
+    if middle_a == middle_b and middle_a != "":
+        return SAME_MIDDLE
+    return NO_RELATION
+
+def expand_relations(relations, n):
+    """Full symmetric n x n matrix of relation codes"""
+    matrix = np.zeros((n, n), dtype = np.uint8)
+    i, j = np.triu_indices(n, k = 1)
+    matrix[i, j] = relations
+    matrix[j, i] = relations
+    return matrix
+
+def combine(relation_matrix, positions, profile):
+    """Adjacency matrix for a weight profile: product of position weights times the relation factor"""
+    weights = profile.position_weights(positions)
+    am = np.outer(weights, weights) * profile.factor_vector()[relation_matrix]
+    # The default profile keeps the whole-number edge weights the graphs have always used;
+    # other profiles keep fractions so small factors do not round down to no edge at all
+    return am.astype(int) if profile.is_default else am
+
+def relations_cache_key(province, year):
+    province_id = get_reference().province_id(province)
+    return f"politicians:relations:{province_id}:{year}:{data_version(province_id, year)}"
+
+def store_relations(province, year, politician_ids, relation_matrix):
+    """Cache the relations of a province-year, e.g. a slice of a multi-year relation matrix"""
+    relations = relation_matrix[np.triu_indices(len(politician_ids), k = 1)]
+    cache.set(
+        relations_cache_key(province, year),
+        {"politician_ids": np.asarray(politician_ids, dtype = np.int64), "relations": relations},
+        RELATION_CACHE_TIMEOUT,
+    )
+
+def get_relations(province, year, frame):
+    """
+    Relation matrix of the politicians in frame (a load_unique_records() frame),
+    cached per partition data version so reweighting never repeats the name matching.
+    """
+    key = relations_cache_key(province, year)
+    politician_ids = np.asarray(frame["Politician ID"], dtype = np.int64)
+    cached = cache.get(key)
+    if cached is not None and np.array_equal(cached["politician_ids"], politician_ids):
+        relations = cached["relations"]
+    else:
+        relations = compute_relations(frame["Last Name"], frame["Middle Name"])
+        cache.set(key, {"politician_ids": politician_ids, "relations": relations}, RELATION_CACHE_TIMEOUT)
+    return expand_relations(relations, len(politician_ids))
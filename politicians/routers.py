@@ -0,0 +1,57 @@
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from functools import wraps
+
+READ_ONLY_DATABASE = "readonly"
+
+_read_only = ContextVar("read_only", default = False)
+
+def read_only_iterator(iterator):
+    """Run the queries of each step of an iterator (a streamed body) on the read-only connection"""
+    iterator = iter(iterator)
+    while True:
+        token = _read_only.set(True)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _read_only.reset(token)
+        yield chunk
+
+def read_only_view(view):
+    """Run a view's queries on the read-only connection (when one is configured)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = _read_only.set(True)
+        try:
+            response = view(*args, **kwargs)
+        finally:
+            _read_only.reset(token)
+        # A streamed body is evaluated after the view returns
+        if getattr(response, "streaming", False) and not getattr(response, "is_async", False):
+            response.streaming_content = read_only_iterator(response.streaming_content)
+        return response
+    return wrapper
+
+class ReadOnlyRouter:
+    """
+    Reads made inside a read_only_view go to the read-only alias, a second connection
+    to the same SQLite file opened with PRAGMA query_only. Every write goes to the
+    default connection, including saves of objects that were read on the read-only one.
+    """
+    def db_for_read(self, model, **hints):
+        if _read_only.get() and READ_ONLY_DATABASE in settings.DATABASES:
+            return READ_ONLY_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name = None, **hints):
+        return db != READ_ONLY_DATABASE
@@ -0,0 +1,81 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .changes import record_change, record_partitions
+from .kin import reindex_politician
+from .models import Politician, PoliticianRecord, Province, Region
+from .reference import get_reference, invalidate_reference
+
+@receiver([post_save, post_delete], sender = Region)
+@receiver([post_save, post_delete], sender = Province)
+def invalidate_reference_data(sender, **kwargs):
+    invalidate_reference()
+
+@receiver(post_save, sender = PoliticianRecord)
+def add_reference_year(sender, instance, **kwargs):
+    if instance.year not in get_reference().years:
+        invalidate_reference()
+
+@receiver(post_delete, sender = PoliticianRecord)
+def remove_reference_year(sender, instance, **kwargs):
+    if not PoliticianRecord.objects.filter(year = instance.year).exists():
+        invalidate_reference()
+
+# Change-data-capture: every write is logged with the (province, year) partitions it affects
+
+def action_name(created):
+    return "CREATE" if created else "UPDATE"
+
+@receiver(pre_save, sender = PoliticianRecord)
+def remember_record_partition(sender, instance, **kwargs):
+    # An update can move a record to another partition; both need invalidating
+    instance._previous_partition = None
+    instance._previous_politician_id = None
+    if instance.pk:
+        previous = PoliticianRecord.objects.filter(pk = instance.pk).values_list("province_id", "year", "politician_id").first()
+        if previous:
+            instance._previous_partition = previous[:2]
+            instance._previous_politician_id = previous[2]
+
+@receiver(post_save, sender = PoliticianRecord)
+def log_record_save(sender, instance, created, **kwargs):
+    partitions = {(instance.province_id, instance.year)}
+    if getattr(instance, "_previous_partition", None):
+        partitions.add(instance._previous_partition)
+    record_change("PoliticianRecord", instance.pk, action_name(created), partitions)
+
+@receiver(post_delete, sender = PoliticianRecord)
+def log_record_delete(sender, instance, **kwargs):
+    record_change("PoliticianRecord", instance.pk, "DELETE", {(instance.province_id, instance.year)})
+
+@receiver(post_save, sender = Politician)
+def log_politician_save(sender, instance, created, **kwargs):
+    record_change("Politician", instance.pk, action_name(created), record_partitions(instance.pk))
+
+@receiver(post_delete, sender = Politician)
+def log_politician_delete(sender, instance, **kwargs):
+    # Cascaded record deletions log their own partitions
+    record_change("Politician", instance.pk, "DELETE")
+
+@receiver(post_save, sender = Region)
+@receiver(post_save, sender = Province)
+def log_reference_save(sender, instance, created, **kwargs):
+    record_change(sender.__name__, instance.pk, action_name(created))
+
+@receiver(post_delete, sender = Region)
+@receiver(post_delete, sender = Province)
+def log_reference_delete(sender, instance, **kwargs):
+    record_change(sender.__name__, instance.pk, "DELETE")
+
+# Name index: the entries of a politician are rebuilt whenever their names or records change
+
+@receiver([post_save, post_delete], sender = PoliticianRecord)
+def reindex_record_names(sender, instance, **kwargs):
+    reindex_politician(instance.politician_id)
+    previous_politician_id = getattr(instance, "_previous_politician_id", None)
+    if previous_politician_id and previous_politician_id != instance.politician_id:
+        reindex_politician(previous_politician_id)
+
+@receiver(post_save, sender = Politician)
+def reindex_politician_names(sender, instance, created, **kwargs):
+    if not created:
+        reindex_politician(instance.pk)
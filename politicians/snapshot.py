@@ -0,0 +1,278 @@
+from django.conf import settings
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+from .changes import data_version
+from .models import PoliticianRecord
+
+SNAPSHOT_DIR = getattr(settings, "SNAPSHOT_DIR", os.path.join(settings.BASE_DIR, "snapshot"))
+
+# Only read from the snapshot when it is enabled (after running build_snapshot)
+USE_DATA_SNAPSHOT = getattr(settings, "USE_DATA_SNAPSHOT", False)
+# Replaced snapshots are kept this long for processes still opening or reading them
+SNAPSHOT_GRACE_SECONDS = getattr(settings, "SNAPSHOT_GRACE_SECONDS", 60 * 10)
+
+# Column name -> (ORM lookup, dictionary encoded?)
+COLUMNS = {
+    "record_id": ("id", False),
+    "politician_id": ("politician_id", False),
+    "year": ("year", False),
+    "community": ("community", False),
+    "slug": ("politician__slug", True),
+    "first_name": ("politician__first_name", True),
+    "middle_name": ("politician__middle_name", True),
+    "last_name": ("politician__last_name", True),
+    "position": ("position", True),
+    "party": ("party", True),
+    "province": ("province__name", True),
+    "region": ("province__region__name", True),
+}
+# Code 0 of every dictionary stands for NULL
+NULL_CODE = 0
+
+class Encoder:
+    def __init__(self):
+        self.codes = {None: NULL_CODE}
+        self.values = [""]
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+def build_snapshot(directory = SNAPSHOT_DIR, chunk_size = 5000):
+    """
+    Export every record (joined with its politician, province and region) into
+    NumPy column files with dictionary-encoded strings. The new snapshot is written
+    next to the current one and swapped in with an atomic rename of the pointer.
+    Returns the snapshot version, a digest of its contents and data version.
+    """
+    # Read the version first: a write during the export only makes the snapshot look older
+    source_version = data_version()
+    encoders = {name: Encoder() for name, (_, encoded) in COLUMNS.items() if encoded}
+    columns = {name: [] for name in COLUMNS}
+    rows = (
+        PoliticianRecord.objects
+        .order_by("id")
+        .values_list(*[lookup for lookup, _ in COLUMNS.values()])
+        .iterator(chunk_size = chunk_size)
+    )
+    for row in rows:
+        for name, value in zip(COLUMNS, row):
+            columns[name].append(encoders[name].encode(value) if name in encoders else value)
+
+    arrays = {
+        name: np.asarray(values, dtype = np.int32 if name in encoders else np.int64)
+        for name, values in columns.items()
+    }
+    dictionaries = {name: np.asarray(encoder.values, dtype = str) for name, encoder in encoders.items()}
+
+    digest = hashlib.sha256(str(source_version).encode())
+    for name in sorted(arrays):
+        digest.update(arrays[name].tobytes())
+    for name in sorted(dictionaries):
+        digest.update("\0".join(dictionaries[name]).encode())
+    version = digest.hexdigest()[:16]
+
+    os.makedirs(directory, exist_ok = True)
+    target = os.path.join(directory, version)
+    if not os.path.isdir(target):
+        staging = target + ".tmp"
+        shutil.rmtree(staging, ignore_errors = True)
+        os.makedirs(staging)
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, f"{name}.npy"), array)
+        for name, array in dictionaries.items():
+            np.save(os.path.join(staging, f"{name}.dict.npy"), array)
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump({"version": version, "data_version": source_version, "rows": int(len(arrays["record_id"]))}, f)
+        os.replace(staging, target)
+
+    # Point CURRENT at the new snapshot atomically; the replaced one starts its grace period
+    previous = current_snapshot_path(directory)
+    pointer = os.path.join(directory, "CURRENT")
+    with open(pointer + ".tmp", "w") as f:
+        f.write(version)
+    os.replace(pointer + ".tmp", pointer)
+    if previous != target and previous and os.path.isdir(previous):
+        os.utime(previous)
+    prune_snapshots(directory)
+    return version
+
+def prune_snapshots(directory = SNAPSHOT_DIR, grace = SNAPSHOT_GRACE_SECONDS):
+    """
+    Delete the snapshots replaced more than `grace` seconds ago. Other processes may
+    still be loading a snapshot they read from CURRENT just before the swap.
+    """
+    current = current_snapshot_path(directory)
+    removed = 0
+    for entry in os.listdir(directory):
+        path = os.path.join(directory, entry)
+        if path != current and os.path.isdir(path) and time.time() - os.path.getmtime(path) > grace:
+            shutil.rmtree(path, ignore_errors = True)
+            removed += 1
+    return removed
+
+def watch_snapshot(directory = SNAPSHOT_DIR, interval = 30, log = None, iterations = None):
+    """
+    Rebuild the snapshot whenever the global data version in the change log moves past
+    the one it was exported at, checking every `interval` seconds (run from a service or
+    supervisor next to the web processes). Also prunes replaced snapshots.
+    """
+    count = 0
+    while True:
+        if snapshot_is_current(load_current_snapshot(directory)):
+            prune_snapshots(directory)
+        else:
+            version = build_snapshot(directory)
+            if log:
+                log(f"Snapshot {version} built at data version {load_current_snapshot(directory).data_version}")
+        count += 1
+        if iterations is not None and count >= iterations:
+            return
+        time.sleep(interval)
+
+class SnapshotPolitician:
+    """Stand-in for Politician with the attributes the analytics code reads"""
+    __slots__ = ("id", "slug", "first_name", "middle_name", "last_name")
+
+    def __init__(self, id, slug, first_name, middle_name, last_name):
+        self.id = id
+        self.slug = slug
+        self.first_name = first_name
+        self.middle_name = middle_name
+        self.last_name = last_name
+
+    def __str__(self):
+        name_parts = [self.first_name]
+        if self.middle_name is not None:
+            name_parts.append(self.middle_name)
+        name_parts.append(self.last_name)
+        return " ".join(name_parts)
+
+class SnapshotRecord:
+    """Stand-in for PoliticianRecord with the attributes the analytics code reads"""
+    __slots__ = ("id", "politician", "position", "party", "year", "community")
+
+    def __init__(self, id, politician, position, party, year, community):
+        self.id = id
+        self.politician = politician
+        self.position = position
+        self.party = party
+        self.year = year
+        self.community = community
+
+    def position_weight(self):
+        return PoliticianRecord.position_weight_dict.get(self.position, 0)
+
+class Snapshot:
+    """Read-only, memory-mapped view of a snapshot directory"""
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.version = meta["version"]
+        # Global data version (see changes.py) the snapshot was exported at
+        self.data_version = meta.get("data_version")
+        # mmap_mode = "r" shares the pages between every worker process
+        self.columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode = "r") for name in COLUMNS}
+        self.dictionaries = {
+            name: np.load(os.path.join(path, f"{name}.dict.npy"), mmap_mode = "r")
+            for name, (_, encoded) in COLUMNS.items() if encoded
+        }
+        self.lookups = {name: {value: code for code, value in enumerate(values)} for name, values in self.dictionaries.items()}
+
+    def code(self, name, value):
+        return self.lookups[name].get(value, -1)
+
+    def decode(self, name, codes):
+        values = self.dictionaries[name][codes].astype(object)
+        values[codes == NULL_CODE] = None
+        return values
+
+    def mask(self, province = None, year = None, community = None):
+        mask = np.ones(len(self.columns["record_id"]), dtype = bool)
+        if province is not None:
+            mask &= self.columns["province"] == self.code("province", province)
+        if year is not None:
+            mask &= self.columns["year"] == year
+        if community is not None:
+            mask &= self.columns["community"] == community
+        return mask
+
+    def records_frame(self, province = None, year = None, community = None):
+        """Decoded DataFrame of the matching records, in record id order"""
+        index = np.flatnonzero(self.mask(province, year, community))
+        frame = {}
+        for name in COLUMNS:
+            codes = self.columns[name][index]
+            if name in self.dictionaries:
+                # Series of dtype object keeps NULLs as None, like the ORM does
+                frame[name] = pd.Series(self.decode(name, codes), dtype = object)
+            else:
+                frame[name] = np.asarray(codes)
+        return pd.DataFrame(frame)
+
+    def unique_records(self, province, year, community = None):
+        """First record of each politician in the province-year, shaped like graph.load_unique_records()"""
+        frame = self.records_frame(province, year)
+        frame = frame.drop_duplicates("politician_id")
+        if community is not None:
+            frame = frame[frame["community"] == community]
+        frame = frame.rename(columns = {
+            "slug": "Slug", "politician_id": "Politician ID", "last_name": "Last Name",
+            "middle_name": "Middle Name", "position": "Position", "community": "Community",
+        })
+        frame["Position Weight"] = frame["Position"].map(PoliticianRecord.position_weight_dict).fillna(0).astype(int)
+        return frame.reset_index(drop = True)
+
+    def records(self, province = None, year = None):
+        """Record stand-ins, for code written against model instances"""
+        frame = self.records_frame(province, year)
+        politicians = {}
+        records = []
+        for row in frame.itertuples(index = False):
+            politician = politicians.get(row.politician_id)
+            if politician is None:
+                politician = politicians[row.politician_id] = SnapshotPolitician(
+                    row.politician_id, row.slug, row.first_name, row.middle_name, row.last_name
+                )
+            records.append(SnapshotRecord(row.record_id, politician, row.position, row.party, row.year, row.community))
+        return records
+
+_snapshot = None
+
+def current_snapshot_path(directory = SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(directory, "CURRENT")) as f:
+            return os.path.join(directory, f.read().strip())
+    except FileNotFoundError:
+        return None
+
+def load_current_snapshot(directory = SNAPSHOT_DIR):
+    global _snapshot
+    path = current_snapshot_path(directory)
+    if path is None or not os.path.isdir(path):
+        return None
+    if _snapshot is None or _snapshot.path != path:
+        _snapshot = Snapshot(path)
+    return _snapshot
+
+def snapshot_is_current(snapshot):
+    return snapshot is not None and snapshot.data_version == data_version()
+
+def get_snapshot():
+    """
+    The current snapshot of this process, or None when snapshots are disabled,
+    missing, or older than the data (callers then fall back to the ORM).
+    """
+    if not USE_DATA_SNAPSHOT:
+        return None
+    snapshot = load_current_snapshot()
+    return snapshot if snapshot_is_current(snapshot) else None
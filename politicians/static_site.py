@@ -0,0 +1,252 @@
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.db.models import Max
+from django.test import Client
+from django.urls import reverse
+from django.utils.text import slugify
+from html import escape, unescape
+from urllib.parse import parse_qsl, urlencode, urlsplit
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+from .changes import data_version, partition_versions, year_version
+from .models import DataChange, NameIndexEntry, NetworkMetricRun, PoliticianRecord
+from .reference import get_reference
+from .workers import process_pool
+
+STATIC_SITE_DIR = getattr(settings, "STATIC_SITE_DIR", os.path.join(settings.BASE_DIR, "static_site"))
+MANIFEST_NAME = "manifest.json"
+# Pages rendered by one worker task
+PAGE_CHUNK_SIZE = 50
+
+# Query parameters that select a page, in the order they appear in its file path
+PAGE_PARAMETERS = ["province", "region", "year"]
+# Parameters left at their default value do not change the page
+DEFAULT_PARAMETERS = {"profile": "default"}
+
+LINK_PATTERN = re.compile(r'(href|src)="(/[^"]*)"')
+FORM_SCRIPT = """<script>
+document.querySelectorAll('form[method="get"]').forEach(function (form) {
+    form.addEventListener("submit", function (event) {
+        event.preventDefault();
+        var parts = [];
+        %s.forEach(function (name) {
+            var field = form.elements[name];
+            if (field) {
+                parts.push(field.value.normalize("NFKD").replace(/[\\u0300-\\u036f]/g, "").toLowerCase()
+                    .replace(/[^\\w\\s-]/g, "").trim().replace(/[-\\s]+/g, "-"));
+            }
+        });
+        window.location.href = "%s" + parts.join("/") + "/index.html";
+    });
+});
+</script>
+"""
+
+def page_key(url):
+    """Path and selecting parameters of a URL, so equivalent links map to the same page"""
+    parts = urlsplit(unescape(url))
+    params = tuple(sorted(
+        (key, value) for key, value in parse_qsl(parts.query)
+        if value and DEFAULT_PARAMETERS.get(key) != value
+    ))
+    return parts.path, params
+
+def page_path(url):
+    """File of a page in the static site: query parameters become directories"""
+    path, params = page_key(url)
+    values = dict(params)
+    segments = [slugify(str(values[key])) for key in PAGE_PARAMETERS if key in values]
+    return posixpath.join(path.strip("/"), *segments, "index.html")
+
+def page_url(name, *args, **params):
+    url = reverse(name, args = args)
+    return f"{url}?{urlencode(params)}" if params else url
+
+def name_fingerprints(versions):
+    """
+    Digest of every indexed name: the versions of the partitions where it appears. The
+    likely kin of a politician are the politicians sharing their last or middle name.
+    """
+    partitions = {}
+    for name, province_id, year in NameIndexEntry.objects.values_list("name", "province_id", "year").distinct():
+        partitions.setdefault(name, set()).add((province_id, year))
+    return {
+        name: hashlib.sha1(",".join(f"{province_id}-{year}-{versions.get((province_id, year), 0)}" for province_id, year in sorted(keys)).encode()).hexdigest()[:16]
+        for name, keys in partitions.items()
+    }
+
+def politician_fingerprints():
+    """
+    Fingerprint of every politician page: the versions of the partitions the politician
+    has records in and the metrics runs of those partitions, the last change logged
+    against the politician itself, and the fingerprints of their last and middle names
+    (a relative's change shows in the likely kin section).
+    """
+    versions = partition_versions()
+    runs = {
+        (province_id, year): computed_at.timestamp()
+        for province_id, year, computed_at in NetworkMetricRun.objects.values_list("province_id", "year", "computed_at")
+    }
+    names = name_fingerprints(versions)
+    partitions = {}
+    rows = PoliticianRecord.objects.values_list(
+        "politician_id", "politician__slug", "politician__last_name", "politician__middle_name", "province_id", "year"
+    ).distinct()
+    for politician_id, slug, last_name, middle_name, province_id, year in rows:
+        partitions.setdefault((politician_id, slug, last_name, middle_name), set()).add((province_id, year))
+    changes = dict(
+        DataChange.objects.filter(model = "Politician")
+        .values_list("object_id")
+        .annotate(last = Max("version"))
+        .values_list("object_id", "last")
+    )
+    return {
+        slug: ":".join([
+            str(changes.get(politician_id, 0)),
+            ",".join(f"{province_id}-{year}-{versions.get((province_id, year), 0)}-{runs.get((province_id, year), 0)}" for province_id, year in sorted(keys)),
+            names.get(last_name, ""),
+            names.get(middle_name, ""),
+        ])
+        for (politician_id, slug, last_name, middle_name), keys in partitions.items()
+    }
+
+def list_pages():
+    """Every page of the static site as {url: fingerprint of the data it shows}"""
+    reference = get_reference()
+    global_version = str(data_version())
+    # The landing pages of the dashboard cards show the default selection
+    pages = {
+        page_url(name): global_version
+        for name in ["overview:dashboard", "politicians:index", "politicians:graph", "province_analysis", "region_analysis", "national_analysis", "party_flows"]
+    }
+    for (province_id, year), version in partition_versions().items():
+        if province_id not in reference.provinces:
+            continue
+        province = reference.provinces[province_id].name
+        pages[page_url("province_analysis", province = province, year = year)] = str(version)
+        pages[page_url("politicians:graph", province = province, year = year)] = str(version)
+    for year in reference.years:
+        version = str(year_version(year))
+        pages[page_url("national_analysis", year = year)] = version
+        for region in reference.region_names:
+            pages[page_url("region_analysis", region = region, year = year)] = version
+    for slug, fingerprint in politician_fingerprints().items():
+        pages[page_url("politicians:politician_view", slug)] = fingerprint
+    return pages
+
+def relative_link(source, target):
+    return posixpath.relpath(target, posixpath.dirname(source) or ".")
+
+def rewrite_links(html, url, site_map, form_sections):
+    """Point links to exported pages and static assets at their files, relative to the page"""
+    path = page_path(url)
+    static_url = "/" + settings.STATIC_URL.strip("/") + "/"
+
+    def replace(match):
+        attribute, url = match.groups()
+        key = page_key(url)
+        if key in site_map:
+            return f'{attribute}="{escape(relative_link(path, site_map[key]))}"'
+        if url.startswith(static_url):
+            return f'{attribute}="{escape(relative_link(path, posixpath.join("static", url[len(static_url):])))}"'
+        return match.group(0)
+
+    html = LINK_PATTERN.sub(replace, html)
+    section = page_key(url)[0]
+    if section in form_sections:
+        # Selection forms jump to the exported page of the selected options
+        section_link = posixpath.dirname(relative_link(path, posixpath.join(section.strip("/"), "index.html"))) or "."
+        html = html.replace("</body>", FORM_SCRIPT % (json.dumps(PAGE_PARAMETERS), section_link + "/") + "</body>", 1)
+    return html
+
+def render_pages(urls, site_map, directory):
+    """Render pages through the full request stack and write them; returns {url: ok}"""
+    client = Client(raise_request_exception = False, HTTP_HOST = (settings.ALLOWED_HOSTS or ["localhost"])[0])
+    # Sections with one page per selection, which their forms can navigate between
+    form_sections = {path for path, params in site_map if params}
+    results = {}
+    for url in urls:
+        response = client.get(url)
+        if response.status_code != 200:
+            results[url] = False
+            continue
+        html = rewrite_links(response.content.decode(response.charset or "utf-8"), url, site_map, form_sections)
+        target = os.path.join(directory, *page_path(url).split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok = True)
+        with open(target, "w", encoding = "utf-8") as f:
+            f.write(html)
+        results[url] = True
+    return results
+
+def _render_chunk(urls, site_map, directory):
+    # Runs in a worker process: each worker opens its own database connection.
+    return render_pages(urls, site_map, directory)
+
+def copy_static_files(directory):
+    """Copy every static asset (the collectstatic set) under <directory>/static"""
+    copied = 0
+    for finder in finders.get_finders():
+        for path, storage in finder.list(["CVS", ".*", "*~"]):
+            target = os.path.join(directory, "static", path)
+            os.makedirs(os.path.dirname(target), exist_ok = True)
+            with storage.open(path) as source, open(target, "wb") as f:
+                shutil.copyfileobj(source, f)
+            copied += 1
+    return copied
+
+def load_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), encoding = "utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def build_static_site(directory = STATIC_SITE_DIR, workers = None, force = False, log = None):
+    """
+    Render the site to static HTML. Only pages whose fingerprint (data version of their
+    province-year, year or politician) changed since the last build are rendered again;
+    pages that no longer exist are removed. Returns (rendered, removed, failed) counts.
+    """
+    pages = list_pages()
+    site_map = {page_key(url): page_path(url) for url in pages}
+    manifest = {} if force else load_manifest(directory)
+    todo = sorted(
+        url for url, fingerprint in pages.items()
+        if manifest.get(url) != fingerprint or not os.path.exists(os.path.join(directory, page_path(url)))
+    )
+    copy_static_files(directory)
+
+    failed = []
+    with process_pool(workers) as executor:
+        chunks = [todo[start:start + PAGE_CHUNK_SIZE] for start in range(0, len(todo), PAGE_CHUNK_SIZE)]
+        futures = [executor.submit(_render_chunk, chunk, site_map, directory) for chunk in chunks]
+        done = 0
+        for future in futures:
+            results = future.result()
+            for url, ok in results.items():
+                if ok:
+                    manifest[url] = pages[url]
+                else:
+                    manifest.pop(url, None)
+                    failed.append(url)
+            done += len(results)
+            if log:
+                log(f"Rendered {done} of {len(todo)} page(s)")
+
+    removed = [url for url in manifest if url not in pages]
+    for url in removed:
+        del manifest[url]
+        try:
+            os.remove(os.path.join(directory, page_path(url)))
+        except FileNotFoundError:
+            pass
+    with open(os.path.join(directory, MANIFEST_NAME), "w", encoding = "utf-8") as f:
+        json.dump(manifest, f, indent = 1, sort_keys = True)
+    if log:
+        for url in failed:
+            log(f"Could not render {url}")
+    return len(todo) - len(failed), len(removed), len(failed)
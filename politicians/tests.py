@@ -1,3 +1,708 @@
-from django.test import TestCase
+from concurrent.futures import Future, ThreadPoolExecutor
+import base64
+import csv
+import gc
+import gzip
+import io
+import random
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+import matplotlib.patches as patches
+import networkx as nx
+import pandas as pd
+from django.conf import settings
+from django.contrib.admin import site
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .admin import EstimatedCountPaginator, PoliticianAdmin
+from .batch import apply_batch, validate_rows
+from .changes import REFERENCE_KEY, bump_version, data_version, politician_version
+from .conditional import data_etag
+from .duplicates import find_duplicates, merge_politicians, soundex
+from .graph_export import stream_graph
+from .graph import (
+    generate_adjacency_matrices, generate_adjacency_matrix, generate_community_graph, load_unique_records, render_static_png,
+)
+from .kin import likely_kin, rebuild_name_index
+from .loadtest import SCENARIOS, Sample, compare, endpoint_name, generate_dataset, summarize
+from .metrics import compute_province_metrics, refresh_metrics
+from .reference import get_reference
+from .relations import (
+    CROSS, SAME_LAST, block_relations, combine, compute_relations, encode_names, expand_relations, get_relations,
+    get_weight_profile, name_block_pairs, pair_relation,
+)
+from .models import NameIndexEntry, NetworkMetricRun, Politician, PoliticianNetworkMetric, PoliticianRecord, Province, Region
+from .routers import READ_ONLY_DATABASE
+from .snapshot import build_snapshot, current_snapshot_path, load_current_snapshot, prune_snapshots, watch_snapshot
+from .static_site import politician_fingerprints
 
 # Create your tests here.
+
+def current_rss():
+    """Resident set size of this process in bytes (Linux only)"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def render_sample(seed):
+    G = nx.gnm_random_graph(40, 80, seed = seed)
+    nx.set_edge_attributes(G, 2, "weight")
+    pos = nx.spring_layout(G, seed = seed)
+    return render_static_png(
+        G, pos,
+        node_colors = ["#ee734a"] * G.number_of_nodes(),
+        edge_widths = [G[u][v]["weight"] for u, v in G.edges()],
+        title = f"Sample {seed}",
+        legend_items = [patches.Patch(color = "#ee734a", label = "Largest Dynasty")],
+        figsize = (4, 3), dpi = 50,
+    )
+
+class StaticGraphRenderingTests(SimpleTestCase):
+    def test_render_returns_png(self):
+        png = base64.b64decode(render_sample(0))
+        self.assertEqual(png[:8], b"\x89PNG\r\n\x1a\n")
+
+    @unittest.skipUnless(os.path.exists("/proc/self/statm"), "RSS is read from /proc")
+    def test_repeated_renders_keep_memory_flat(self):
+        # Warm up caches (fonts, Agg buffers) before taking the baseline
+        for seed in range(20):
+            render_sample(seed)
+        gc.collect()
+        baseline = current_rss()
+
+        for seed in range(300):
+            render_sample(seed)
+        gc.collect()
+
+        growth = current_rss() - baseline
+        self.assertLess(growth, 30 * 1024 * 1024, f"RSS grew by {growth / 2**20:.1f} MiB over 300 renders")
+
+    def test_renders_in_thread_pool(self):
+        with ThreadPoolExecutor(max_workers = 4) as executor:
+            pngs = list(executor.map(render_sample, range(16)))
+        for png in pngs:
+            self.assertEqual(base64.b64decode(png)[:8], b"\x89PNG\r\n\x1a\n")
+
+def connect(path, init_command):
+    # Like the Django backend: timeout 0 so a blocked query fails instead of waiting
+    connection = sqlite3.connect(path, timeout = 0, isolation_level = None, check_same_thread = False)
+    for statement in init_command.split(";"):
+        if statement.strip():
+            connection.execute(statement)
+    return connection
+
+def readers_during_write(init_command, readers = 4, queries = 25):
+    """
+    Count the reads that succeed and fail ("database is locked") while another
+    connection holds a write lock, as it does while committing.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "db.sqlite3")
+        setup = connect(path, init_command)
+        setup.execute("CREATE TABLE record (id INTEGER PRIMARY KEY, name TEXT)")
+        setup.executemany("INSERT INTO record (name) VALUES (?)", [(f"name {i}",) for i in range(1000)])
+
+        writer = connect(path, init_command)
+        writer.execute("BEGIN EXCLUSIVE")
+        writer.execute("INSERT INTO record (name) VALUES ('new')")
+
+        def read(_):
+            connection = connect(path, init_command)
+            succeeded = locked = 0
+            for _ in range(queries):
+                try:
+                    connection.execute("SELECT COUNT(*) FROM record").fetchone()
+                    succeeded += 1
+                except sqlite3.OperationalError:
+                    locked += 1
+            connection.close()
+            return succeeded, locked
+
+        with ThreadPoolExecutor(max_workers = readers) as executor:
+            results = list(executor.map(read, range(readers)))
+        writer.execute("COMMIT")
+        writer.close()
+        setup.close()
+    return sum(result[0] for result in results), sum(result[1] for result in results)
+
+class SQLiteConcurrencyTests(SimpleTestCase):
+    def test_default_configuration_blocks_readers_during_a_write(self):
+        # SQLite defaults (rollback journal), as before SQLITE_PRAGMAS
+        succeeded, locked = readers_during_write("")
+        self.assertEqual(succeeded, 0)
+        self.assertEqual(locked, 100)
+
+    def test_configured_pragmas_let_readers_run_during_a_write(self):
+        succeeded, locked = readers_during_write(settings.SQLITE_INIT_COMMAND)
+        self.assertEqual(succeeded, 100)
+        self.assertEqual(locked, 0)
+
+class ReadOnlyRoutingTests(TestCase):
+    databases = {"default", READ_ONLY_DATABASE}
+
+    def test_streamed_export_reads_from_the_read_only_connection(self):
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as default, CaptureQueriesContext(connections[READ_ONLY_DATABASE]) as readonly:
+            response = self.client.get(reverse("politicians:export", args = ["records"]))
+            body = b"".join(response.streaming_content)
+        self.assertTrue(body.startswith(b"id,"))
+        self.assertGreater(len(readonly), 0)
+        self.assertEqual(len(default), 0)
+
+class ConditionalResponseTests(TestCase):
+    databases = {"default", READ_ONLY_DATABASE}
+
+    def test_missing_politician_is_not_revalidated(self):
+        response = self.client.get(reverse("politicians:politician_view", args = ["nobody"]), HTTP_IF_NONE_MATCH = "*")
+        self.assertEqual(response.status_code, 404)
+
+    def test_etags_change_with_the_code_version(self):
+        with override_settings(CODE_VERSION = "a"):
+            before = data_etag(None)
+        with override_settings(CODE_VERSION = "b"):
+            self.assertNotEqual(data_etag(None), before)
+
+class ExportFilterTests(TestCase):
+    databases = {"default", READ_ONLY_DATABASE}
+
+    def test_invalid_data_export_filters_are_rejected_before_streaming(self):
+        url = reverse("politicians:export", args = ["records"])
+        response = self.client.get(url, {"year": "abc"})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.streaming)
+        self.assertEqual(self.client.get(url, {"community": "1.5"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"province": "ATLANTIS"}).status_code, 404)
+
+    def test_invalid_graph_export_filters_are_rejected_before_streaming(self):
+        url = reverse("politicians:export_graph", args = ["edgelist"])
+        response = self.client.get(url, {"year": "abc"})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.streaming)
+        self.assertEqual(self.client.get(url, {"province": "ATLANTIS"}).status_code, 404)
+
+class BatchEditTests(TestCase):
+    def setUp(self):
+        self.region = Region.objects.create(name = "REGION I")
+        self.ilocos = Province.objects.create(name = "ILOCOS NORTE", region = self.region)
+        self.pangasinan = Province.objects.create(name = "PANGASINAN", region = self.region)
+        self.batanes = Province.objects.create(name = "BATANES", region = Region.objects.create(name = "REGION II"))
+        politician = Politician.objects.create(first_name = "JUAN", middle_name = "SANTOS", last_name = "DELA CRUZ")
+        self.records = [
+            PoliticianRecord.objects.create(politician = politician, province = self.ilocos, region = self.region, year = year, position = "MAYOR", community = 1)
+            for year in (2016, 2019)
+        ]
+
+    def test_invalid_cells_are_reported_per_row(self):
+        first, second = self.records
+        _, changes, errors = validate_rows([
+            {"id": first.id, "position": 5, "party": ["LP"]},
+            {"id": second.id, "year": 2019.0, "community": True},
+            {"id": True},
+            {"id": "abc"},
+            {"id": 0},
+        ])
+        self.assertEqual(changes, {})
+        self.assertEqual([(error["row"], sorted(error["errors"])) for error in errors], [
+            (1, ["party", "position"]), (2, ["community", "year"]), (3, ["id"]), (4, ["id"]), (5, ["id"]),
+        ])
+
+    def test_invalid_region_and_province_pair(self):
+        _, _, errors = validate_rows([{"id": self.records[0].id, "province": "BATANES"}])
+        self.assertEqual(list(errors[0]["errors"]), ["province"])
+
+    def test_api_reports_wrongly_typed_values(self):
+        response = self.client.post(
+            reverse("politicians:record_batch_api"), {"rows": [{"id": self.records[0].id, "position": 5}]}, content_type = "application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["errors"][0]["errors"], {"position": "Position must be text."})
+
+    def test_dry_run_saves_nothing(self):
+        version = data_version()
+        summary = apply_batch([{"id": str(self.records[0].id), "party": "LP", "year": "2022"}], dry_run = True)
+        self.assertEqual((summary["updated"], summary["partitions"]), (1, 0))
+        self.records[0].refresh_from_db()
+        self.assertEqual((self.records[0].party, self.records[0].year), (None, 2016))
+        self.assertEqual(data_version(), version)
+
+    def test_apply_updates_records_partitions_and_name_index(self):
+        first, second = self.records
+        old_version = data_version(self.ilocos.id, 2016)
+        summary = apply_batch([
+            {"id": first.id, "province": "PANGASINAN", "year": 2022, "party": "LP"},
+            {"id": second.id, "position": "mayor", "party": ""},
+        ])
+        self.assertEqual(summary, {"rows": 2, "updated": 1, "unchanged": 1, "partitions": 2})
+        first.refresh_from_db()
+        self.assertEqual((first.province_id, first.year, first.party), (self.pangasinan.id, 2022, "LP"))
+        self.assertGreater(data_version(self.ilocos.id, 2016), old_version)
+        self.assertEqual(data_version(self.pangasinan.id, 2022), 1)
+        self.assertEqual(
+            set(NameIndexEntry.objects.filter(role = "LAST").values_list("name", "province_id", "year")),
+            {("DELA CRUZ", self.pangasinan.id, 2022), ("DELA CRUZ", self.ilocos.id, 2019)},
+        )
+
+class TimelineCacheTests(TestCase):
+    def test_timeline_version_follows_the_politician_in_every_process(self):
+        region = Region.objects.create(name = "REGION I")
+        ilocos = Province.objects.create(name = "ILOCOS NORTE", region = region)
+        batanes = Province.objects.create(name = "BATANES", region = Region.objects.create(name = "REGION II"))
+        politician = Politician.objects.create(first_name = "JUAN", last_name = "DELA CRUZ")
+        record = PoliticianRecord.objects.create(politician = politician, province = ilocos, region = region, year = 2016, position = "MAYOR", community = 1)
+        other = Politician.objects.create(first_name = "PEDRO", last_name = "REYES")
+        PoliticianRecord.objects.create(politician = other, province = batanes, region = batanes.region, year = 2016, position = "MAYOR", community = 1)
+
+        versions = [politician_version(politician.id)]
+        # The cache is per process: only versions kept in the database are seen by every worker
+        apply_batch([{"id": record.id, "party": "LP"}])
+        versions.append(politician_version(politician.id))
+        ilocos.name = "ILOCOS SUR"
+        ilocos.save()
+        versions.append(politician_version(politician.id))
+        self.assertEqual(len(set(versions)), 3)
+        # Other politicians' edits keep the cached timeline
+        other.first_name = "PEDRITO"
+        other.save()
+        self.assertEqual(politician_version(politician.id), versions[-1])
+
+class ReferenceDataTests(TestCase):
+    def test_reference_reloads_after_a_change_in_another_process(self):
+        with mock.patch("politicians.reference.REFERENCE_CHECK_INTERVAL", 0):
+            reference = get_reference()
+        with self.assertNumQueries(0):
+            self.assertIs(get_reference(), reference)
+        # Another process changes a province: only the version in the database is bumped here
+        bump_version(REFERENCE_KEY)
+        self.assertIs(get_reference(), reference)
+        # and it is seen at the next check
+        with mock.patch("politicians.reference.REFERENCE_CHECK_INTERVAL", 0):
+            self.assertIsNot(get_reference(), reference)
+
+    def test_province_save_reloads_reference(self):
+        Province.objects.create(name = "ABRA", region = Region.objects.create(name = "CAR"))
+        self.assertEqual(get_reference().province_names, ["ABRA"])
+
+class AdminTests(TestCase):
+    def setUp(self):
+        self.politicians = [
+            Politician.objects.create(first_name = first, last_name = last)
+            for first, last in [
+                ("JUAN", "DELA CRUZ"), ("ADELA", "REYES"), ("PEDRO", "DELACRUZ"), ("MARIA", "SANTOS"), ("JOSE", "DE LOS SANTOS"),
+            ]
+        ]
+
+    def test_count_is_exact_after_deletes(self):
+        Politician.objects.filter(id__in = [self.politicians[0].id, self.politicians[2].id]).delete()
+        self.assertEqual(EstimatedCountPaginator(Politician.objects.order_by("id"), 100).count, 3)
+
+    def test_name_search_is_an_indexed_prefix_range(self):
+        queryset, _ = PoliticianAdmin(Politician, site).get_search_results(None, Politician.objects.all(), "dela")
+        self.assertEqual(sorted(queryset.values_list("last_name", flat = True)), ["DELA CRUZ", "DELACRUZ"])
+        sql, params = queryset.query.sql_with_params()
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = " ".join(row[-1] for row in cursor.fetchall())
+        self.assertIn("USING INDEX politician_last_middle", plan)
+
+    def search(self, term):
+        queryset, _ = PoliticianAdmin(Politician, site).get_search_results(None, Politician.objects.all(), term)
+        return sorted(queryset.values_list("first_name", flat = True))
+
+    def test_multi_word_surnames(self):
+        self.assertEqual(self.search("dela cruz"), ["JUAN"])
+        self.assertEqual(self.search('"de los"'), ["JOSE"])
+        self.assertEqual(self.search("de los santos"), ["JOSE"])
+        # Words can still match different columns
+        self.assertEqual(self.search("maria santos"), ["MARIA"])
+        self.assertEqual(self.search("juan dela"), ["JUAN"])
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        region = Region.objects.create(name = "REGION I")
+        self.province = Province.objects.create(name = "ILOCOS NORTE", region = region)
+
+    def add_record(self, first_name):
+        politician = Politician.objects.create(first_name = first_name, last_name = "MARCOS")
+        PoliticianRecord.objects.create(politician = politician, province = self.province, year = 2022, position = "MAYOR", community = 1)
+
+    def test_watch_rebuilds_after_a_change(self):
+        self.add_record("JUAN")
+        watch_snapshot(self.directory, iterations = 1)
+        first = current_snapshot_path(self.directory)
+        watch_snapshot(self.directory, iterations = 1)
+        self.assertEqual(current_snapshot_path(self.directory), first)
+
+        self.add_record("PEDRO")
+        watch_snapshot(self.directory, iterations = 1)
+        self.assertNotEqual(current_snapshot_path(self.directory), first)
+        self.assertEqual(len(load_current_snapshot(self.directory).records()), 2)
+
+    def test_replaced_snapshots_are_kept_for_a_grace_period(self):
+        self.add_record("JUAN")
+        build_snapshot(self.directory)
+        previous = current_snapshot_path(self.directory)
+        self.add_record("PEDRO")
+        build_snapshot(self.directory)
+        self.assertTrue(os.path.isdir(previous))
+        self.assertEqual(prune_snapshots(self.directory, grace = 0), 1)
+        self.assertFalse(os.path.isdir(previous))
+        self.assertTrue(os.path.isdir(current_snapshot_path(self.directory)))
+
+class StaticSiteFingerprintTests(TestCase):
+    def test_politician_page_changes_with_its_relatives(self):
+        region = Region.objects.create(name = "REGION I")
+        ilocos = Province.objects.create(name = "ILOCOS NORTE", region = region)
+        pangasinan = Province.objects.create(name = "PANGASINAN", region = region)
+        juan, pedro, maria = [
+            Politician.objects.create(first_name = first, last_name = last)
+            for first, last in [("JUAN", "MARCOS"), ("PEDRO", "MARCOS"), ("MARIA", "SANTOS")]
+        ]
+        for politician, province in [(juan, ilocos), (pedro, pangasinan), (maria, pangasinan)]:
+            PoliticianRecord.objects.create(politician = politician, province = province, year = 2019, position = "MAYOR", community = 1)
+
+        before = politician_fingerprints()[juan.slug]
+        # A relative's new term shows in the likely kin section
+        PoliticianRecord.objects.create(politician = pedro, province = pangasinan, year = 2022, position = "GOVERNOR", community = 1)
+        after = politician_fingerprints()[juan.slug]
+        self.assertNotEqual(after, before)
+        # Someone without a shared name does not
+        PoliticianRecord.objects.create(politician = maria, province = ilocos, year = 2022, position = "MAYOR", community = 2)
+        self.assertEqual(politician_fingerprints()[juan.slug], after)
+
+# Few names, so that every relation rule is hit; None and "" are both "no middle name"
+SAMPLE_NAMES = ["REYES", "SANTOS", "CRUZ", "", None]
+
+def random_names(rng, n):
+    return (
+        [rng.choice(SAMPLE_NAMES[:3]) for _ in range(n)],
+        [rng.choice(SAMPLE_NAMES) for _ in range(n)],
+    )
+
+class AdjacencyMatricesTests(TestCase):
+    def test_block_relations_equal_the_dense_relations(self):
+        rng = random.Random(7)
+        last_names, middle_names = random_names(rng, 60)
+        names = encode_names(last_names, middle_names)
+        pairs = name_block_pairs(*names)
+        for _ in range(20):
+            index = rng.sample(range(60), rng.randint(0, 30))
+            expected = expand_relations(
+                compute_relations([last_names[i] for i in index], [middle_names[i] for i in index]), len(index)
+            )
+            self.assertTrue((block_relations(names, pairs, index) == expected).all())
+
+    def test_batch_output_equals_the_per_year_path(self):
+        rng = random.Random(11)
+        region = Region.objects.create(name = "REGION I")
+        province = Province.objects.create(name = "ILOCOS NORTE", region = region)
+        last_names, middle_names = random_names(rng, 25)
+        politicians = [
+            Politician.objects.create(first_name = f"P{i}", middle_name = middle, last_name = last)
+            for i, (last, middle) in enumerate(zip(last_names, middle_names))
+        ]
+        # Records are created in shuffled order, so pairs are ordered differently each year
+        for year in (2016, 2019, 2022):
+            for politician in rng.sample(politicians, 15):
+                PoliticianRecord.objects.create(politician = politician, province = province, region = region, year = year, position = "MAYOR", community = 1)
+
+        matrices = generate_adjacency_matrices(province.name)
+        self.assertEqual(sorted(matrices), [2016, 2019, 2022])
+        for year, (am_df, frame, name_data) in matrices.items():
+            cache.clear()
+            expected_df, _, expected_name_data = generate_adjacency_matrix(province.name, year)
+            self.assertTrue(am_df.equals(expected_df))
+            self.assertEqual(name_data, expected_name_data)
+
+class RelationRuleTests(TestCase):
+    def test_vectorized_rules_match_the_pairwise_rules(self):
+        last_names, middle_names = random_names(random.Random(3), 40)
+        relations = expand_relations(compute_relations(last_names, middle_names), 40)
+        for i in range(40):
+            for j in range(i + 1, 40):
+                self.assertEqual(relations[i, j], pair_relation(last_names[i], middle_names[i], last_names[j], middle_names[j]))
+
+    def test_crossed_names_are_related_from_the_side_with_a_middle_name(self):
+        self.assertEqual(list(compute_relations(["REYES", "SANTOS"], ["SANTOS", ""])), [CROSS])
+        self.assertEqual(list(compute_relations(["SANTOS", "REYES"], ["", "SANTOS"])), [0])
+
+    def test_profiles_recombine_the_same_relations(self):
+        relations = expand_relations(compute_relations(["REYES", "REYES", "CRUZ"], ["CRUZ", "", "SANTOS"]), 3)
+        self.assertEqual(relations[0, 1], SAME_LAST)
+        self.assertEqual(relations[0, 2], CROSS)
+        positions = ["GOVERNOR", "MAYOR", "COUNCILOR"]
+        default = combine(relations, positions, get_weight_profile())
+        self.assertEqual(default.dtype.kind, "i")
+        surname_only = combine(relations, positions, get_weight_profile("surname_only"))
+        self.assertEqual(surname_only[0, 2], 0)
+        self.assertEqual(int(surname_only[0, 1]), default[0, 1])
+        custom = get_weight_profile("default", {"factor_same_last": "0.1", "weight_MAYOR": "x"})
+        self.assertEqual((custom.name, custom.factors["same_last"]), ("custom", 0.1))
+        self.assertAlmostEqual(combine(relations, positions, custom)[0, 1], surname_only[0, 1] / 0.75 * 0.1)
+
+    def test_relations_are_cached_per_partition_version(self):
+        region = Region.objects.create(name = "REGION I")
+        province = Province.objects.create(name = "ILOCOS NORTE", region = region)
+        for first in ["JUAN", "PEDRO"]:
+            politician = Politician.objects.create(first_name = first, last_name = "MARCOS")
+            PoliticianRecord.objects.create(politician = politician, province = province, region = region, year = 2022, position = "MAYOR", community = 1)
+        cache.clear()
+        frame = load_unique_records(province.name, 2022)[1]
+        get_relations(province.name, 2022, frame)
+        with mock.patch("politicians.relations.compute_relations", wraps = compute_relations) as computed:
+            get_relations(province.name, 2022, frame)
+            self.assertEqual(computed.call_count, 0)
+            bump_version(f"{province.id}:2022")
+            get_relations(province.name, 2022, frame)
+            self.assertEqual(computed.call_count, 1)
+
+class NameIndexTests(TestCase):
+    def setUp(self):
+        region = Region.objects.create(name = "REGION I")
+        self.ilocos = Province.objects.create(name = "ILOCOS NORTE", region = region)
+        self.pangasinan = Province.objects.create(name = "PANGASINAN", region = region)
+        self.politicians = {}
+        for first, middle, last, province in [
+            ("JUAN", "EDRALIN", "MARCOS", self.ilocos),
+            ("PEDRO", "EDRALIN", "MARCOS", self.ilocos),
+            ("ANA", "", "MARCOS", self.pangasinan),
+            ("MARIA", "MARCOS", "SANTOS", self.pangasinan),
+            ("JOSE", "", "REYES", self.ilocos),
+        ]:
+            politician = Politician.objects.create(first_name = first, middle_name = middle, last_name = last)
+            PoliticianRecord.objects.create(politician = politician, province = province, region = region, year = 2016, position = "MAYOR", community = 1)
+            self.politicians[first] = politician
+
+    def kin_of(self, first):
+        return [(item["politician"].first_name, item["relation"]) for item in likely_kin(self.politicians[first])]
+
+    def test_likely_kin_are_ranked_by_relation(self):
+        self.assertEqual(self.kin_of("JUAN"), [
+            ("PEDRO", "Same last and middle name"), ("ANA", "Same last name"), ("MARIA", "Last and middle names crossed"),
+        ])
+        self.assertEqual(self.kin_of("JOSE"), [])
+
+    def test_backfill_matches_the_index_kept_by_the_signals(self):
+        maria = self.politicians["MARIA"]
+        maria.middle_name = "ABAD"
+        maria.save()
+        PoliticianRecord.objects.filter(politician = self.politicians["ANA"]).first().delete()
+        kept = sorted(NameIndexEntry.objects.values_list("name", "role", "politician_id", "province_id", "year"))
+        self.assertNotIn(("MARCOS", "MIDDLE", maria.id, self.pangasinan.id, 2016), kept)
+        self.assertEqual(rebuild_name_index(), len(kept))
+        self.assertEqual(sorted(NameIndexEntry.objects.values_list("name", "role", "politician_id", "province_id", "year")), kept)
+        self.assertEqual([first for first, _ in self.kin_of("JUAN")], ["PEDRO"])
+
+class DuplicateTests(TestCase):
+    def setUp(self):
+        self.region = Region.objects.create(name = "REGION I")
+        self.province = Province.objects.create(name = "ILOCOS NORTE", region = self.region)
+
+    def add(self, first, middle, last, *years):
+        politician = Politician.objects.create(first_name = first, middle_name = middle, last_name = last)
+        for year in years:
+            PoliticianRecord.objects.create(politician = politician, province = self.province, region = self.region, year = year, position = "MAYOR", community = 1)
+        return politician
+
+    def test_soundex(self):
+        self.assertEqual([soundex(name) for name in ["ROBERT", "RUPERT", "ASHCRAFT", "TYMCZAK", "DELA CRUZ", "DELA-KRUZ", ""]],
+                         ["R163", "R163", "A261", "T522", "D426", "D426", ""])
+
+    def test_spelling_variants_are_found(self):
+        kept = self.add("JUAN", "SANTOS", "DELA CRUZ", 2016, 2019)
+        duplicate = self.add("JUAN", "S.", "DELA KRUZ", 2022)
+        self.add("PEDRO", "SANTOS", "DELA CRUZ", 2022)
+        pairs = find_duplicates()
+        self.assertEqual([(pair["keep"], pair["duplicate"]) for pair in pairs], [(kept.slug, duplicate.slug)])
+
+    def test_large_blocks_keep_spelling_variants_of_the_first_name(self):
+        # Only the surname and first-two-letters block holds both spellings, and it is large
+        for first in ["MARIO", "MARCO", "MANUEL", "MARTIN", "MAXIMO", "MATEO", "MARIANO", "MAGNO"]:
+            self.add(first, None, "SANTOS", 2016)
+        teresa = self.add("MA TERESA", "REYES", "SANTOS", 2016)
+        theresa = self.add("MATERESA", "REYES", "SANTOS", 2019)
+        with mock.patch("politicians.duplicates.MAX_BLOCK_SIZE", 5):
+            pairs = [(pair["keep"], pair["duplicate"]) for pair in find_duplicates(0.95)]
+        self.assertEqual(pairs, [(teresa.slug, theresa.slug)])
+
+    def test_merge_moves_the_records_and_logs_the_change(self):
+        kept = self.add("JUAN", "SANTOS", "DELA CRUZ", 2016)
+        duplicate = self.add("JUAN", "SANTOS", "DELA KRUZ", 2019)
+        version = data_version(self.province.id, 2019)
+        self.assertEqual(merge_politicians(kept, [duplicate, kept]), 1)
+        self.assertFalse(Politician.objects.filter(id = duplicate.id).exists())
+        self.assertEqual(sorted(kept.politicianrecord_set.values_list("year", flat = True)), [2016, 2019])
+        self.assertGreater(data_version(self.province.id, 2019), version)
+        self.assertEqual(
+            sorted(NameIndexEntry.objects.filter(role = "LAST").values_list("name", "politician_id", "year")),
+            [("DELA CRUZ", kept.id, 2016), ("DELA CRUZ", kept.id, 2019)],
+        )
+
+class GraphExportTests(TestCase):
+    def setUp(self):
+        region = Region.objects.create(name = "REGION I")
+        province = Province.objects.create(name = "ILOCOS NORTE", region = region)
+        for first, middle, last, position, year in [
+            ("JUAN", "EDRALIN", "MARCOS", "MAYOR", 2022), ("PEDRO", "ROMUALDEZ", "MARCOS", "GOVERNOR", 2022),
+            ("MARIA", "CRUZ", "SANTOS", "COUNCILOR", 2022),
+            ("JUAN", "EDRALIN", "MARCOS", "MAYOR", 2019), ("ANA", "ABAD", "MARCOS", "VICE MAYOR", 2019),
+        ]:
+            politician, _ = Politician.objects.get_or_create(first_name = first, middle_name = middle, last_name = last)
+            PoliticianRecord.objects.create(politician = politician, province = province, region = region, year = year, position = position, community = 1)
+
+    def export(self, graph_format, compress):
+        data = b"".join(stream_graph(graph_format, compress = compress))
+        return gzip.decompress(data) if compress else data
+
+    def assert_graph(self, graph):
+        # One node per politician and province-year; same-surname edges weigh 3/4 of the position weights
+        self.assertEqual(graph.number_of_nodes(), 5)
+        self.assertEqual(sorted(weight for _, _, weight in graph.edges(data = "weight")), [11, 18])
+
+    def test_graphml(self):
+        for compress in (False, True):
+            self.assert_graph(nx.read_graphml(io.BytesIO(self.export("graphml", compress))))
+
+    def test_gexf(self):
+        for compress in (False, True):
+            graph = nx.read_gexf(io.BytesIO(self.export("gexf", compress)))
+            self.assert_graph(graph)
+            self.assertEqual(sorted(int(year) for _, year in graph.nodes(data = "year")), [2019, 2019, 2022, 2022, 2022])
+
+    def test_edgelist(self):
+        for compress in (False, True):
+            rows = list(csv.DictReader(io.StringIO(self.export("edgelist", compress).decode("utf-8"))))
+            # The edge list only has the nodes with an edge
+            self.assertEqual(
+                sorted((row["year"], row["source_slug"], row["target_slug"], float(row["weight"])) for row in rows),
+                [("2019", "juan-edralin-marcos", "ana-abad-marcos", 11.0), ("2022", "juan-edralin-marcos", "pedro-romualdez-marcos", 18.0)],
+            )
+
+class InlineExecutor:
+    """Stands in for the process pool: the test database is not visible to other processes"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, function, *args):
+        future = Future()
+        future.set_result(function(*args))
+        return future
+
+class MetricsRefreshTests(TestCase):
+    def test_only_stale_partitions_are_recomputed(self):
+        region = Region.objects.create(name = "REGION I")
+        province = Province.objects.create(name = "ILOCOS NORTE", region = region)
+        records = {}
+        for first in ["JUAN", "PEDRO"]:
+            politician = Politician.objects.create(first_name = first, last_name = "MARCOS")
+            for year in (2019, 2022):
+                records[first, year] = PoliticianRecord.objects.create(
+                    politician = politician, province = province, region = region, year = year, position = "MAYOR", community = 1
+                )
+        with mock.patch("politicians.metrics.process_pool", return_value = InlineExecutor()):
+            self.assertEqual(refresh_metrics(), 2)
+            self.assertEqual(PoliticianNetworkMetric.objects.filter(degree = 1).count(), 4)
+            runs = dict(NetworkMetricRun.objects.values_list("year", "computed_at"))
+            self.assertEqual(refresh_metrics(), 0)
+
+            record = records["PEDRO", 2022]
+            record.position = "GOVERNOR"
+            record.save()
+            with mock.patch("politicians.metrics.compute_province_metrics", wraps = compute_province_metrics) as computed:
+                self.assertEqual(refresh_metrics(), 1)
+            computed.assert_called_once_with(province.name, [2022])
+        self.assertEqual(NetworkMetricRun.objects.get(year = 2019).computed_at, runs[2019])
+
+class CommunityGraphTests(SimpleTestCase):
+    def setUp(self):
+        # Communities 1 (a, b, c), 2 (d, e) and 3 (f alone)
+        slugs = ["a", "b", "c", "d", "e", "f"]
+        self.name_data = {slug: {"Community": community} for slug, community in zip(slugs, [1, 1, 1, 2, 2, 3])}
+        self.am_df = pd.DataFrame(0, index = slugs, columns = slugs)
+        for u, v, weight in [("a", "b", 2), ("b", "c", 3), ("a", "d", 1), ("d", "e", 4), ("c", "f", 5)]:
+            self.am_df.loc[u, v] = self.am_df.loc[v, u] = weight
+
+    def test_communities_collapse_into_weighted_super_nodes(self):
+        G, community_count = generate_community_graph(self.am_df, self.name_data)
+        self.assertEqual(community_count, 3)
+        # Single-member communities are left out
+        self.assertEqual(dict(G.nodes(data = "Size")), {1: 3, 2: 2})
+        self.assertEqual(dict(G.nodes(data = "Internal Weight")), {1: 5, 2: 4})
+        self.assertEqual(list(G.edges(data = "weight")), [(1, 2, 1)])
+
+    def test_only_the_largest_communities_are_kept(self):
+        G, community_count = generate_community_graph(self.am_df, self.name_data, limit = 1)
+        self.assertEqual((list(G.nodes), community_count), ([1], 3))
+
+class CommunityGraphViewTests(TransactionTestCase):
+    # The graph views read through the read-only connection, which only sees committed rows
+    databases = {"default", READ_ONLY_DATABASE}
+
+    def setUp(self):
+        region = Region.objects.create(name = "REGION I")
+        province = Province.objects.create(name = "ILOCOS NORTE", region = region)
+        for first, middle, community in [("JUAN", "EDRALIN", 1), ("PEDRO", "ROMUALDEZ", 1), ("MARIA", "CRUZ", 2)]:
+            politician = Politician.objects.create(first_name = first, middle_name = middle, last_name = "MARCOS")
+            PoliticianRecord.objects.create(politician = politician, province = province, region = region, year = 2022, position = "MAYOR", community = community)
+
+    def test_large_graphs_are_sent_as_communities(self):
+        response = self.client.get(reverse("politicians:graph"), {"province": "ILOCOS NORTE", "year": 2022, "detail": "communities"})
+        self.assertTrue(response.context["lod_mode"])
+        self.assertEqual((response.context["community_count"], response.context["shown_community_count"]), (2, 1))
+        self.assertContains(response, reverse("politicians:graph_community"))
+
+    def test_a_community_expands_into_its_members(self):
+        url = reverse("politicians:graph_community")
+        members = self.client.get(url, {"province": "ILOCOS NORTE", "year": 2022, "community": 1}).json()
+        self.assertEqual(sorted(node["id"] for node in members["nodes"]), ["juan-edralin-marcos", "pedro-romualdez-marcos"])
+        self.assertEqual([edge["width"] for edge in members["edges"]], [18])
+        self.assertEqual(self.client.get(url, {"province": "ILOCOS NORTE", "year": 2022}).status_code, 404)
+
+class LoadTestHarnessTests(TestCase):
+    def test_generated_dataset_is_browsable(self):
+        politicians, records = generate_dataset(40, seed = 1)
+        self.assertEqual((Politician.objects.count(), PoliticianRecord.objects.count()), (politicians, records))
+        self.assertEqual(politicians, 40)
+        self.assertFalse(PoliticianRecord.objects.exclude(region = F("province__region")).exists())
+        # bulk_create sends no signals: the change log and the name index are filled by hand
+        self.assertGreater(data_version(), 0)
+        self.assertTrue(NameIndexEntry.objects.exists())
+        sample = Sample()
+        rng = random.Random(0)
+        for name, (_, scenario) in SCENARIOS.items():
+            for path in scenario(rng, sample):
+                self.assertNotEqual(endpoint_name(path), path, name)
+
+    def test_summary_per_endpoint(self):
+        results = [("index", 200, 0.010), ("index", 200, 0.030), ("graph", 500, 0.100), ("graph", 200, 0.300)]
+        summary = summarize(results, elapsed = 2)
+        self.assertEqual(list(summary), ["ALL", "graph", "index"])
+        self.assertEqual((summary["index"]["requests"], summary["index"]["throughput"], summary["index"]["p50"]), (2, 1.0, 20.0))
+        self.assertEqual((summary["graph"]["error_rate"], summary["ALL"]["error_rate"]), (0.5, 0.25))
+
+    def test_regressions_against_a_baseline(self):
+        baseline = summarize([("index", 200, 0.010)] * 10 + [("graph", 200, 0.100)] * 10, elapsed = 10)
+        self.assertEqual(compare(baseline, baseline), [])
+        # Within the tolerance
+        self.assertEqual(compare(summarize([("index", 200, 0.011)] * 10 + [("graph", 200, 0.100)] * 10, elapsed = 10), baseline), [])
+        slower = summarize([("index", 200, 0.020)] * 10 + [("graph", 500, 0.100)] * 10, elapsed = 20)
+        self.assertEqual(compare(slower, baseline), [
+            "ALL: throughput 2.0 -> 1.0 req/s",
+            "ALL: error rate 0.00% -> 50.00%",
+            "graph: throughput 1.0 -> 0.5 req/s",
+            "graph: error rate 0.00% -> 100.00%",
+            "index: p95 10.0 ms -> 20.0 ms",
+            "index: throughput 1.0 -> 0.5 req/s",
+        ])
+        # The overall figures are not compared when other endpoints were exercised
+        self.assertEqual(compare(summarize([("index", 200, 0.010)] * 10, elapsed = 20), baseline), ["index: throughput 1.0 -> 0.5 req/s"])
@@ -8,6 +8,13 @@ urlpatterns = [
     path('', views.index, name = "index"),
     path('politician/add/', views.politician_add, name = "politician_add"),
     path('politician/graph/', views.plot_graph, name = "graph"),
+    path('politician/graph/series/', views.plot_graph_series, name = "graph_series"),
+    path('politician/graph/community/', views.graph_community, name = "graph_community"),
+    path('politician/graph/weights/', views.graph_weights, name = "graph_weights"),
+    path('records/batch/', views.record_batch_edit, name = "record_batch_edit"),
+    path('api/records/batch/', views.record_batch_api, name = "record_batch_api"),
+    path('export/graph/<str:graph_format>/', views.export_graph, name = "export_graph"),
+    path('export/<str:kind>/', views.export_data, name = "export"),
     path('politician/<slug:slug>/', views.politician_view, name = "politician_view"),
     path('politician/<slug:slug>/update/', views.politician_update, name = "politician_update"),
     path('politician/<slug:slug>/record/add/', views.politicianrecord_add, name = "politicianrecord_add"),
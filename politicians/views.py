@@ -1,19 +1,37 @@
 from django.conf import settings
 from django.contrib import messages
 from django.db.models import Q
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.utils.http import urlencode
 from django.templatetags.static import static
 from django.utils.text import slugify
+import csv
+import json
+from .batch import EDITABLE_FIELDS, BatchEditError, apply_batch, read_csv
 from .forms import PoliticianForm, PoliticianRecordForm
+from .changes import politician_version
+from .conditional import conditional_on_data, conditional_on_politician
+from .export import clean_filters, iter_rows, stream_csv, stream_parquet
+from .graph_export import GRAPH_FORMATS, stream_graph
 from .graph import *  
-from .models import custom_slugify, Politician, PoliticianRecord, Province
-import os
-import json
+from .kin import likely_kin
+from .profiles import load_featured_profile
+from .relations import WEIGHT_PROFILES, get_weight_profile
+from .reference import get_reference
+from .routers import read_only_view
+from .snapshot import get_snapshot
+from .models import custom_slugify, Politician, PoliticianNetworkMetric, PoliticianRecord
 
+TIMELINE_CACHE_TIMEOUT = getattr(settings, "TIMELINE_CACHE_TIMEOUT", 60 * 10)
 
 # Create your views here.
 
 # Landing page
+@read_only_view
 def index(request):
     politicians = Politician.objects.all()
     
@@ -37,23 +55,34 @@ def index(request):
     return render(request, 'politicians/politician_list.html', context)
 
 # View a specific politician's details and records.
+@read_only_view
+@conditional_on_politician
 def politician_view(request, slug):
-    # Extract the politician and their records.
-    politician = Politician.objects.get(slug = slug)
-    records = PoliticianRecord.objects.filter(politician = politician)
+    politician = get_object_or_404(Politician, slug = slug)
+    # Left unevaluated: the records are only queried when the cached timeline is stale
+    records = (
+        PoliticianRecord.objects
+        .select_related("politician", "province", "region")
+        .filter(politician = politician)
+        .order_by("year", "id")
+    )
+    network_metrics = (
+        PoliticianNetworkMetric.objects
+        .filter(politician = politician)
+        .select_related("province")
+        .order_by("year")
+    )
 
     # Extract extra information for featured politicians based on JSON files
-    featured_politician_slugs = ["francisco-moreno-domagoso", "ma_josefina-go-belmonte", "datu_andal-uy-ampatuan", "stephany-uy-tan", "ma_theresa-bonoan_david"]
-    if slug in featured_politician_slugs:
-        json_path = os.path.join(settings.BASE_DIR, f"politicians/json_data/{slug}.json")
-        with open(json_path, "r", encoding = "utf-8") as f:
-            extra_info = json.load(f)
-    else:
-        extra_info = {}
+    extra_info = load_featured_profile(slug)
     context = {
         'politician': politician,
         'records' : records,
-        'extra_info' : extra_info
+        'extra_info' : extra_info,
+        'network_metrics' : network_metrics,
+        'likely_kin' : likely_kin(politician),
+        'timeline_cache_timeout' : TIMELINE_CACHE_TIMEOUT,
+        'timeline_version' : politician_version(politician.id),
     }
 
     return render(request, 'politicians/politician_view.html', context)
@@ -80,7 +109,7 @@ def politician_add(request):
             # Check for validity of region and province pairing before saving the record.
             region = rf.cleaned_data['region']
             province = rf.cleaned_data['province']
-            if province not in region.province_set.all():
+            if not get_reference().is_valid_pair(region, province):
                 messages.error(request, f"{province.name} and {region.name} are an invalid pair. Please try again.")
             else:
                 record = rf.save(commit = False)
@@ -157,7 +186,7 @@ def politicianrecord_update(request, slug, record_id):
                 # Check for validity of region and province pairing before saving the record.
                 region = rf.cleaned_data['region']
                 province = rf.cleaned_data['province']
-                if province not in region.province_set.all():
+                if not get_reference().is_valid_pair(region, province):
                     messages.error(request, f"{province.name} and {region.name} are an invalid pair. Please try again.")
                 else:
                     rf.save()
@@ -169,6 +198,44 @@ def politicianrecord_update(request, slug, record_id):
         }
         return render(request, 'politicians/politicianrecord_update.html', context)
 
+# Apply a CSV of record corrections (e.g. an edited records export) in one batch.
+def record_batch_edit(request):
+    context = {"editable_fields" : EDITABLE_FIELDS}
+    if request.method == "POST":
+        upload = request.FILES.get("file")
+        if upload is None:
+            messages.error(request, "Choose a CSV file to upload.")
+        else:
+            dry_run = "preview" in request.POST
+            try:
+                context["summary"] = apply_batch(read_csv(upload), dry_run = dry_run)
+                context["dry_run"] = dry_run
+            except BatchEditError as error:
+                context["row_errors"] = error.errors
+            except (UnicodeDecodeError, csv.Error):
+                messages.error(request, "The file could not be read as a UTF-8 CSV file.")
+    return render(request, 'politicians/record_batch_edit.html', context)
+
+# JSON API for batch edits: {"rows" : [{"id" : 1, "party" : "..."}, ...], "dry_run" : false}.
+# Exempt from CSRF for scripts; browsers cannot send a cross-site JSON body without a CORS preflight.
+@csrf_exempt
+@require_POST
+def record_batch_api(request):
+    if request.content_type != "application/json":
+        return JsonResponse({"error" : "Send the rows as application/json."}, status = 415)
+    try:
+        payload = json.loads(request.body)
+        rows = payload["rows"]
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({"error" : "Expected a JSON object with a list of rows."}, status = 400)
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        return JsonResponse({"error" : "Expected a JSON object with a list of rows."}, status = 400)
+    try:
+        summary = apply_batch(rows, dry_run = bool(payload.get("dry_run")))
+    except BatchEditError as error:
+        return JsonResponse({"errors" : error.errors}, status = 400)
+    return JsonResponse(summary)
+
 # Delete a politician record.
 def politicianrecord_delete(request, slug, record_id):
     politician = Politician.objects.get(slug = slug)
@@ -201,8 +268,9 @@ def politicianrecord_delete(request, slug, record_id):
                 return redirect("politicians:politician_view", slug = politician.slug)
 
 def get_base_context(request):
-    provinces = list(Province.objects.order_by("name").values_list("name", flat = True))
-    years = [2004, 2007, 2010, 2013, 2016, 2019, 2022]
+    reference = get_reference()
+    provinces = reference.province_names
+    years = reference.years
     selected_province = request.GET.get("province", provinces[0] if provinces else None)
     selected_year = int(request.GET.get("year", years[-1] if years else 2022))
     return {
@@ -212,19 +280,146 @@ def get_base_context(request):
         "selected_year": selected_year,
     }
      
+@read_only_view
+@conditional_on_data
 def plot_graph(request):
     context = get_base_context(request)
     province = context['selected_province']
     year = context['selected_year']
     degree_threshold = 2
+    profile = get_weight_profile(request.GET.get("profile"), request.GET)
 
-    am_df, unique_records, name_data = generate_adjacency_matrix(province, year)
+    am_df, unique_records, name_data = generate_adjacency_matrix(province, year, snapshot = get_snapshot(), profile = profile)
     G_filtered, above_threshold, above_threshold_community, communities = generate_graph(am_df, unique_records, name_data, degree_threshold)
     static_graph, pos = display_static_graph(province, year, degree_threshold, G_filtered, above_threshold, communities)
-    interactive_html = get_interactive_html(degree_threshold, above_threshold, communities, G_filtered, pos)
+
+    # Large networks are sent to the browser as community super-nodes that expand on demand
+    lod_mode = request.GET.get("detail") == "communities" or G_filtered.number_of_nodes() > LOD_NODE_LIMIT
+    if lod_mode:
+        G_community, community_count = generate_community_graph(am_df, name_data)
+        profile_params = {key : value for key, value in request.GET.items() if key == "profile" or key.startswith(("factor_", "weight_"))}
+        members_url = f"{reverse('politicians:graph_community')}?{urlencode({'province' : province, 'year' : year, **profile_params})}"
+        interactive_html = get_community_html(G_community, members_url)
+        context["community_count"] = community_count
+        context["shown_community_count"] = G_community.number_of_nodes()
+    else:
+        interactive_html = get_interactive_html(degree_threshold, above_threshold, communities, G_filtered, pos)
     context.update({
         "static_graph" : static_graph,
-        "interactive_html" : interactive_html
+        "interactive_html" : interactive_html,
+        "lod_mode" : lod_mode,
+        "weight_profiles" : [(name, config.get("label", name)) for name, config in WEIGHT_PROFILES.items()],
+        "selected_profile" : profile
     })
     return render(request, 'politicians/graph_template.html', context)
 
+# Static graphs of every year of a province, built from one batched relation matrix.
+@read_only_view
+@conditional_on_data
+def plot_graph_series(request):
+    context = get_base_context(request)
+    province = context['selected_province']
+    degree_threshold = 2
+    profile = get_weight_profile(request.GET.get("profile"), request.GET)
+
+    matrices = generate_adjacency_matrices(province, context['years'], snapshot = get_snapshot(), profile = profile)
+    panels = []
+    for year, (am_df, unique_records, name_data) in matrices.items():
+        G_filtered, above_threshold, above_threshold_community, communities = generate_graph(am_df, unique_records, name_data, degree_threshold)
+        rendered = display_static_graph(province, year, degree_threshold, G_filtered, above_threshold, communities, figsize = (8, 6))
+        panels.append({
+            "year" : year,
+            "politicians" : len(am_df),
+            "ties" : int((am_df.values > 0).sum() // 2),
+            "static_graph" : rendered[0] if rendered else None
+        })
+    context.update({
+        "panels" : panels,
+        "weight_profiles" : [(name, config.get("label", name)) for name, config in WEIGHT_PROFILES.items()],
+        "selected_profile" : profile
+    })
+    return render(request, 'politicians/graph_series.html', context)
+
+# Summary of a province-year network under a weight profile, for switching profiles without a reload.
+@read_only_view
+@conditional_on_data
+def graph_weights(request):
+    context = get_base_context(request)
+    province = context['selected_province']
+    year = context['selected_year']
+    profile = get_weight_profile(request.GET.get("profile"), request.GET)
+
+    am_df, _, _ = generate_adjacency_matrix(province, year, snapshot = get_snapshot(), profile = profile)
+    weighted_degree = am_df.sum(axis = 1).sort_values(ascending = False)
+    degree = (am_df > 0).sum(axis = 1)
+    return JsonResponse({
+        "province" : province,
+        "year" : year,
+        "profile" : profile.as_dict(),
+        "politicians" : len(am_df),
+        "edges" : int((am_df.values > 0).sum() // 2),
+        "total_weight" : round(float(am_df.values.sum()) / 2, 2),
+        "top" : [
+            {"slug" : slug, "weighted_degree" : round(float(weighted_degree[slug]), 2), "degree" : int(degree[slug])}
+            for slug in weighted_degree.index[:10] if weighted_degree[slug] > 0
+        ],
+    })
+
+# Members of one community, fetched when a super-node is expanded in the interactive graph.
+@read_only_view
+def graph_community(request):
+    try:
+        year = int(request.GET["year"])
+        community = int(request.GET["community"])
+    except (KeyError, ValueError):
+        raise Http404("A year and a community are required.")
+    profile = get_weight_profile(request.GET.get("profile"), request.GET)
+    return JsonResponse(get_community_members(request.GET.get("province"), year, community, profile = profile))
+
+# Export filters of a request, checked before the response starts streaming.
+def export_filters(request, names):
+    filters = clean_filters(request.GET, names)
+    if filters["province"] and get_reference().province_id(filters["province"]) is None:
+        raise Http404("Unknown province.")
+    return filters
+
+# Stream politicians or politician records as CSV (default) or Parquet.
+@read_only_view
+def export_data(request, kind):
+    if kind not in ("politicians", "records"):
+        raise Http404("Unknown export.")
+    try:
+        filters = export_filters(request, ["province", "year", "position", "community"])
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    headers, rows = iter_rows(kind, **filters)
+    if request.GET.get("format") == "parquet":
+        response = StreamingHttpResponse(stream_parquet(headers, rows), content_type = "application/vnd.apache.parquet")
+        filename = f"{kind}.parquet"
+    else:
+        response = StreamingHttpResponse(stream_csv(headers, rows), content_type = "text/csv")
+        filename = f"{kind}.csv"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+# Stream the kinship graphs as GraphML, GEXF or an edge list (gzip-compressed by default).
+@read_only_view
+def export_graph(request, graph_format):
+    if graph_format not in GRAPH_FORMATS:
+        raise Http404("Unknown graph format.")
+    try:
+        filters = export_filters(request, ["province", "year"])
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    content_type, extension = GRAPH_FORMATS[graph_format]
+    compress = request.GET.get("compress", "1" if graph_format == "edgelist" else "0") == "1"
+    profile = get_weight_profile(request.GET.get("profile"), request.GET)
+    chunks = stream_graph(graph_format, compress = compress, profile = profile, **filters)
+    filename = f"kinship.{extension}"
+    if compress:
+        response = StreamingHttpResponse(chunks, content_type = "application/gzip")
+        filename += ".gz"
+    else:
+        response = StreamingHttpResponse(chunks, content_type = content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
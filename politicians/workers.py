@@ -0,0 +1,20 @@
+from concurrent.futures import ProcessPoolExecutor
+from django.db import connections
+import multiprocessing
+
+def setup_worker():
+    # Spawned workers start a fresh interpreter in which Django is not set up yet
+    import django
+    django.setup()
+
+def process_pool(workers = None):
+    """
+    Process pool for the batch commands. Workers are forked where the platform allows it
+    (they start fast and inherit the settings) and spawned otherwise (e.g. on Windows);
+    either way they open their own database connections.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+    # Forked workers must not share the parent's database connection
+    connections.close_all()
+    return ProcessPoolExecutor(max_workers = workers, mp_context = context, initializer = setup_worker)
@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Window
+from django.db.models.functions import Lag
+import pandas as pd
+from politicians.changes import data_version
+from politicians.models import PoliticianRecord
+from politicians.snapshot import get_snapshot
+
+FLOW_CACHE_TIMEOUT = getattr(settings, "FLOW_CACHE_TIMEOUT", 60 * 60)
+NO_PARTY = "(NO PARTY)"
+TRANSITION_COLUMNS = ["Province", "Region", "Year", "Previous Year", "Party", "Previous Party"]
+
+def normalize_party(parties):
+    return parties.fillna("").str.strip().str.upper().replace("", NO_PARTY)
+
+def load_transitions():
+    """
+    Every politician's party at each election next to their party at their previous
+    election, in one windowed query (LAG over each politician's records ordered by year).
+    """
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot_transitions(snapshot)
+
+    window = {"partition_by": [F("politician_id")], "order_by": [F("year").asc(), F("id").asc()]}
+    rows = (
+        PoliticianRecord.objects
+        .annotate(previous_party=Window(Lag("party"), **window), previous_year=Window(Lag("year"), **window))
+        # Several records in one year are several offices, not a switch
+        .filter(previous_year__lt=F("year"))
+        .values_list("province__name", "province__region__name", "year", "previous_year", "party", "previous_party")
+    )
+    return finish_transitions(pd.DataFrame(list(rows), columns=TRANSITION_COLUMNS, dtype=object))
+
+def snapshot_transitions(snapshot):
+    """Same transitions as load_transitions(), from one sorted pass over the snapshot columns"""
+    frame = snapshot.records_frame().sort_values(["politician_id", "year", "record_id"], kind="stable")
+    previous = frame.groupby("politician_id")[["year", "party"]].shift()
+    keep = previous["year"].notna() & (previous["year"] < frame["year"])
+    transitions = pd.DataFrame({
+        "Province": frame["province"], "Region": frame["region"], "Year": frame["year"],
+        "Previous Year": previous["year"], "Party": frame["party"], "Previous Party": previous["party"],
+    })[keep]
+    return finish_transitions(transitions.reset_index(drop=True))
+
+def finish_transitions(transitions):
+    transitions["Year"] = transitions["Year"].astype(int)
+    transitions["Previous Year"] = transitions["Previous Year"].astype(int)
+    transitions["Party"] = normalize_party(transitions["Party"].astype(object))
+    transitions["Previous Party"] = normalize_party(transitions["Previous Party"].astype(object))
+    transitions["Switched"] = transitions["Party"] != transitions["Previous Party"]
+    return transitions
+
+def summarize_flows(transitions, top=12):
+    """Transition matrix, Sankey links and switch rate of a set of transitions"""
+    if transitions.empty:
+        return None
+    # Keep the chart readable: minor parties are grouped together
+    parties = pd.concat([transitions["Previous Party"], transitions["Party"]]).value_counts()
+    major = set(parties.index[:top])
+    source = transitions["Previous Party"].where(transitions["Previous Party"].isin(major), "OTHERS")
+    target = transitions["Party"].where(transitions["Party"].isin(major), "OTHERS")
+
+    matrix = pd.crosstab(source, target)
+    links = pd.DataFrame({"source": source, "target": target}).value_counts().reset_index(name="count")
+    return {
+        "transitions": int(len(transitions)),
+        "switches": int(transitions["Switched"].sum()),
+        "switch_rate": float(transitions["Switched"].mean()),
+        "matrix": {
+            "parties_from": list(matrix.index),
+            "parties_to": list(matrix.columns),
+            "counts": matrix.to_numpy().tolist(),
+        },
+        "links": links.to_dict("records"),
+    }
+
+def compute_flows(transitions):
+    """Flows of every province, region and the nation; also per election year for each scope"""
+    flows = {"national": {}, "regions": {}, "provinces": {}}
+    scopes = [("national", None), ("regions", "Region"), ("provinces", "Province")]
+    for name, column in scopes:
+        groups = [(None, transitions)] if column is None else transitions.groupby(column)
+        for key, group in groups:
+            by_year = {"all": summarize_flows(group)}
+            for year, year_group in group.groupby("Year"):
+                by_year[int(year)] = summarize_flows(year_group)
+            if column is None:
+                flows[name] = by_year
+            else:
+                flows[name][key] = by_year
+    return flows
+
+def get_flows():
+    """Cached compute_flows() of all transitions, one entry per data version"""
+    key = f"province:party_flows:{data_version()}"
+    flows = cache.get(key)
+    if flows is None:
+        flows = compute_flows(load_transitions())
+        cache.set(key, flows, FLOW_CACHE_TIMEOUT)
+    return flows
@@ -0,0 +1,144 @@
+from django.conf import settings
+import gzip
+import json
+import numpy as np
+import os
+
+GEODATA_DIR = getattr(settings, "GEODATA_DIR", os.path.join(settings.BASE_DIR, "province", "geodata"))
+# Zoom level: (simplification tolerance in degrees, coordinate decimals)
+ZOOM_LEVELS = {
+    "low": (0.02, 3),
+    "medium": (0.005, 4),
+    "high": (0.001, 5),
+}
+# Feature properties that commonly hold the province name in public boundary files
+NAME_PROPERTIES = ["province", "PROVINCE", "ADM2_EN", "adm2_en", "NAME_1", "name", "NAME"]
+
+def geometry_path(level, directory=None):
+    return os.path.join(directory or GEODATA_DIR, f"provinces.{level}.geojson.gz")
+
+def simplify_line(points, tolerance):
+    """Douglas-Peucker simplification of a polyline (n x 2 array); the end points are kept"""
+    if len(points) < 3:
+        return points
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[end] - points[start]
+        offsets = points[start + 1:end] - points[start]
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            middle = start + 1 + farthest
+            keep[middle] = True
+            stack += [(start, middle), (middle, end)]
+    return points[keep]
+
+def simplify_ring(ring, tolerance, decimals):
+    """A closed ring simplified and rounded, or None when it collapses below a triangle"""
+    points = np.asarray(ring, dtype=float)[:, :2]
+    # Split the closed ring at its farthest point so both halves keep a fixed end point
+    far = int(np.argmax(np.hypot(*(points - points[0]).T)))
+    if far == 0:
+        return None
+    simplified = np.vstack([simplify_line(points[:far + 1], tolerance)[:-1], simplify_line(points[far:], tolerance)])
+    simplified = np.round(simplified, decimals)
+    # Rounding can make neighbouring points equal
+    simplified = simplified[np.r_[True, np.any(np.diff(simplified, axis=0) != 0, axis=1)]]
+    if len(simplified) < 4:
+        return None
+    return simplified.tolist()
+
+def polygons_of(geometry):
+    return geometry["coordinates"] if geometry["type"] == "MultiPolygon" else [geometry["coordinates"]]
+
+def simplify_geometry(geometry, tolerance, decimals):
+    """Simplified Polygon or MultiPolygon; islands that collapse are dropped, but never every polygon"""
+    polygons = polygons_of(geometry)
+    simplified = []
+    for polygon in polygons:
+        exterior = simplify_ring(polygon[0], tolerance, decimals)
+        if exterior is None:
+            continue
+        holes = [ring for ring in (simplify_ring(hole, tolerance, decimals) for hole in polygon[1:]) if ring]
+        simplified.append([exterior] + holes)
+    if not simplified:
+        # A province smaller than the tolerance still needs a shape on the map
+        largest = max(polygons, key=lambda polygon: len(polygon[0]))
+        simplified = [[np.round(np.asarray(largest[0], dtype=float)[:, :2], decimals).tolist()]]
+    if len(simplified) == 1:
+        return {"type": "Polygon", "coordinates": simplified[0]}
+    return {"type": "MultiPolygon", "coordinates": simplified}
+
+def feature_name(feature, name_property=None):
+    properties = feature.get("properties") or {}
+    for key in [name_property] if name_property else NAME_PROPERTIES:
+        if properties.get(key):
+            return " ".join(str(properties[key]).upper().split())
+    return None
+
+def build_geometries(source, provinces, name_property=None, directory=None):
+    """
+    Simplify the province boundaries of a GeoJSON file once per zoom level and write each
+    level as gzipped GeoJSON, ready to be served as is. Features are matched to provinces
+    by name; features with the same name (e.g. islands stored separately) are merged
+    into one MultiPolygon. Returns (the province names without a boundary, the unmatched feature names).
+    """
+    with open(source, encoding="utf-8") as f:
+        collection = json.load(f)
+    known = set(provinces)
+    matched = {}
+    unmatched = []
+    for feature in collection["features"]:
+        name = feature_name(feature, name_property)
+        geometry = feature.get("geometry")
+        if name in known and geometry and geometry["type"] in ("Polygon", "MultiPolygon"):
+            matched.setdefault(name, []).extend(polygons_of(geometry))
+        else:
+            unmatched.append(name)
+
+    directory = directory or GEODATA_DIR
+    os.makedirs(directory, exist_ok=True)
+    for level, (tolerance, decimals) in ZOOM_LEVELS.items():
+        features = [
+            {"type": "Feature", "id": name, "properties": {"province": name}, "geometry": simplify_geometry({"type": "MultiPolygon", "coordinates": polygons}, tolerance, decimals)}
+            for name, polygons in sorted(matched.items())
+        ]
+        payload = json.dumps({"type": "FeatureCollection", "features": features}, separators=(",", ":")).encode("utf-8")
+        with open(geometry_path(level, directory), "wb") as f:
+            f.write(gzip.compress(payload, compresslevel=9, mtime=0))
+    return sorted(known - set(matched)), sorted(name for name in unmatched if name)
+
+_payloads = {}
+
+def get_geometry_payload(level):
+    """(gzipped GeoJSON bytes, modification time) of a zoom level, read once per process; None when not built"""
+    path = geometry_path(level)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _payloads.get(level)
+    if cached is None or cached[1] != mtime:
+        with open(path, "rb") as f:
+            cached = (f.read(), mtime)
+        _payloads[level] = cached
+    return cached
+
+def geometries_mtime():
+    """Latest modification time of the built zoom levels; None until every level is built"""
+    try:
+        return max(os.path.getmtime(geometry_path(level)) for level in ZOOM_LEVELS)
+    except OSError:
+        return None
+
+def geometries_available():
+    return geometries_mtime() is not None
@@ -0,0 +1,121 @@
+from django.conf import settings
+from django.core.cache import cache
+import pandas as pd
+from politicians.changes import year_version
+from politicians.models import PoliticianRecord
+from politicians.snapshot import get_snapshot
+
+ROLLUP_CACHE_TIMEOUT = getattr(settings, "ROLLUP_CACHE_TIMEOUT", 60 * 60)
+
+def load_year_frame(year):
+    """Fetch every record of a year as one flat DataFrame (single query, no model instances)"""
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        frame = snapshot.records_frame(year=year)
+        df = pd.DataFrame({
+            "Province": frame["province"], "Region": frame["region"], "Community": frame["community"],
+            "Position": frame["position"], "Middle Name": frame["middle_name"], "Last Name": frame["last_name"],
+        })
+        df["Position Weight"] = df["Position"].map(PoliticianRecord.position_weight_dict).fillna(0)
+        return df
+
+    # Position weights are computed by the database
+    rows = (
+        PoliticianRecord.objects
+        .filter(year=year)
+        .with_position_weight()
+        .values_list(
+            "province__name", "province__region__name", "community",
+            "position", "politician__middle_name", "politician__last_name", "weight",
+        )
+    )
+    return pd.DataFrame.from_records(
+        list(rows),
+        columns=["Province", "Region", "Community", "Position", "Middle Name", "Last Name", "Position Weight"],
+    )
+
+def community_frame(df):
+    """
+    Summarize every (province, community) pair in one vectorized pass:
+    size, dominant family name, its proportion and the average position weight.
+    """
+    keys = ["Region", "Province", "Community"]
+    communities = (
+        df.groupby(keys)
+        .agg(Size=("Position", "size"), **{"Average Position Weight": ("Position Weight", "mean")})
+        .reset_index()
+    )
+
+    # Same family name rules as family_names(): the middle name and the last name
+    # are both mentions, unless they are equal in which case it counts once.
+    middle = df[keys + ["Middle Name"]].rename(columns={"Middle Name": "Family"})
+    last = df[keys + ["Last Name"]].rename(columns={"Last Name": "Family"})
+    middle = middle[middle["Family"].fillna("").ne("") & df["Middle Name"].ne(df["Last Name"])]
+    last = last[last["Family"].fillna("").ne("")]
+    mentions = pd.concat([middle, last], ignore_index=True)
+
+    if mentions.empty:
+        communities["Family"] = None
+        communities["Proportion"] = 0.0
+        return communities
+
+    counts = mentions.groupby(keys + ["Family"]).size().rename("Count").reset_index()
+    dominant = (
+        counts.sort_values(keys + ["Count", "Family"], ascending=[True] * len(keys) + [False, True])
+        .drop_duplicates(keys)
+    )
+    communities = communities.merge(dominant, on=keys, how="left")
+    communities["Count"] = communities["Count"].fillna(0)
+    communities["Proportion"] = communities["Count"] / communities["Size"]
+    return communities.drop(columns="Count")
+
+def summarize(communities, by):
+    """Aggregate community rows into one row per `by` group (or a single national row)"""
+    dynasties = communities[communities["Size"] > 1]
+    group = by if by else (lambda _: "PHILIPPINES")
+    totals = communities.groupby(group).agg(
+        records=("Size", "sum"),
+        communities=("Size", "size"),
+    )
+    dynasty_stats = dynasties.groupby(group).agg(
+        dynasties=("Size", "size"),
+        largest_dynasty=("Size", "max"),
+        average_dynasty_size=("Size", "mean"),
+        average_concentration=("Proportion", "mean"),
+        officials_in_dynasties=("Size", "sum"),
+    )
+    # Position weight is averaged over officials, not over communities
+    weight_sums = (dynasties["Size"] * dynasties["Average Position Weight"]).groupby(
+        dynasties[by] if by else group
+    ).sum().rename("average_position_weight")
+
+    summary = totals.join(dynasty_stats, how="left").join(weight_sums, how="left").fillna(0)
+    officials = summary["officials_in_dynasties"]
+    summary["average_position_weight"] = (summary["average_position_weight"] / officials.where(officials > 0)).fillna(0)
+    summary["dynasty_share"] = officials / summary["records"]
+    summary.index.name = by.lower() if by else "scope"
+    return summary.reset_index()
+
+def compute_rollups(year):
+    """Province, region and national dynasty metrics for one year"""
+    df = load_year_frame(year)
+    if df.empty:
+        return None
+    communities = community_frame(df)
+    provinces = summarize(communities, "Province")
+    regions_of = df.drop_duplicates("Province").set_index("Province")["Region"]
+    provinces.insert(1, "region", provinces["province"].map(regions_of))
+    return {
+        "provinces": provinces.to_dict("records"),
+        "regions": summarize(communities, "Region").to_dict("records"),
+        "national": summarize(communities, None).to_dict("records")[0],
+    }
+
+def get_rollups(year):
+    """Cached wrapper around compute_rollups(), one entry per year and data version of that year"""
+    key = f"province:rollups:{year}:{year_version(year)}"
+    rollups = cache.get(key)
+    if rollups is None:
+        rollups = compute_rollups(year)
+        cache.set(key, rollups, ROLLUP_CACHE_TIMEOUT)
+    return rollups
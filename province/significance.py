@@ -0,0 +1,160 @@
+from django.conf import settings
+import numpy as np
+import pandas as pd
+from politicians.changes import data_version, partition_versions
+from politicians.models import PoliticianRecord, SignificanceRun
+from politicians.reference import get_reference
+from politicians.snapshot import get_snapshot
+from politicians.workers import process_pool
+
+SIGNIFICANCE_PERMUTATIONS = getattr(settings, "SIGNIFICANCE_PERMUTATIONS", 2000)
+# Shuffles evaluated together; bounds the memory of one vectorized pass
+PERMUTATION_BATCH_SIZE = 250
+
+def load_partition_frame(province, year):
+    """Community, middle and last name of every record of a province-year (one query)"""
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        frame = snapshot.records_frame(province, year)
+        return pd.DataFrame({
+            "Community": frame["community"], "Middle Name": frame["middle_name"], "Last Name": frame["last_name"],
+        })
+    rows = (
+        PoliticianRecord.objects
+        .filter(province__name=province, year=year)
+        .order_by("id")
+        .values_list("community", "politician__middle_name", "politician__last_name")
+    )
+    return pd.DataFrame(list(rows), columns=["Community", "Middle Name", "Last Name"], dtype=object)
+
+def encode_mentions(frame):
+    """
+    Integer codes for the permutation test: the community of every record, and the
+    (record, family name) of every family name mention. Same family name rules as
+    family_names(): middle and last name both count, once when they are equal.
+    """
+    communities, community_index = np.unique(frame["Community"].to_numpy(dtype=np.int64), return_inverse=True)
+    middle = frame["Middle Name"].fillna("")
+    last = frame["Last Name"].fillna("")
+    records = np.arange(len(frame))
+    middle_mentions = (middle != "") & (middle != last)
+    last_mentions = last != ""
+    mention_records = np.concatenate([records[middle_mentions.to_numpy()], records[last_mentions.to_numpy()]])
+    family_codes, families = pd.factorize(pd.concat([middle[middle_mentions], last[last_mentions]], ignore_index=True))
+    return communities, community_index, mention_records, family_codes.astype(np.int64), list(families)
+
+def max_family_counts(labels, mention_records, family_codes, n_communities, n_families):
+    """
+    Count of the most frequent family name of every community, for a batch of
+    community labelings (batch x records). One sort over all mentions of the batch.
+    """
+    batch = labels.shape[0]
+    mention_communities = labels[:, mention_records]
+    keys = (np.arange(batch)[:, None] * n_communities + mention_communities) * n_families + family_codes[None, :]
+    cells, counts = np.unique(keys.ravel(), return_counts=True)
+    best = np.zeros(batch * n_communities, dtype=np.int64)
+    np.maximum.at(best, cells // n_families, counts)
+    return best.reshape(batch, n_communities)
+
+def permutation_test(frame, permutations=SIGNIFICANCE_PERMUTATIONS, seed=0):
+    """
+    Dominant family name and its concentration for every multi-member community, with a
+    permutation p-value: how often shuffling the names across the province-year's records
+    (community sizes kept) concentrates a family name at least as much by chance.
+    """
+    if frame.empty:
+        return []
+    communities, community_index, mention_records, family_codes, families = encode_mentions(frame)
+    n_communities, n_families = len(communities), max(len(families), 1)
+    sizes = np.bincount(community_index, minlength=n_communities)
+
+    observed = max_family_counts(community_index[None, :], mention_records, family_codes, n_communities, n_families)[0]
+    # Moving a community label between records is the same as moving the names between communities
+    rng = np.random.default_rng(seed)
+    exceed = np.zeros(n_communities, dtype=np.int64)
+    for start in range(0, permutations, PERMUTATION_BATCH_SIZE):
+        batch = min(PERMUTATION_BATCH_SIZE, permutations - start)
+        labels = rng.permuted(np.broadcast_to(community_index, (batch, len(community_index))), axis=1)
+        exceed += (max_family_counts(labels, mention_records, family_codes, n_communities, n_families) >= observed).sum(axis=0)
+    p_values = (exceed + 1) / (permutations + 1)
+
+    # Dominant family of each community in the observed data
+    mention_communities = community_index[mention_records]
+    counts = pd.DataFrame({"community": mention_communities, "family": family_codes}).value_counts().reset_index(name="count")
+    counts = counts.sort_values(["community", "count", "family"], ascending=[True, False, True]).drop_duplicates("community")
+    dominant = dict(zip(counts["community"], counts["family"]))
+
+    return [
+        {
+            "community": int(communities[i]),
+            "size": int(sizes[i]),
+            "family": families[dominant[i]],
+            "proportion": float(observed[i] / sizes[i]),
+            "p_value": float(p_values[i]),
+        }
+        for i in range(n_communities) if sizes[i] > 1 and i in dominant
+    ]
+
+def significance_fingerprint(version, permutations):
+    return f"{version}:{permutations}"
+
+def store_significance(province_id, year, fingerprint, results):
+    SignificanceRun.objects.update_or_create(
+        province_id=province_id, year=year, defaults={"fingerprint": fingerprint, "results": results},
+    )
+
+def get_significance(province, year):
+    """
+    Stored permutation_test() results of a province-year and their number of permutations,
+    or None until compute_significance (or compute_all_significance()) has run on its
+    current data. Only reads: the web views never run the test themselves.
+    """
+    province_id = get_reference().province_id(province)
+    if province_id is None:
+        return None
+    stored = SignificanceRun.objects.filter(province_id=province_id, year=year).values_list("fingerprint", "results").first()
+    if stored is None:
+        return None
+    version, permutations = stored[0].split(":")
+    if int(version) != data_version(province_id, year):
+        return None
+    return stored[1], int(permutations)
+
+def compute_significance(province, year, permutations=SIGNIFICANCE_PERMUTATIONS):
+    """Run the permutation test of one province-year in this process and store it"""
+    province_id = get_reference().province_id(province)
+    results = permutation_test(load_partition_frame(province, year), permutations)
+    store_significance(province_id, year, significance_fingerprint(data_version(province_id, year), permutations), results)
+    return results
+
+def _test_partition(province, year, permutations):
+    # Runs in a worker process: each worker opens its own database connection.
+    return province, year, permutation_test(load_partition_frame(province, year), permutations)
+
+def compute_all_significance(workers=None, permutations=SIGNIFICANCE_PERMUTATIONS, log=None):
+    """
+    Run the permutation test of every province-year whose stored results are out of date
+    in a process pool, and store the results for the web processes.
+    """
+    reference = get_reference()
+    stored = {
+        (province_id, year): fingerprint
+        for province_id, year, fingerprint in SignificanceRun.objects.values_list("province_id", "year", "fingerprint")
+    }
+    todo = []
+    for (province_id, year), version in sorted(partition_versions().items()):
+        fingerprint = significance_fingerprint(version, permutations)
+        if province_id in reference.provinces and stored.get((province_id, year)) != fingerprint:
+            todo.append((province_id, year, fingerprint))
+
+    with process_pool(workers) as executor:
+        futures = [
+            executor.submit(_test_partition, reference.provinces[province_id].name, year, permutations)
+            for province_id, year, _ in todo
+        ]
+        for (province_id, year, fingerprint), future in zip(todo, futures):
+            province, _, results = future.result()
+            store_significance(province_id, year, fingerprint, results)
+            if log:
+                log(f"Tested {len(results)} communities of {province} ({year})")
+    return len(todo)
@@ -1,3 +1,230 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import tempfile
+from unittest import mock
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+from politicians.changes import record_change, year_version
+from politicians.models import Politician, PoliticianRecord, Province, Region, SignificanceRun
+from . import geometry
+from .flows import compute_flows, load_transitions
+from .geometry import build_geometries, geometry_path, simplify_geometry, simplify_ring
+from .rollups import get_rollups
+from .significance import compute_significance, get_significance, max_family_counts, permutation_test
+from .views import community_stats
+
+SAMPLE_GEOJSON = os.path.join(os.path.dirname(__file__), "testdata", "provinces.geojson")
+
+def square(x, y, size, points_per_side=1):
+    """Closed square ring, with extra collinear points along every side"""
+    corners = [(x, y), (x + size, y), (x + size, y + size), (x, y + size), (x, y)]
+    ring = []
+    for (x0, y0), (x1, y1) in zip(corners, corners[1:]):
+        ring += [[x0 + (x1 - x0) * i / points_per_side, y0 + (y1 - y0) * i / points_per_side] for i in range(points_per_side)]
+    return ring + [ring[0]]
 
 # Create your tests here.
+
+class PermutationStatisticTests(SimpleTestCase):
+    def test_max_family_counts_of_a_batch(self):
+        # Records 0-3; record 1 has two family names. Families: 0 = A, 1 = B
+        mention_records = np.array([0, 1, 2, 3, 1])
+        family_codes = np.array([0, 0, 0, 1, 1])
+        labels = np.array([
+            [0, 0, 1, 1],  # community 0: A A B -> 2, community 1: A B -> 1
+            [1, 0, 0, 1],  # community 0: A B A -> 2, community 1: A B -> 1
+            [0, 1, 0, 1],  # community 0: A A -> 2, community 1: A B B -> 2
+        ])
+        counts = max_family_counts(labels, mention_records, family_codes, n_communities=2, n_families=2)
+        np.testing.assert_array_equal(counts, [[2, 1], [2, 1], [2, 2]])
+
+    def test_one_community_is_never_exceeded_by_chance(self):
+        frame = pd.DataFrame({"Community": [1, 1, 1], "Middle Name": [None, "CRUZ", "REYES"], "Last Name": ["REYES", "REYES", "REYES"]})
+        [row] = permutation_test(frame, permutations=50)
+        self.assertEqual((row["family"], row["size"], row["proportion"]), ("REYES", 3, 1.0))
+        self.assertEqual(row["p_value"], 1.0)
+
+class StoredSignificanceTests(TestCase):
+    def test_results_are_stored_until_the_partition_changes(self):
+        region = Region.objects.create(name="REGION I")
+        province = Province.objects.create(name="ILOCOS NORTE", region=region)
+        for first in ["JUAN", "PEDRO"]:
+            politician = Politician.objects.create(first_name=first, last_name="MARCOS")
+            PoliticianRecord.objects.create(politician=politician, province=province, region=region, year=2022, position="MAYOR", community=1)
+        self.assertIsNone(get_significance("ILOCOS NORTE", 2022))
+
+        results = compute_significance("ILOCOS NORTE", 2022, permutations=20)
+        self.assertEqual(SignificanceRun.objects.get().results, results)
+        # Reading only: the stored results and the partition version
+        with self.assertNumQueries(2):
+            self.assertEqual(get_significance("ILOCOS NORTE", 2022), (results, 20))
+
+        record_change("PoliticianRecord", None, "UPDATE", {(province.id, 2022)})
+        self.assertIsNone(get_significance("ILOCOS NORTE", 2022))
+
+class SignificancePageTests(TransactionTestCase):
+    databases = {"default", "readonly"}
+
+    def test_the_page_only_reads_stored_results(self):
+        region = Region.objects.create(name="REGION I")
+        province = Province.objects.create(name="ILOCOS NORTE", region=region)
+        for first in ["JUAN", "PEDRO"]:
+            politician = Politician.objects.create(first_name=first, last_name="MARCOS")
+            PoliticianRecord.objects.create(politician=politician, province=province, region=region, year=2022, position="MAYOR", community=1)
+        url = reverse("province_analysis")
+        params = {"province": "ILOCOS NORTE", "year": 2022}
+        response = self.client.get(url, params)
+        self.assertContains(response, "Not computed yet")
+        self.assertFalse(SignificanceRun.objects.exists())
+
+        compute_significance("ILOCOS NORTE", 2022, permutations=20)
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Share of 20 random reshuffles")
+
+class GeometrySimplificationTests(SimpleTestCase):
+    def test_collinear_points_are_removed(self):
+        ring = simplify_ring(square(120, 15, 1, points_per_side=10), tolerance=0.01, decimals=3)
+        self.assertEqual(len(ring), 5)
+        self.assertEqual(ring[0], ring[-1])
+        self.assertEqual(sorted(map(tuple, ring[:-1])), [(120, 15), (120, 16), (121, 15), (121, 16)])
+
+    def test_a_ring_below_the_tolerance_collapses(self):
+        self.assertIsNone(simplify_ring(square(120, 15, 0.0001), tolerance=0.01, decimals=3))
+
+    def test_collapsed_islands_are_dropped(self):
+        geometry = {"type": "MultiPolygon", "coordinates": [[square(120, 15, 1, 5)], [square(122, 15, 0.0001)]]}
+        simplified = simplify_geometry(geometry, tolerance=0.01, decimals=3)
+        self.assertEqual(simplified["type"], "Polygon")
+        self.assertEqual(len(simplified["coordinates"][0]), 5)
+
+    def test_a_province_smaller_than_the_tolerance_keeps_a_shape(self):
+        geometry = {"type": "Polygon", "coordinates": [square(120, 15, 0.0001)]}
+        simplified = simplify_geometry(geometry, tolerance=0.01, decimals=5)
+        self.assertEqual(simplified["type"], "Polygon")
+        self.assertEqual(len(simplified["coordinates"][0]), 5)
+
+class GeometryBuildTests(TransactionTestCase):
+    # The map is read through the read-only connection, which only sees committed rows
+    databases = {"default", "readonly"}
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        patcher = mock.patch.object(geometry, "GEODATA_DIR", self.directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def load(self, level):
+        with open(geometry_path(level), "rb") as f:
+            return {feature["id"]: feature["geometry"] for feature in json.loads(gzip.decompress(f.read()))["features"]}
+
+    def test_build_writes_every_zoom_level(self):
+        missing, unmatched = build_geometries(SAMPLE_GEOJSON, ["ABRA", "BATANES", "ILOCOS NORTE"])
+        self.assertEqual((missing, unmatched), (["ABRA"], ["ATLANTIS"]))
+        low, high = self.load("low"), self.load("high")
+        self.assertEqual(sorted(low), ["BATANES", "ILOCOS NORTE"])
+        # The two Batanes features are merged: three islands
+        self.assertEqual(high["BATANES"]["type"], "MultiPolygon")
+        self.assertEqual(len(high["BATANES"]["coordinates"]), 3)
+        # Coarser levels have fewer points
+        self.assertLess(len(low["ILOCOS NORTE"]["coordinates"][0]), len(high["ILOCOS NORTE"]["coordinates"][0]))
+
+    def test_building_the_geometries_changes_the_map_etag(self):
+        region = Region.objects.create(name="REGION II")
+        province = Province.objects.create(name="BATANES", region=region)
+        politician = Politician.objects.create(first_name="JUAN", last_name="ABAD")
+        PoliticianRecord.objects.create(politician=politician, province=province, region=region, year=2022, position="GOVERNOR", community=1)
+        url = reverse("province_map")
+        before = self.client.get(url)
+        self.assertContains(before, "build_province_geometries")
+        build_geometries(SAMPLE_GEOJSON, ["BATANES", "ILOCOS NORTE"])
+        after = self.client.get(url, HTTP_IF_NONE_MATCH=before["ETag"])
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after["ETag"], before["ETag"])
+        self.assertEqual(self.client.get(reverse("province_geometry", args=["low"])).status_code, 200)
+
+class RollupVersionTests(TestCase):
+    def test_rollups_follow_province_changes_and_versions_never_repeat(self):
+        luzon, visayas = Region.objects.create(name="REGION I"), Region.objects.create(name="REGION VI")
+        province = Province.objects.create(name="ILOCOS NORTE", region=luzon)
+        for first in ["JUAN", "PEDRO"]:
+            politician = Politician.objects.create(first_name=first, last_name="MARCOS")
+            PoliticianRecord.objects.create(politician=politician, province=province, region=luzon, year=2022, position="MAYOR", community=1)
+        versions = [year_version(2022)]
+        self.assertEqual(get_rollups(2022)["provinces"][0]["region"], "REGION I")
+
+        # A region reassignment only logs a global change
+        province.region = visayas
+        province.save()
+        versions.append(year_version(2022))
+        self.assertEqual(get_rollups(2022)["provinces"][0]["region"], "REGION VI")
+
+        # Deleting the province deletes its partition versions, but not the year's
+        PoliticianRecord.objects.all().delete()
+        versions.append(year_version(2022))
+        province.delete()
+        versions.append(year_version(2022))
+        self.assertEqual(len(set(versions)), len(versions))
+        self.assertIsNone(get_rollups(2022))
+
+class CommunityStatsTests(TestCase):
+    def test_one_row_per_community_from_the_sql_aggregate(self):
+        region = Region.objects.create(name="REGION I")
+        province = Province.objects.create(name="ILOCOS NORTE", region=region)
+        for first, position, community in [
+            ("JUAN", "MAYOR", 1), ("PEDRO", "GOVERNOR", 1), ("MARIA", "COUNCILOR", 1), ("ANA", "VICE MAYOR", 2),
+        ]:
+            politician = Politician.objects.create(first_name=first, last_name="MARCOS")
+            PoliticianRecord.objects.create(politician=politician, province=province, region=region, year=2022, position=position, community=community)
+        with self.assertNumQueries(1):
+            rows = list(PoliticianRecord.objects.filter(province=province, year=2022).community_stats())
+        self.assertEqual(
+            [(row["community"], row["size"], row["weighted_size"], row["avg_weight"]) for row in rows],
+            [(1, 3, 12, 4.0), (2, 1, 3, 3.0)],
+        )
+        self.assertEqual(community_stats("ILOCOS NORTE", 2022, None)[1]["avg_weight"], 4.0)
+
+class PartyFlowTests(TransactionTestCase):
+    # The flows page reads through the read-only connection, which only sees committed rows
+    databases = {"default", "readonly"}
+
+    def setUp(self):
+        cache.clear()
+        region = Region.objects.create(name="REGION I")
+        province = Province.objects.create(name="ILOCOS NORTE", region=region)
+        for first, terms in [
+            ("JUAN", [(2016, "LP"), (2019, "np "), (2019, "NP")]),
+            ("PEDRO", [(2016, "LP"), (2019, "LP")]),
+            ("MARIA", [(2019, None), (2022, "LP")]),
+        ]:
+            politician = Politician.objects.create(first_name=first, last_name="MARCOS")
+            for year, party in terms:
+                PoliticianRecord.objects.create(politician=politician, province=province, region=region, year=year, position="MAYOR", party=party, community=1)
+
+    def test_transitions_between_consecutive_elections(self):
+        transitions = load_transitions()
+        # A second office in the same year is not a transition
+        self.assertEqual(
+            sorted(transitions[["Previous Year", "Year", "Previous Party", "Party", "Switched"]].itertuples(index=False, name=None)),
+            [(2016, 2019, "LP", "LP", False), (2016, 2019, "LP", "NP", True), (2019, 2022, "(NO PARTY)", "LP", True)],
+        )
+        flows = compute_flows(transitions)
+        national = flows["national"]["all"]
+        self.assertEqual((national["transitions"], national["switches"]), (3, 2))
+        self.assertEqual((flows["national"][2019]["switches"], flows["national"][2022]["switch_rate"]), (1, 1.0))
+        self.assertEqual(flows["provinces"]["ILOCOS NORTE"]["all"], national)
+        self.assertEqual(flows["regions"]["REGION I"]["all"]["matrix"]["parties_from"], ["(NO PARTY)", "LP"])
+
+    def test_flows_page(self):
+        response = self.client.get(reverse("party_flows"), {"scope": "province", "area": "ILOCOS NORTE", "election": "2019"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["summary"]["transitions"], 2)
+        self.assertIsNotNone(response.context["flow_chart"])
+        response = self.client.get(reverse("party_flows"), {"election": "2010"})
+        self.assertContains(response, "No party transitions found")
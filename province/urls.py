@@ -3,4 +3,9 @@ from . import views
 
 urlpatterns = [
     path('', views.province_analysis, name='province_analysis'),
+    path('region/', views.region_analysis, name='region_analysis'),
+    path('national/', views.national_analysis, name='national_analysis'),
+    path('flows/', views.party_flows, name='party_flows'),
+    path('map/', views.province_map, name='province_map'),
+    path('map/geometry/<str:level>/', views.province_geometry, name='province_geometry'),
 ]
\ No newline at end of file
@@ -1,30 +1,35 @@
 from django.shortcuts import render
 from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+from datetime import datetime, timezone
+import gzip
 import pandas as pd
 import json
 import plotly.graph_objects as go
 from plotly.utils import PlotlyJSONEncoder
-from politicians.models import Politician, PoliticianRecord, Province
+from politicians.conditional import conditional_on_analysis, conditional_on_data, data_etag, last_change
+from politicians.metrics import most_connected
+from politicians.models import Politician, PoliticianRecord
+from politicians.reference import get_reference
+from politicians.routers import read_only_view
+from politicians.snapshot import get_snapshot
+from .flows import get_flows
+from .geometry import ZOOM_LEVELS, geometries_available, geometries_mtime, get_geometry_payload
+from .rollups import get_rollups
+from .significance import SIGNIFICANCE_PERMUTATIONS, get_significance
 
 # Get the base context using the models we had
 def get_base_context(request):
-    """Get common context data for all views using the ORM"""
+    """Get common context data for all views from the cached reference data"""
 
-    # 1. Get all provinces from the DB
-    provinces = list(
-        Province.objects.order_by("name").values_list("name", flat=True)
-    )
-
-    # 2. Get distinct years from PoliticianRecord (sorted)
-    years = list(
-        PoliticianRecord.objects.order_by("year")
-        .values_list("year", flat=True)
-        .distinct()
-    )
-
-    # If DB has no years yet (fresh DB), fall back
-    if not years:
-        years = [2004, 2007, 2010, 2013, 2016, 2019, 2022]
+    # 1. Get all provinces and distinct years from the reference data cache
+    #    (falls back to the election years on a fresh DB)
+    reference = get_reference()
+    provinces = reference.province_names
+    years = reference.years
 
     # 3. Handle selected province + selected year
     selected_province = request.GET.get("province", provinces[0] if provinces else None)
@@ -37,6 +42,35 @@ def get_base_context(request):
         "selected_year": selected_year,
     }
 
+def load_records(province_name, year):
+    """Records of a province-year, read from the columnar snapshot when it is enabled"""
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot.records(province_name, year)
+    return list(
+        PoliticianRecord.objects
+        .select_related("politician", "province")
+        .filter(province__name=province_name, year=year)
+    )
+
+def community_stats(province_name, year, records):
+    """
+    Size and average position weight of every community of a province-year.
+    Aggregated by the database in one GROUP BY; computed from the snapshot records when it is enabled.
+    """
+    if get_snapshot() is None:
+        rows = PoliticianRecord.objects.filter(province__name=province_name, year=year).community_stats()
+        return {row["community"]: row for row in rows}
+
+    stats = {}
+    for rec in records:
+        row = stats.setdefault(rec.community, {"community": rec.community, "size": 0, "weighted_size": 0})
+        row["size"] += 1
+        row["weighted_size"] += rec.position_weight()
+    for row in stats.values():
+        row["avg_weight"] = row["weighted_size"] / row["size"]
+    return stats
+
 #Extract the name of politicians
 def family_names(politician: Politician):
     """Extract family names from a Politician model instance"""
@@ -58,20 +92,17 @@ def family_names(politician: Politician):
 
     return family_names
 
-def create_dynasty_size_chart(province_name, year):
+def create_dynasty_size_chart(province_name, year, records=None):
     """
-    Create dynasty size chart using Django ORM,
+    Create dynasty size chart from the records of a province-year,
     excluding communities with size 1 or no valid family names.
     """
 
     # 1. Filter records by province + year
-    records = (
-        PoliticianRecord.objects
-        .select_related("politician", "province")
-        .filter(province__name=province_name, year=year)
-    )
+    if records is None:
+        records = load_records(province_name, year)
 
-    if not records.exists():
+    if not records:
         return None, f"No political records found for {province_name} ({year})."
 
     # 2. Group into communities
@@ -168,19 +199,16 @@ def create_dynasty_size_chart(province_name, year):
 
     return json.dumps(fig, cls=PlotlyJSONEncoder), None
 
-def get_top_family_name(province_name, year):
+def get_top_family_name(province_name, year, records=None):
     """
     Return the top 1 most frequent family name in the largest dynasty,
     along with the list of politicians having that family name.
     """
     # 1. Fetch records
-    records = (
-        PoliticianRecord.objects
-        .select_related("politician", "province")
-        .filter(province__name=province_name, year=year)
-    )
+    if records is None:
+        records = load_records(province_name, year)
 
-    if not records.exists():
+    if not records:
         return None, f"No records found for {province_name} ({year})."
 
     # 2. Group by community
@@ -225,6 +253,8 @@ def get_top_family_name(province_name, year):
     }
     return dct, None
 
+@read_only_view
+@conditional_on_analysis
 def province_analysis(request):
     # 1. Get common context data
     context = get_base_context(request)
@@ -232,38 +262,35 @@ def province_analysis(request):
     province = context['selected_province']
     year = context['selected_year']
 
-    # 2. Create charts using ORM-based functions
-    dynasty_chart, dynasty_warning = create_dynasty_size_chart(province, year)
-    top_family_dict, top_family_warning = get_top_family_name(province, year)
+    # 2. Fetch all records for this province and year once, then create the charts
+    records = load_records(province, year)
+    dynasty_chart, dynasty_warning = create_dynasty_size_chart(province, year, records)
+    top_family_dict, top_family_warning = get_top_family_name(province, year, records)
 
     # 3. Create concentration scatter plot
     concentration_chart = None
     concentration_warning = None
 
-    # Fetch all records for this province and year
-    records = (
-        PoliticianRecord.objects
-        .select_related("politician", "province")
-        .filter(province__name=province, year=year)
-    )
+    # Permutation p-values of the concentrations, as stored by compute_significance
+    significance = get_significance(province, year) if records else None
+    significance_rows, significance_permutations = significance or ([], SIGNIFICANCE_PERMUTATIONS)
 
-    if records.exists():
-        # Group by community
-        communities = {}
+    if records:
+        # Filter dynasties with size > 1, using the per-community aggregates
+        stats = community_stats(province, year, records)
+        dynasties = {cid: [] for cid, row in stats.items() if row["size"] > 1}
         for rec in records:
-            cid = rec.community   # MUST EXIST: community field
-            communities.setdefault(cid, []).append(rec)
-
-        # Filter dynasties with size > 1
-        dynasties = {cid: members for cid, members in communities.items() if len(members) > 1}
+            if rec.community in dynasties:   # MUST EXIST: community field
+                dynasties[rec.community].append(rec)
 
         if dynasties:
             # Compute family name concentration and average position weight
             plot_data = []
+            p_values = {row["community"]: row["p_value"] for row in significance_rows}
 
             for cid, members in dynasties.items():
                 # 1. Community size
-                size = len(members)
+                size = stats[cid]["size"]
 
                 # 2. Count family name mentions
                 name_mentions = []
@@ -283,14 +310,15 @@ def province_analysis(request):
                 max_prop = counts[dominant_family] / size
 
                 # 4. Average position weight
-                avg_position_weight = sum(rec.position_weight() for rec in members) / size
+                avg_position_weight = float(stats[cid]["avg_weight"])
 
                 plot_data.append({
                     "Community": cid,
                     "Family": dominant_family,
                     "Size": size,
                     "Proportion": max_prop,
-                    "Average Position Weight": avg_position_weight
+                    "Average Position Weight": avg_position_weight,
+                    "P Value": p_values.get(cid)
                 })
 
             if plot_data:
@@ -307,11 +335,12 @@ def province_analysis(request):
                         showscale=True,
                         opacity=0.75
                     ),
-                    customdata=[[d['Community'], d['Family']] for d in plot_data],
+                    customdata=[[d['Community'], d['Family'], d['P Value']] for d in plot_data],
                     hovertemplate=(
                         'Community: %{customdata[0]}<br>'
                         'Dominant Family: %{customdata[1]}<br>'
                         'Concentration: %{x:.2%}<br>'
+                        'p-value: %{customdata[2]:.3f}<br>'
                         'Avg Position Weight: %{y:.2f}<br>'
                         'Size: %{marker.color}<extra></extra>'
                     )
@@ -339,7 +368,201 @@ def province_analysis(request):
         'top_family': top_family_dict,
         'top_family_warning': top_family_warning,
         'concentration_chart': concentration_chart,
-        'concentration_warning': concentration_warning
+        'concentration_warning': concentration_warning,
+        'most_connected': most_connected(province, year),
+        'significance': sorted(significance_rows, key=lambda row: (row["p_value"], -row["proportion"])),
+        'significance_permutations': significance_permutations,
+        'significance_pending': bool(records) and significance is None,
     })
 
-    return render(request, 'province/province_analysis.html', context)
\ No newline at end of file
+    return render(request, 'province/province_analysis.html', context)
+
+def create_rollup_chart(rows, label_key, title):
+    """Bar chart of the largest dynasty per area, colored by average concentration"""
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=[row[label_key] for row in rows],
+        y=[row["largest_dynasty"] for row in rows],
+        customdata=[[row["average_concentration"], row["dynasty_share"]] for row in rows],
+        hovertemplate=(
+            "%{x}<br>"
+            "Largest Dynasty: %{y}<br>"
+            "Average Concentration: %{customdata[0]:.2%}<br>"
+            "Officials in Dynasties: %{customdata[1]:.2%}"
+            "<extra></extra>"
+        ),
+        marker_color="#fa904d"
+    ))
+    fig.update_layout(
+        title=title,
+        yaxis_title="Largest Dynasty Size",
+        height=400
+    )
+    return json.dumps(fig, cls=PlotlyJSONEncoder)
+
+@read_only_view
+@conditional_on_data
+def region_analysis(request):
+    context = get_base_context(request)
+    regions = get_reference().region_names
+    region = request.GET.get("region", regions[0] if regions else None)
+    year = context['selected_year']
+
+    rollups = get_rollups(year)
+    rows = [row for row in rollups["provinces"] if row["region"] == region] if rollups else []
+    summary = next((row for row in rollups["regions"] if row["region"] == region), None) if rollups else None
+
+    context.update({
+        'scope': 'region',
+        'regions': regions,
+        'selected_region': region,
+        'summary': summary,
+        'rows': rows,
+        'row_label': 'Province',
+        'rollup_chart': create_rollup_chart(rows, "province", f"Largest Dynasties in {region} ({year})") if rows else None,
+        'rollup_warning': None if rows else f"No political records found for {region} ({year}).",
+    })
+    return render(request, 'province/rollup_analysis.html', context)
+
+@read_only_view
+@conditional_on_data
+def national_analysis(request):
+    context = get_base_context(request)
+    year = context['selected_year']
+
+    rollups = get_rollups(year)
+    rows = rollups["regions"] if rollups else []
+
+    context.update({
+        'scope': 'national',
+        'summary': rollups["national"] if rollups else None,
+        'rows': rows,
+        'row_label': 'Region',
+        'rollup_chart': create_rollup_chart(rows, "region", f"Largest Dynasties per Region ({year})") if rows else None,
+        'rollup_warning': None if rows else f"No political records found for {year}.",
+    })
+    return render(request, 'province/rollup_analysis.html', context)
+
+def create_sankey_chart(summary, title):
+    """Sankey diagram of party transitions, previous parties on the left"""
+    sources = summary["matrix"]["parties_from"]
+    targets = summary["matrix"]["parties_to"]
+    fig = go.Figure(go.Sankey(
+        node=dict(label=sources + targets, pad=15, color="#fa904d"),
+        link=dict(
+            source=[sources.index(link["source"]) for link in summary["links"]],
+            target=[len(sources) + targets.index(link["target"]) for link in summary["links"]],
+            value=[link["count"] for link in summary["links"]],
+        ),
+    ))
+    fig.update_layout(title=title, height=500)
+    return json.dumps(fig, cls=PlotlyJSONEncoder)
+
+@read_only_view
+@conditional_on_data
+def party_flows(request):
+    context = get_base_context(request)
+    reference = get_reference()
+    scope = request.GET.get("scope", "national")
+    if scope not in ("national", "region", "province"):
+        scope = "national"
+    # Not "year": get_base_context() expects a number there
+    year = request.GET.get("election", "all")
+    year = int(year) if year.isdigit() else "all"
+
+    flows = get_flows()
+    if scope == "region":
+        area = request.GET.get("area") or (reference.region_names[0] if reference.region_names else None)
+        by_year = flows["regions"].get(area, {})
+    elif scope == "province":
+        area = request.GET.get("area") or context["selected_province"]
+        by_year = flows["provinces"].get(area, {})
+    else:
+        area = "the Philippines"
+        by_year = flows["national"]
+    summary = by_year.get(year)
+
+    period = "all elections" if year == "all" else f"{year}"
+    matrix_rows = None
+    if summary:
+        matrix = summary["matrix"]
+        matrix_rows = [
+            {"party": party, "counts": counts}
+            for party, counts in zip(matrix["parties_from"], matrix["counts"])
+        ]
+    context.update({
+        'scope': scope,
+        'area': area,
+        'regions': reference.region_names,
+        'flow_year': year,
+        'summary': summary,
+        'matrix_rows': matrix_rows,
+        'flow_chart': create_sankey_chart(summary, f"Party Transitions in {area} ({period})") if summary else None,
+        'flow_warning': None if summary else f"No party transitions found for {area} ({period}).",
+    })
+    return render(request, 'province/party_flows.html', context)
+
+# Rollup columns that can color the map
+MAP_METRICS = {
+    "largest_dynasty": "Largest Dynasty Size",
+    "average_concentration": "Average Family Concentration",
+    "dynasty_share": "Share of Officials in Dynasties",
+    "dynasties": "Number of Dynasties",
+}
+
+# The map page changes when the data changes and when the boundaries are (re)built
+def map_etag(request):
+    return f"{data_etag(request)}-geometry-{geometries_mtime() or 0}"
+
+def map_last_modified(request):
+    changed = last_change(request)
+    mtime = geometries_mtime()
+    if mtime is None:
+        return changed
+    built = datetime.fromtimestamp(mtime, tz=timezone.utc)
+    return max(changed, built) if changed else built
+
+@read_only_view
+@condition(etag_func=map_etag, last_modified_func=map_last_modified)
+def province_map(request):
+    context = get_base_context(request)
+    year = context['selected_year']
+    metric = request.GET.get("metric")
+    if metric not in MAP_METRICS:
+        metric = "largest_dynasty"
+
+    # Every province of the year comes from the same cached rollup (one query per year)
+    rollups = get_rollups(year)
+    rows = sorted(rollups["provinces"], key=lambda row: row[metric], reverse=True) if rollups else []
+    values = [{"province": row["province"], "region": row["region"], "value": float(row[metric])} for row in rows]
+
+    context.update({
+        'metrics': MAP_METRICS,
+        'selected_metric': metric,
+        'metric_label': MAP_METRICS[metric],
+        'rows': rows,
+        'map_values': json.dumps(values),
+        'geometry_urls': json.dumps({level: reverse('province_geometry', args=[level]) for level in ZOOM_LEVELS}),
+        'geometries_available': geometries_available(),
+        'map_warning': None if rows else f"No political records found for {year}.",
+    })
+    return render(request, 'province/province_map.html', context)
+
+def geometry_etag(request, level):
+    payload = get_geometry_payload(level) if level in ZOOM_LEVELS else None
+    return f"geometry-{level}-{payload[1]}" if payload else None
+
+@condition(etag_func=geometry_etag)
+def province_geometry(request, level):
+    """Pre-simplified province boundaries of a zoom level, sent gzipped when the client accepts it"""
+    payload = get_geometry_payload(level) if level in ZOOM_LEVELS else None
+    if payload is None:
+        raise Http404("Province boundaries have not been built.")
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        response = HttpResponse(payload[0], content_type="application/geo+json")
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(gzip.decompress(payload[0]), content_type="application/geo+json")
+    patch_vary_headers(response, ["Accept-Encoding"])
+    patch_cache_control(response, public=True, max_age=60 * 60 * 24)
+    return response